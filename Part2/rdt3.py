@@ -1,8 +1,12 @@
 #!/usr/bin/python3
 """Implementation of RDT3.0
 
+class:     RDTSocket, one RDT connection with its own socket, peer and state
 functions: rdt_network_init(), rdt_socket(), rdt_bind(), rdt_peer()
            rdt_send(), rdt_recv(), rdt_close()
+           rdt_trace_start(), rdt_trace_dump() for a trace of recent events
+           which work on the module's default connection, default_conn
+logger:    "rdt3" (see logging), silent until the application sets up logging
 
 Student name: Wong Ka Ngai
 Student No. : 3035568881
@@ -12,393 +16,629 @@ Python version: 3.7.0
 """
 
 import socket
+import collections
 import random
 import sys
 import select
 import struct
+import time
+import logging
 
 #some constants
 PAYLOAD = 1000		#size of data payload of the RDT layer
 CPORT = 100			#Client port number - Change to your port number
 SPORT = 200			#Server port number - Change to your port number
-TIMEOUT = 0.05		#retransmission timeout duration
+TIMEOUT = 0.05		#initial retransmission timeout duration
 TWAIT = 10*TIMEOUT 	#TimeWait duration
-
-#store peer address info
-__peeraddr = ()		#set by rdt_peer()
-#define the error rates
-__LOSS_RATE = 0.0	#set by rdt_network_init()
-__ERR_RATE = 0.0
+RTO_MIN = 0.005		#default lower bound of the adaptive retransmission timeout, see network_init()
+RTO_MAX = 2.0		#default upper bound of the adaptive retransmission timeout
+TRACE_EVENTS = 4096	#default no. of recent events kept by the event trace
 
 message_format = struct.Struct('BBHH')
 HEADER = 6
-send_num = 0
-recv_num = 0
-buffer=[]
-
 
-#internal functions - being called within the module
-def __udt_send(sockd, peer_addr, byte_msg):
-	"""This function is for simulating packet loss or corruption in an unreliable channel.
-
-	Input arguments: Unix socket object, peer address 2-tuple and the message
-	Return  -> size of data sent, -1 on error
-	Note: it does not catch any exception
+#the messages of the RDT layer, per packet at DEBUG level; it has no output
+#of its own until the application sets up logging, e.g. logging.basicConfig()
+logger = logging.getLogger("rdt3")
+logger.addHandler(logging.NullHandler())
+
+#events of the event trace, see EventTrace; the value recorded with each,
+#the same numbers as in rdt4
+EV_DATA_SENT = 1	#payload length
+EV_TIMEOUT = 2		#retransmission timeout after the backoff, in microseconds
+EV_ACK_RECV = 4		#seqNo. of the packet waiting for its ACK
+EV_DATA_RECV = 5	#seqNo. expected when it came
+EV_CORRUPT = 6		#packet length (the seqNo. is the packet type)
+EV_ACK_SENT = 7		#no value, 0
+EV_LOST = 8			#packet length, dropped by the unreliable layer
+EV_DAMAGED = 9		#packet length, corrupted by the unreliable layer
+
+
+class EventTrace:
+	"""A fixed-size ring buffer of the recent protocol events of a
+	connection, see RDTSocket.trace_start().
+
+	Each event is a binary record of (time, event, seqNo., value) packed
+	into a preallocated bytearray, so recording one allocates nothing; the
+	oldest events are overwritten. dump() turns them into text, e.g. after
+	something went wrong.
+	"""
+	record = struct.Struct('<dBIq')
+	names = {EV_DATA_SENT: "data_sent", EV_TIMEOUT: "timeout", EV_ACK_RECV: "ack_recv",
+		EV_DATA_RECV: "data_recv", EV_CORRUPT: "corrupt", EV_ACK_SENT: "ack_sent",
+		EV_LOST: "lost", EV_DAMAGED: "damaged"}
+
+	def __init__(self, size):
+		self.size = max(int(size), 1)
+		self.buf = bytearray(self.size * self.record.size)
+		self.count = 0		#no. of events recorded so far
+
+	def add(self, event, seq, value=0):
+		"""Record an event with a seqNo. and a value"""
+		self.record.pack_into(self.buf, (self.count % self.size) * self.record.size, time.monotonic(), event, seq, value)
+		self.count += 1
+
+	def events(self):
+		"""Return the events kept, oldest first, as (time, event, seqNo., value)"""
+		first = max(self.count - self.size, 0)
+		return [self.record.unpack_from(self.buf, (i % self.size) * self.record.size) for i in range(first, self.count)]
+
+	def dump(self, fobj):
+		"""Write the events kept to a text file object, one per line with
+		its time relative to the last event
+
+		Return  -> the no. of events written
+		"""
+		events = self.events()
+		if events:
+			last = events[-1][0]
+			fobj.write("rdt3 event trace: last %d of %d events\n" % (len(events), self.count))
+		for (t, event, seq, value) in events:
+			fobj.write("%+.6f %-10s %10d %12d\n" % (t - last, self.names.get(event, event), seq, value))
+		return len(events)
+
+
+class RDTSocket:
+	"""One RDT connection: it owns its UDP socket, the peer address, the
+	error rates and the sequence state and buffer, so a process can hold
+	as many connections as it likes.
+
+	The methods are the rdt_* functions of this module without the
+	socket argument, e.g. conn.send(byte_msg) for rdt_send(sockd, byte_msg).
 	"""
-	global __LOSS_RATE, __ERR_RATE
-	if peer_addr == ():
-		print("Socket send error: Peer address not set yet")
-		return -1
-	else:
-		#Simulate packet loss
-		drop = random.random()
-		if drop < __LOSS_RATE:
-			#simulate packet loss of unreliable send
-			print("WARNING: udt_send: Packet lost in unreliable layer!!")
-			return len(byte_msg)
 
-		#Simulate packet corruption
-		corrupt = random.random()
-		if corrupt < __ERR_RATE:
-			err_bytearr = bytearray(byte_msg)
-			pos = random.randint(0,len(byte_msg)-1)
-			val = err_bytearr[pos]
-			if val > 1:
-				err_bytearr[pos] -= 2
+	def __init__(self):
+		#store peer address info
+		self.__peeraddr = ()	#set by peer()
+		self.sockd = None		#set by socket()
+		#define the error rates
+		self.__LOSS_RATE = 0.0	#set by network_init()
+		self.__ERR_RATE = 0.0
+		self.emulator = None	#a netem.NetEm in place of the error rates, see network_init()
+		self.__RTO_MIN = RTO_MIN	#bounds of the adaptive retransmission timeout
+		self.__RTO_MAX = RTO_MAX
+
+		self.send_num = 0
+		self.recv_num = 0
+		self.buffer = collections.deque()	#DATA packets received while sending, for recv()
+		self.srtt = None		#smoothed round-trip time, None until the first sample
+		self.rttvar = 0.0		#round-trip time variation
+		self.rto = TIMEOUT		#current retransmission timeout
+		self.retransmits = 0	#no. of DATA packets sent again on timeout
+		self.trace = None		#EventTrace of the recent events, None if off (see trace_start())
+
+
+	#internal functions - being called within the class
+	def __udt_send(self, byte_msg):
+		"""This function is for simulating packet loss or corruption in an unreliable channel.
+
+		Input argument: the message to be sent to the peer
+		Return  -> size of data sent, -1 on error
+		Note: it does not catch any exception
+		"""
+		sockd = self.sockd
+		peer_addr = self.__peeraddr
+		if peer_addr == ():
+			logger.error("Socket send error: Peer address not set yet")
+			return -1
+		elif self.emulator is not None:
+			#the network emulator decides the fate of the packet
+			fate = self.emulator.decide(len(byte_msg), time.monotonic())
+			if not fate:
+				logger.debug("udt_send: Packet lost in unreliable layer!!")
+				if self.trace is not None:
+					self.trace.add(EV_LOST, 0, len(byte_msg))
+			for (delay, pos) in fate:
+				msg = byte_msg
+				if pos >= 0:
+					err_bytearr = bytearray(byte_msg)
+					err_bytearr[pos] = err_bytearr[pos] - 2 if err_bytearr[pos] > 1 else 254
+					msg = bytes(err_bytearr)
+					logger.debug("udt_send: Packet corrupted in unreliable layer!!")
+					if self.trace is not None:
+						self.trace.add(EV_DAMAGED, 0, len(byte_msg))
+				if delay > 0:
+					self.emulator.post(delay, sockd, msg, peer_addr)
+				else:
+					sockd.sendto(msg, peer_addr)
+			return len(byte_msg)
+		else:
+			#Simulate packet loss
+			drop = random.random()
+			if drop < self.__LOSS_RATE:
+				#simulate packet loss of unreliable send
+				logger.debug("udt_send: Packet lost in unreliable layer!!")
+				if self.trace is not None:
+					self.trace.add(EV_LOST, 0, len(byte_msg))
+				return len(byte_msg)
+
+			#Simulate packet corruption
+			corrupt = random.random()
+			if corrupt < self.__ERR_RATE:
+				err_bytearr = bytearray(byte_msg)
+				pos = random.randint(0,len(byte_msg)-1)
+				val = err_bytearr[pos]
+				if val > 1:
+					err_bytearr[pos] -= 2
+				else:
+					err_bytearr[pos] = 254
+				err_msg = bytes(err_bytearr)
+				logger.debug("udt_send: Packet corrupted in unreliable layer!!")
+				if self.trace is not None:
+					self.trace.add(EV_DAMAGED, 0, len(byte_msg))
+				return sockd.sendto(err_msg, peer_addr)
 			else:
-				err_bytearr[pos] = 254
-			err_msg = bytes(err_bytearr)
-			print("WARNING: udt_send: Packet corrupted in unreliable layer!!")
-			return sockd.sendto(err_msg, peer_addr)
+				return sockd.sendto(byte_msg, peer_addr)
+
+	def __udt_recv(self, length):
+		"""Retrieve message from underlying layer
+
+		Input argument: the max amount of data to be received
+		Return  -> the received bytes message object
+		Note: it does not catch any exception
+		"""
+		(rmsg, peer) = self.sockd.recvfrom(length)
+		return rmsg
+
+	@staticmethod
+	def __IntChksum(byte_msg):
+		"""Implement the Internet Checksum algorithm
+
+		Input argument: the bytes message object
+		Return  -> 16-bit checksum value
+		Note: it does not check whether the input object is a bytes object
+
+		Instead of adding up the 16-bit words one by one, the whole message is
+		read as a single little-endian integer. As 2**16 == 1 (mod 0xFFFF),
+		that integer modulo 0xFFFF is the folded one's complement sum of the
+		words, the odd trailing byte (if any) being counted as a low byte.
+		The only difference is that folding never gives 0 for a non-zero sum
+		but 0xFFFF, which is fixed up below.
+		"""
+		value = int.from_bytes(byte_msg, 'little')
+		total = value % 0xFFFF
+		if total == 0 and value != 0:
+			total = 0xFFFF
+
+		total = ~total
+
+		return total & 0xFFFF
+
+
+	def __rtt_update(self, sample):
+		"""Update the round-trip time estimators with a new RTT sample and
+		recompute the retransmission timeout (RFC 6298).
+
+		Input argument: the measured round-trip time in seconds
+		Note: by Karn's rule, samples must only come from packets which have
+		not been retransmitted, and a backed-off rto is kept until one
+		arrives.
+		"""
+		if self.srtt is None:
+			self.srtt = sample
+			self.rttvar = sample / 2
 		else:
-			return sockd.sendto(byte_msg, peer_addr)
-
-def __udt_recv(sockd, length):
-	"""Retrieve message from underlying layer
-
-	Input arguments: Unix socket object and the max amount of data to be received
-	Return  -> the received bytes message object
-	Note: it does not catch any exception
-	"""
-	(rmsg, peer) = sockd.recvfrom(length)
-	return rmsg
+			self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+			self.srtt = 0.875 * self.srtt + 0.125 * sample
+		self.rto = min(max(self.srtt + 4 * self.rttvar, self.__RTO_MIN), self.__RTO_MAX)
+
+	def __trace_recv(self, echk, rtype, rseq, length):
+		"""Record a packet received from the peer in the event trace
+
+		Input arguments: its checksum result, type, seqNo. and length
+		"""
+		if echk != 0:
+			self.trace.add(EV_CORRUPT, rtype, length)
+		elif rtype == 11:
+			self.trace.add(EV_ACK_RECV, rseq, self.send_num)
+		elif rtype == 12:
+			self.trace.add(EV_DATA_RECV, rseq, self.recv_num)
+
+
+	#These are the functions used by appliation
+
+	def network_init(self, drop_rate, err_rate, emulator=None, rto_min=RTO_MIN, rto_max=RTO_MAX):
+		"""Application calls this function to set properties of underlying network.
+
+		Input arguments: packet drop probability and packet corruption probability,
+		and optionally the network emulator (a netem.NetEm of Part3) which
+		takes their place, e.g. for a seeded run or one with delay, and the
+		bounds of the adaptive retransmission timeout in seconds
+		"""
+		random.seed()
+		self.__LOSS_RATE = float(drop_rate)
+		self.__ERR_RATE = float(err_rate)
+		self.emulator = emulator
+		self.__RTO_MAX = max(float(rto_max), 0.001)
+		self.__RTO_MIN = min(max(float(rto_min), 0.001), self.__RTO_MAX)
+		self.rto = min(max(TIMEOUT, self.__RTO_MIN), self.__RTO_MAX)
+		logger.info("Drop rate: %s\tError rate: %s\tRTO: %s-%s", self.__LOSS_RATE, self.__ERR_RATE, self.__RTO_MIN, self.__RTO_MAX)
+		if emulator is not None:
+			logger.info("Network emulator: %r", emulator)
+
+
+	def socket(self):
+		"""Application calls this function to create the RDT socket.
+
+		Null input.
+		Return the Unix socket object on success, None on error
+
+		Note: Catch any known error and report to the user.
+		"""
+		######## Your implementation #######
+		try:
+			sd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		except socket.error as emsg:
+			logger.error("Socket creation error: %s", emsg)
+			return None
+		self.sockd = sd
+		return sd
 
-def __IntChksum(byte_msg):
-	"""Implement the Internet Checksum algorithm
 
-	Input argument: the bytes message object
-	Return  -> 16-bit checksum value
-	Note: it does not check whether the input object is a bytes object
-	"""
-	total = 0
-	length = len(byte_msg)	#length of the byte message object
-	i = 0
-	while length > 1:
-		total += ((byte_msg[i+1] << 8) & 0xFF00) + ((byte_msg[i]) & 0xFF)
-		i += 2
-		length -= 2
+	def bind(self, port):
+		"""Application calls this function to specify the port number
+		used by itself and assigns them to the RDT socket.
 
-	if length > 0:
-		total += (byte_msg[i] & 0xFF)
+		Input argument: port number
+		Return	-> 0 on success, -1 on error
 
-	while (total >> 16) > 0:
-		total = (total & 0xFFFF) + (total >> 16)
+		Note: Catch any known error and report to the user.
+		"""
+		######## Your implementation #######
+		try:
+			self.sockd.bind(("",port))
+		except socket.error as emsg:
+			logger.error("Socket bind error: %s", emsg)
+			return -1
+		return 0
 
-	total = ~total
 
-	return total & 0xFFFF
+	def peer(self, peer_ip, port):
+		"""Application calls this function to specify the IP address
+		and port number used by remote peer process.
 
+		Input arguments: peer's IP address and port number
+		"""
+		######## Your implementation #######
+		self.__peeraddr = (peer_ip, port)
 
-#These are the functions used by appliation
 
-def rdt_network_init(drop_rate, err_rate):
-	"""Application calls this function to set properties of underlying network.
+	def send(self, byte_msg):
+		"""Application calls this function to transmit a message to
+		the remote peer through the RDT socket.
 
-    Input arguments: packet drop probability and packet corruption probability
-	"""
-	random.seed()
-	global __LOSS_RATE, __ERR_RATE
-	__LOSS_RATE = float(drop_rate)
-	__ERR_RATE = float(err_rate)
-	print("Drop rate:", __LOSS_RATE, "\tError rate:", __ERR_RATE)
+		Input argument: the message bytes object
+		Return  -> size of data sent on success, -1 on error
 
+		Note: Make sure the data sent is not longer than the maximum PAYLOAD
+		length. Catch any known error and report to the user.
+		"""
+		######## Your implementation #######
+		sockd = self.sockd
 
-def rdt_socket():
-	"""Application calls this function to create the RDT socket.
+		#Make sure the data sent is not longer than the maximum PAYLOAD length.
+		if (len(byte_msg) > PAYLOAD):
+			msg = byte_msg[0:PAYLOAD]
+		else:
+			msg = byte_msg
 
-	Null input.
-	Return the Unix socket object on success, None on error
+		checksum = self.__IntChksum(message_format.pack(12, self.send_num, 0, len(msg)) + msg)
 
-	Note: Catch any known error and report to the user.
-	"""
-	######## Your implementation #######
-	try:
-		sd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-	except socket.error as emsg:
-		print("Socket creation error: ", emsg)
-		return None
-	return sd
+		send_pkt = message_format.pack(12, self.send_num, checksum, len(msg)) + msg
 
+		try:
+			self.__udt_send(send_pkt)
+		except socket.error as emsg:
+			logger.error("Socket send error: %s", emsg)
+			return -1
+		logger.debug("rdt_send: Sent one message of size %d", len(msg))
+		if self.trace is not None:
+			self.trace.add(EV_DATA_SENT, self.send_num, len(msg))
+		sent_time = time.monotonic()
+		retransmitted = False
+
+		RList = [sockd]
+
+		while True:
+			# use select to wait for any incoming connection requests or
+			# incoming messages until the retransmission timeout
+			remain = max(sent_time + self.rto - time.monotonic(), 0)
+			try:
+				Rready, Wready, Eready = select.select(RList, [], [], remain)
+			except select.error as emsg:
+				logger.error("At select, caught an exception: %s", emsg)
+				return -1
+			except KeyboardInterrupt:
+				logger.error("At select, caught the KeyboardInterrupt")
+				return -1
 
-def rdt_bind(sockd, port):
-	"""Application calls this function to specify the port number
-	used by itself and assigns them to the RDT socket.
+			# if has incoming activities
+			if Rready:
+				# for each socket in the READ ready list
+				for sd in Rready:
+					try:
+						rmsg = self.__udt_recv(PAYLOAD+HEADER)
+					except socket.error as emsg:
+						logger.error("Socket send error: %s", emsg)
+						return -1
+					echk = self.__IntChksum(rmsg)
+					rheader = rmsg[:HEADER]
+					(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
+					if self.trace is not None:
+						self.__trace_recv(echk, rtype, rseq, len(rmsg))
+
+					if echk == 0: #not corrupted
+						if rtype==11 and rseq==self.send_num: #correct ack
+							logger.debug("rdt_send: Received the expected ACK")
+							#Karn's rule: no RTT sample from a retransmitted packet
+							if not retransmitted:
+								self.__rtt_update(time.monotonic() - sent_time)
+							if self.send_num == 0:
+								self.send_num =1
+							else:
+								self.send_num = 0
+							#Return  -> size of data sent on success
+							return len(msg)
+						elif rtype==11 and rseq != self.send_num: #wrong ack
+							logger.debug("rdt_send: Received an unexpected ACK")
+						elif rtype==12:
+							logger.debug("rdt_send: I am expecting an ACK packet, but received a DATA packet")
+							logger.debug("rdt_send: Peer sent me a new DATA packet!!")
+							logger.debug("rdt_send: Drop the packet as I cannot accept it at this point")
+
+							if rmsg not in self.buffer:
+								self.buffer.append(rmsg)
+
+							ackchk = self.__IntChksum(message_format.pack(11, rseq, 0, 0))
+							send_ack = message_format.pack(11, rseq, ackchk, 0)
+							if self.trace is not None:
+								self.trace.add(EV_ACK_SENT, rseq)
+							try:
+								self.__udt_send(send_ack)
+							except socket.error as emsg:
+								logger.error("Socket send error: %s", emsg)
+								return -1
+					else: #corrupted
+						if rtype==11:
+							logger.debug("rdt_send: Received a corrupted packet: Type = ACK, Length = 6")
+							logger.debug("rdt_send: Drop the packet")
+						else:
+							logger.debug("rdt_send: Received a corrupted packet: Type = Data, Length = %d", rlen+6)
+							logger.debug("rdt_send: Drop the packet")
+			#also checked after a packet, so stray packets cannot hold off a retransmission
+			if time.monotonic() >= sent_time + self.rto:
+				logger.debug("rdt_send: Timeout!! Retransmit the packet %d again", self.send_num)
+				#exponential backoff, until an ACK gives a new RTT sample
+				self.rto = min(self.rto * 2, self.__RTO_MAX)
+				if self.trace is not None:
+					self.trace.add(EV_TIMEOUT, self.send_num, int(self.rto * 1000000))
+				try:
+					self.__udt_send(send_pkt)
+				except socket.error as emsg:
+					logger.error("Socket send error: %s", emsg)
+					return -1
+				sent_time = time.monotonic()
+				retransmitted = True
+				self.retransmits += 1
+
+
+	def recv(self, length):
+		"""Application calls this function to wait for a message from the
+		remote peer; the caller will be blocked waiting for the arrival of
+		the message. Upon receiving a message from the underlying UDT layer,
+		the function returns immediately.
+
+		Input argument: the size of the message to received.
+		Return  -> the received bytes message object on success, b'' on error
+
+		Note: Catch any known error and report to the user.
+		"""
+		######## Your implementation #######
+		while self.buffer:
+			rmsg = self.buffer.popleft()
+			rheader = rmsg[:HEADER]
+			(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
+			if rseq == self.recv_num:
+				if self.recv_num == 0:
+					self.recv_num = 1
+				else:
+					self.recv_num = 0
+				return (rmsg[HEADER:]) #Return  -> the received bytes message object on success
 
-	Input arguments: RDT socket object and port number
-	Return	-> 0 on success, -1 on error
+		while True:
+			try:
+				rmsg = self.__udt_recv(length+HEADER)
+			except socket.error as emsg:
+				logger.error("Socket recv error: %s", emsg)
+				return b''
+			echk = self.__IntChksum(rmsg)
+			rheader = rmsg[:HEADER]
+			(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
+			logger.debug("rdt_recv: Received a message of size %d", len(rmsg))
+			if self.trace is not None:
+				self.__trace_recv(echk, rtype, rseq, len(rmsg))
+
+			if echk==0 and rtype ==12: #no error data packet
+				if rseq==self.recv_num:
+					logger.debug("rdt_recv: Got an expected packet")
+					ackchk = self.__IntChksum(message_format.pack(11, rseq, 0, 0))
+					send_ack = message_format.pack(11, rseq, ackchk, 0)
+					if self.trace is not None:
+						self.trace.add(EV_ACK_SENT, rseq)
+					try:
+						self.__udt_send(send_ack)
+					except socket.error as emsg:
+						logger.error("Socket send error: %s", emsg)
+						return b''
+					if self.recv_num == 0:
+						self.recv_num = 1
+					else:
+						self.recv_num = 0
+					return (rmsg[HEADER:])
+				elif rseq != self.recv_num:
+					ackchk = self.__IntChksum(message_format.pack(11, rseq, 0, 0))
+					send_ack = message_format.pack(11, rseq, ackchk, 0)
+					if self.trace is not None:
+						self.trace.add(EV_ACK_SENT, rseq)
+					try:
+						self.__udt_send(send_ack)
+					except socket.error as emsg:
+						logger.error("Socket send error: %s", emsg)
+						return b''
+					logger.debug("rdt_recv: Received a retransmission DATA packet from peer!!")
+					logger.debug("rdt_recv: Retransmit the ACK packet")
+
+			else: #error data packet
+				logger.debug("rdt_recv: Received a corrupted packet: Type = %d, Length = %d", rtype, len(rmsg))
+				logger.debug("rdt_recv: Drop the packet")
+				prevack = 1 - self.recv_num
+				ackchk = self.__IntChksum(message_format.pack(11, prevack, 0, 0))
+				send_ack = message_format.pack(11, prevack, ackchk, 0)
+				if self.trace is not None:
+					self.trace.add(EV_ACK_SENT, prevack)
+				try:
+					self.__udt_send(send_ack)
+				except socket.error as emsg:
+					logger.error("Socket send error: %s", emsg)
+					return b''
 
-	Note: Catch any known error and report to the user.
-	"""
-	######## Your implementation #######
-	try:
-		sockd.bind(("",port))
-	except socket.error as emsg:
-		print("Socket bind error: ", emsg)
-		return -1
-	return 0
 
+	def trace_start(self, size=TRACE_EVENTS):
+		"""Application calls this function to keep a trace of the last size
+		protocol events of the connection, see EventTrace and trace_dump().
 
-def rdt_peer(peer_ip, port):
-	"""Application calls this function to specify the IP address
-	and port number used by remote peer process.
+		Input argument: the no. of events to keep
+		"""
+		self.trace = EventTrace(size)
 
-	Input arguments: peer's IP address and port number
-	"""
-	######## Your implementation #######
-	global __peeraddr
-	__peeraddr = (peer_ip, port)
 
+	def trace_dump(self, fobj=None):
+		"""Write the event trace out as text, e.g. when something failed.
 
-def rdt_send(sockd, byte_msg):
-	"""Application calls this function to transmit a message to
-	the remote peer through the RDT socket.
-
-	Input arguments: RDT socket object and the message bytes object
-	Return  -> size of data sent on success, -1 on error
-
-	Note: Make sure the data sent is not longer than the maximum PAYLOAD
-	length. Catch any known error and report to the user.
-	"""
-	######## Your implementation #######
-	global PAYLOAD, HEADER, __peeraddr, message_format, send_num, recv_num, buffer
-
-	#Make sure the data sent is not longer than the maximum PAYLOAD length.
-	if (len(byte_msg) > PAYLOAD):
-		msg = byte_msg[0:PAYLOAD]
-	else:
-		msg = byte_msg
-
-	checksum = __IntChksum(message_format.pack(12, send_num, 0, len(msg)) + msg)
-
-	send_pkt = message_format.pack(12, send_num, checksum, len(msg)) + msg
-
-	try:
-		__udt_send(sockd, __peeraddr, send_pkt)
-	except socket.error as emsg:
-		print("Socket send error: ", emsg)
-		return -1
-	print("rdt_send: Sent one message of size ", len(msg))
-	
-	RList = [sockd]
-
-	while True:
-		# use select to wait for any incoming connection requests or
-		# incoming messages or 10 seconds
-		try:
-			Rready, Wready, Eready = select.select(RList, [], [], TIMEOUT)
-		except select.error as emsg:
-			print("At select, caught an exception:", emsg)
+		Input argument: the text file object, sys.stderr by default
+		Return  -> the no. of events written, -1 if the trace is off
+		"""
+		if self.trace is None:
 			return -1
-		except KeyboardInterrupt:
-			print("At select, caught the KeyboardInterrupt")
-			return -1
-
-		# if has incoming activities
-		if Rready:
-			# for each socket in the READ ready list
-			for sd in Rready:
-				try:
-					rmsg = __udt_recv(sockd, PAYLOAD+HEADER)
-				except socket.error as emsg:
-					print("Socket send error: ", emsg)
-					return -1
-				echk = __IntChksum(rmsg)
-				rheader = rmsg[:HEADER]
-				(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
-
-				if echk == 0: #not corrupted
-					if rtype==11 and rseq==send_num: #correct ack
-						print("rdt_send: Received the expected ACK")
-						if send_num == 0: 
-							send_num =1
-						else: 
-							send_num = 0
-						#Return  -> size of data sent on success
-						return len(msg)
-					elif rtype==11 and rseq != send_num: #wrong ack
-						print("rdt_send: Received an unexpected ACK")
-					elif rtype==12:
-						print("rdt_send: I am expecting an ACK packet, but received a DATA packet")
-						print("rdt_send: Peer sent me a new DATA packet!!")
-						print("rdt_send: Drop the packet as I cannot accept it at this point")
-
-						if rmsg not in buffer:
-							buffer.append(rmsg)
-
-						ackchk = __IntChksum(message_format.pack(11, rseq, 0, 0))
-						send_ack = message_format.pack(11, rseq, ackchk, 0)
-						try:
-							__udt_send(sockd, __peeraddr, send_ack)
-						except socket.error as emsg:
-							print("Socket send error: ", emsg)
-							return -1
-				else: #corrupted
-					if rtype==11:
-						print("rdt_send: Received a corrupted packet: Type = ACK, Length = 6")
-						print("rdt_send: Drop the packet")
-					else:
-						print("rdt_send: Received a corrupted packet: Type = Data, Length =", rlen+6)
-						print("rdt_send: Drop the packet")
-		else:
-			print("rdt_send: Timeout!! Retransmit the packet", send_num, "again")
+		return self.trace.dump(sys.stderr if fobj is None else fobj)
+
+
+	def close(self):
+		"""Application calls this function to close the RDT socket.
+
+		Note: (1) Catch any known error and report to the user.
+		(2) Before closing the RDT socket, the reliable layer needs to wait for TWAIT
+		time units before closing the socket.
+		"""
+		######## Your implementation #######
+		sockd = self.sockd
+		#wait for TWAIT, or for a few RTOs if the path turned out to be slow
+		twait = max(TWAIT, 2 * self.rto)
+		RList = [sockd]
+		while True:
 			try:
-				__udt_send(sockd, __peeraddr, send_pkt)
-			except socket.error as emsg:
-				print("Socket send error: ", emsg)
+				Rready, Wready, Eready = select.select(RList, [], [], twait)
+			except select.error as emsg:
+				logger.error("At select, caught an exception: %s", emsg)
+				return -1
+			except KeyboardInterrupt:
+				logger.error("At select, caught the KeyboardInterrupt")
 				return -1
 
-						
-def rdt_recv(sockd, length):
-	"""Application calls this function to wait for a message from the
-	remote peer; the caller will be blocked waiting for the arrival of
-	the message. Upon receiving a message from the underlying UDT layer,
-    the function returns immediately.
+			if Rready:
+				# for each socket in the READ ready list
+				for sd in Rready:
+					try:
+						rmsg = self.__udt_recv(PAYLOAD+HEADER)
+					except socket.error as emsg:
+						logger.error("Socket send error: %s", emsg)
+						return -1
 
-	Input arguments: RDT socket object and the size of the message to
-	received.
-	Return  -> the received bytes message object on success, b'' on error
+					echk = self.__IntChksum(rmsg)
+					rheader = rmsg[:HEADER]
+					(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
+					if self.trace is not None:
+						self.__trace_recv(echk, rtype, rseq, len(rmsg))
 
-	Note: Catch any known error and report to the user.
-	"""
-	######## Your implementation #######
-	global PAYLOAD, HEADER, __peeraddr, message_format, send_num, recv_num, buffer
-	while buffer != []:
-		rmsg = buffer.pop(0)
-		rheader = rmsg[:HEADER]
-		(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
-		if rseq == recv_num:
-			if recv_num == 0:
-				recv_num = 1
+					if echk==0 and rtype==12: #no error data
+						ackchk = self.__IntChksum(message_format.pack(11, rseq, 0, 0))
+						send_ack = message_format.pack(11, rseq, ackchk, 0)
+						if self.trace is not None:
+							self.trace.add(EV_ACK_SENT, rseq)
+						try:
+							self.__udt_send(send_ack)
+						except socket.error as emsg:
+							logger.error("Socket send error: %s", emsg)
+							return b''
 			else:
-				recv_num = 0
-			return (rmsg[HEADER:]) #Return  -> the received bytes message object on success
-	
-	while True:
-		try:
-			rmsg = __udt_recv(sockd, length+HEADER)
-		except socket.error as emsg:
-			print("Socket recv error: ", emsg)
-			return b''
-		echk = __IntChksum(rmsg)
-		rheader = rmsg[:HEADER]
-		(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
-		print("rdt_recv: Received a message of size %d" % len(rmsg))
-
-		if echk==0 and rtype ==12: #no error data packet
-			if rseq==recv_num:
-				print("rdt_recv: Got an expected packet")
-				ackchk = __IntChksum(message_format.pack(11, rseq, 0, 0))
-				send_ack = message_format.pack(11, rseq, ackchk, 0)
-				try:
-					__udt_send(sockd, __peeraddr, send_ack)
-				except socket.error as emsg:
-					print("Socket send error: ", emsg)
-					return b''
-				if recv_num == 0:
-					recv_num = 1
-				else:
-					recv_num = 0
-				return (rmsg[HEADER:])
-			elif rseq != recv_num:
-				ackchk = __IntChksum(message_format.pack(11, rseq, 0, 0))
-				send_ack = message_format.pack(11, rseq, ackchk, 0)
+				logger.info("rdt_close: Nothing happened for %.3f second", twait)
+				logger.info("rdt_close: Release the socket")
 				try:
-					__udt_send(sockd, __peeraddr, send_ack)
+					sockd.close()
 				except socket.error as emsg:
-					print("Socket send error: ", emsg)
-					return b''
-				print("rdt_recv: Received a retransmission DATA packet from peer!!")
-				print("rdt_recv: Retransmit the ACK packet")
-		
-		else: #error data packet
-			print("rdt_recv: Received a corrupted packet: Type =", rtype, ", Length =", len(rmsg))
-			print("rdt_recv: Drop the packet")
-			prevack = 1 - recv_num
-			ackchk = __IntChksum(message_format.pack(11, prevack, 0, 0))
-			send_ack = message_format.pack(11, prevack, ackchk, 0)
-			try:
-				__udt_send(sockd, __peeraddr, send_ack)
-			except socket.error as emsg:
-				print("Socket send error: ", emsg)
-				return b''
-			
+					logger.error("Socket close error: %s", emsg)
+				break
 
 
+#the connection behind the rdt_* functions below
+default_conn = RDTSocket()
 
+#These are the functions used by appliation; each one is a thin wrapper
+#over the same method of default_conn, the socket argument is the one
+#returned by rdt_socket() and is only kept for compatibility
 
+def rdt_network_init(drop_rate, err_rate, emulator=None, rto_min=RTO_MIN, rto_max=RTO_MAX):
+	"""Set properties of underlying network, see RDTSocket.network_init()"""
+	default_conn.network_init(drop_rate, err_rate, emulator, rto_min, rto_max)
 
+def rdt_socket():
+	"""Create the RDT socket, see RDTSocket.socket()"""
+	return default_conn.socket()
 
-def rdt_close(sockd):
-	"""Application calls this function to close the RDT socket.
+def rdt_bind(sockd, port):
+	"""Bind the RDT socket to port, see RDTSocket.bind()"""
+	return default_conn.bind(port)
 
-	Input argument: RDT socket object
+def rdt_peer(peer_ip, port):
+	"""Set the address of the remote peer, see RDTSocket.peer()"""
+	return default_conn.peer(peer_ip, port)
 
-	Note: (1) Catch any known error and report to the user.
-	(2) Before closing the RDT socket, the reliable layer needs to wait for TWAIT
-	time units before closing the socket.
-	"""
-	######## Your implementation #######
-	RList = [sockd]
-	while True:
-		try:
-			Rready, Wready, Eready = select.select(RList, [], [], TWAIT)
-		except select.error as emsg:
-			print("At select, caught an exception:", emsg)
-			return -1
-		except KeyboardInterrupt:
-			print("At select, caught the KeyboardInterrupt")
-			return -1
+def rdt_send(sockd, byte_msg):
+	"""Transmit a message to the remote peer, see RDTSocket.send()"""
+	return default_conn.send(byte_msg)
 
-		if Rready:
-			# for each socket in the READ ready list
-			for sd in Rready:
-				try:
-					rmsg = __udt_recv(sockd, PAYLOAD+HEADER)
-				except socket.error as emsg:
-					print("Socket send error: ", emsg)
-					return -1
-				
-				echk = __IntChksum(rmsg)
-				rheader = rmsg[:HEADER]
-				(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
+def rdt_recv(sockd, length):
+	"""Wait for a message from the remote peer, see RDTSocket.recv()"""
+	return default_conn.recv(length)
 
-				if echk==0 and rtype==12: #no error data
-					ackchk = __IntChksum(message_format.pack(11, rseq, 0, 0))
-					send_ack = message_format.pack(11, rseq, ackchk, 0)
-					try:
-						__udt_send(sockd, __peeraddr, send_ack)
-					except socket.error as emsg:
-						print("Socket send error: ", emsg)
-						return b''
-		else:
-			print("rdt_close: Nothing happened for 0.500 second")
-			print("rdt_close: Release the socket")
-			try:
-				sockd.close()
-			except socket.error as emsg:
-				print("Socket close error: ", emsg)
-			break
+def rdt_close(sockd):
+	"""Close the RDT socket, see RDTSocket.close()"""
+	return default_conn.close()
 
-		
-		
+def rdt_trace_start(sockd, size=TRACE_EVENTS):
+	"""Keep a trace of the recent protocol events, see RDTSocket.trace_start()"""
+	default_conn.trace_start(size)
 
+def rdt_trace_dump(sockd, fobj=None):
+	"""Write the event trace out as text, see RDTSocket.trace_dump()"""
+	return default_conn.trace_dump(fobj)
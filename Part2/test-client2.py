@@ -8,15 +8,26 @@ This is for testing of the RDT3.0 layer.
 import sys
 import os
 import time
+import logging
 import rdt3 as rdt
+#the network emulator is shared with Part3
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Part3"))
+import netem
+
+def abort(sockfd):
+	"""Leave on an error of the RDT layer, writing out its recent events
+	first if they are traced (TRACE option)
+	"""
+	rdt.rdt_trace_dump(sockfd)
+	sys.exit(0)
 
 def main():
 
 	MSG_LEN = rdt.PAYLOAD	#get the system payload limit
 
 	#Check the number of input arguments
-	if len(sys.argv) != 5:
-		print("Usage:  "+sys.argv[0]+"  <server IP>  <filename>  <drop rate>  <error rate>")
+	if len(sys.argv) < 5:
+		print("Usage:  "+sys.argv[0]+"  <server IP>  <filename>  <drop rate>  <error rate>  [LOG=<level>]  [TRACE[=<n>]]  [NETEM=<key>=<value>,...]  [RTOMIN=<ms>]  [RTOMAX=<ms>]")
 		sys.exit(0)
 	#Get the filename
 	filename = sys.argv[2]
@@ -33,13 +44,42 @@ def main():
 	filelength = os.path.getsize(filename)
 	print("File bytes are ",filelength)
 
+	#messages of the RDT layer, WARNING (errors only) unless LOG=<level>
+	level = "WARNING"
+	trace = 0
+	spec = None
+	rto_min = rdt.RTO_MIN
+	rto_max = rdt.RTO_MAX
+	for opt in sys.argv[5:]:
+		if opt.upper().startswith("LOG="):
+			level = opt[4:].upper()
+		elif opt.upper().startswith("TRACE"):
+			#keep the recent protocol events, written out on an error
+			trace = int(opt[6:]) if opt[5:6] == "=" else rdt.TRACE_EVENTS
+		elif opt.upper().startswith("NETEM="):
+			#e.g. NETEM=seed=1,delay=20,burst=0.01/0.3, see netem.netem_parse()
+			spec = opt[6:]
+		elif opt.upper().startswith("RTOMIN="):
+			#bounds of the retransmission timeout, in milliseconds
+			rto_min = float(opt[7:]) / 1000
+		elif opt.upper().startswith("RTOMAX="):
+			rto_max = float(opt[7:]) / 1000
+	logging.basicConfig(level=getattr(logging, level, logging.WARNING), format="%(message)s")
+
 	#set up the RDT simulation
-	rdt.rdt_network_init(sys.argv[3], sys.argv[4])
+	emulator = None
+	if spec is not None:
+		emulator = netem.netem_parse(spec, float(sys.argv[3]), float(sys.argv[4]), "client")
+		if emulator is None:
+			sys.exit(0)
+	rdt.rdt_network_init(sys.argv[3], sys.argv[4], emulator, rto_min, rto_max)
 
 	#create RDT socket
 	sockfd = rdt.rdt_socket()
 	if sockfd == None:
 		sys.exit(0)
+	if trace:
+		rdt.rdt_trace_start(sockfd, trace)
 
     #specify my own IP address & port number
     #if I do not specify, others can not send things to me.
@@ -55,16 +95,16 @@ def main():
 	osize = rdt.rdt_send(sockfd, str(filelength).encode("ascii"))
 	if osize < 0:
 		print("Cannot send message1")
-		sys.exit(0)
+		abort(sockfd)
 	#then send the filename to server
 	osize = rdt.rdt_send(sockfd, filename.encode("ascii"))
 	if osize < 0:
 		print("Cannot send message2")
-		sys.exit(0)
+		abort(sockfd)
 	#now wait for server response
 	rmsg = rdt.rdt_recv(sockfd, MSG_LEN)
 	if rmsg == b'':
-		sys.exit(0)
+		abort(sockfd)
 	elif rmsg == b'ERROR':
 		print("Server experienced file creation error.\nProgram terminated.")
 		sys.exit(0)
@@ -85,12 +125,13 @@ def main():
 			sent += osize
 		else:
 			print("Experienced sending error! Has sent",sent,"bytes of message so far.")
-			sys.exit(0)
+			abort(sockfd)
 
 	endtime = time.monotonic()	#record end time
 	print("Completed the file transfer.")
 	lapsed = endtime - starttime
 	print("Total elapse time: %.3f s\tThroughtput: %.2f KB/s" % (lapsed, filelength/lapsed/1000.0))
+	print("Retransmissions:", rdt.default_conn.retransmits)
 
 	#Closing
 	fobj.close()
@@ -7,15 +7,26 @@ This is for testing of the RDT3.0 layer.
 
 import sys
 import os
+import logging
 import rdt3 as rdt
+#the network emulator is shared with Part3
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Part3"))
+import netem
+
+def abort(sockfd):
+	"""Leave on an error of the RDT layer, writing out its recent events
+	first if they are traced (TRACE option)
+	"""
+	rdt.rdt_trace_dump(sockfd)
+	sys.exit(0)
 
 def main():
 
 	MSG_LEN = rdt.PAYLOAD
 
 	#Check the number of input arguments
-	if len(sys.argv) != 4:
-		print("Usage:  "+sys.argv[0]+"  <client IP>  <drop rate>  <error rate>")
+	if len(sys.argv) < 4:
+		print("Usage:  "+sys.argv[0]+"  <client IP>  <drop rate>  <error rate>  [LOG=<level>]  [TRACE[=<n>]]  [NETEM=<key>=<value>,...]  [RTOMIN=<ms>]  [RTOMAX=<ms>]")
 		sys.exit(0)
 
 	#check whether the folder exists
@@ -26,13 +37,42 @@ def main():
 		print("Please create the directory before starting up the server")
 		sys.exit(0)
 
+	#messages of the RDT layer, WARNING (errors only) unless LOG=<level>
+	level = "WARNING"
+	trace = 0
+	spec = None
+	rto_min = rdt.RTO_MIN
+	rto_max = rdt.RTO_MAX
+	for opt in sys.argv[4:]:
+		if opt.upper().startswith("LOG="):
+			level = opt[4:].upper()
+		elif opt.upper().startswith("TRACE"):
+			#keep the recent protocol events, written out on an error
+			trace = int(opt[6:]) if opt[5:6] == "=" else rdt.TRACE_EVENTS
+		elif opt.upper().startswith("NETEM="):
+			#e.g. NETEM=seed=1,delay=20,burst=0.01/0.3, see netem.netem_parse()
+			spec = opt[6:]
+		elif opt.upper().startswith("RTOMIN="):
+			#bounds of the retransmission timeout, in milliseconds
+			rto_min = float(opt[7:]) / 1000
+		elif opt.upper().startswith("RTOMAX="):
+			rto_max = float(opt[7:]) / 1000
+	logging.basicConfig(level=getattr(logging, level, logging.WARNING), format="%(message)s")
+
 	#set up the RDT simulation
-	rdt.rdt_network_init(sys.argv[2], sys.argv[3])
+	emulator = None
+	if spec is not None:
+		emulator = netem.netem_parse(spec, float(sys.argv[2]), float(sys.argv[3]), "server")
+		if emulator is None:
+			sys.exit(0)
+	rdt.rdt_network_init(sys.argv[2], sys.argv[3], emulator, rto_min, rto_max)
 
 	#create RDT socket
 	sockfd = rdt.rdt_socket()
 	if sockfd == None:
 		sys.exit(0)
+	if trace:
+		rdt.rdt_trace_start(sockfd, trace)
 
     #specify my own IP address & port number
     #if I do not specify, others can not send things to me.
@@ -47,14 +87,14 @@ def main():
 	#First wait for client 1st message
 	rmsg = rdt.rdt_recv(sockfd, MSG_LEN)
 	if rmsg == b'':
-		sys.exit(0)
+		abort(sockfd)
 	else:
 		filelength = int(rmsg)
 		print("Received client request: file size =",filelength)
 	#then wait for client 2nd message
 	rmsg = rdt.rdt_recv(sockfd, MSG_LEN)
 	if rmsg == b'':
-		sys.exit(0)
+		abort(sockfd)
 	else:
 		filename = "./Store/"+rmsg.decode("ascii")
 		#open file
@@ -67,7 +107,7 @@ def main():
 			osize = rdt.rdt_send(sockfd, b'OKAY')
 			if osize < 0:
 				print("Cannot send response message")
-				sys.exit(0)
+				abort(sockfd)
 		else:
 			print("Cannot open the target file",filename,"for writing")
 			osize = rdt.rdt_send(sockfd, b'ERROR')
@@ -80,7 +120,7 @@ def main():
 		rmsg = rdt.rdt_recv(sockfd, MSG_LEN)
 		if rmsg == b'':
 			print("Encountered receive error! Has received",received,"so far.")
-			sys.exit(0)
+			abort(sockfd)
 		else:
 			wsize = fobj.write(rmsg)
 			received += wsize
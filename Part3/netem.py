@@ -0,0 +1,281 @@
+#!/usr/bin/python3
+"""Network emulator of the unreliable layer
+
+class:     NetEm, the fate of each datagram sent over an emulated path
+functions: netem_parse() to build one from a text option
+
+The RDT layer asks NetEm.decide() what becomes of each datagram before it
+sends it: lost, corrupted at a given byte, delayed, duplicated or sent at
+once. What it can emulate:
+- independent (Bernoulli) loss, or bursty loss with the Gilbert-Elliott
+  model: a Good and a Bad state with a loss probability each, and the
+  probabilities of going from one state to the other per packet
+- corruption of one byte of the datagram, with the same probability for
+  any datagram, or one growing with its length as with independent bit
+  errors
+- a fixed delay plus a uniformly distributed jitter
+- a bandwidth cap, the datagrams queue up behind each other at the
+  bottleneck, optionally with a limit in bytes (drop-tail)
+- reordering, a packet held back for an extra time so later ones overtake it
+- duplication
+
+All the random decisions come from one random.Random of a given seed, drawn
+DECISION_BATCH packets ahead in a tight loop, so the same seed gives the
+same fates to the same sequence of packets on any platform, and deciding
+the fate of a packet is a few list lookups. Datagrams which are to arrive
+later are sent by a delay line thread at their due time.
+"""
+
+import heapq
+import random
+import threading
+import time
+import logging
+
+#some constants
+DECISION_BATCH = 1024	#no. of packets whose random decisions are drawn at once
+REORDER_DELAY = 0.001	#default extra delay of a reordered packet
+
+#the outcomes of decide() without any delay, shared to save allocating them
+LOST = ()
+INTACT = ((0.0, -1),)
+
+logger = logging.getLogger("netem")
+logger.addHandler(logging.NullHandler())
+
+
+class NetEm:
+	"""The emulated path of one direction (or of all the peers of a
+	listener, which then share its bandwidth and delay line).
+
+	Input arguments: loss probability (in the Good state), corruption
+	probability, the seed of the random decisions (None for a random one),
+	delay and jitter in seconds, the bandwidth cap in bytes per second (None
+	for no cap) and the queue limit in bytes (None for no limit), the
+	reordering probability and the extra delay of a reordered packet, the
+	duplication probability, the Gilbert-Elliott state changes per packet
+	as (Good to Bad, Bad to Good) or None for independent loss, the loss
+	probability in the Bad state, and the datagram length in bytes the
+	corruption probability is for, a datagram of n times that length being
+	corrupted with probability 1 - (1 - corrupt)**n, or None for the same
+	probability whatever the length
+
+	The no. of datagrams lost, corrupted, duplicated, reordered and dropped
+	at the queue limit are counted in the attributes of those names.
+	"""
+
+	def __init__(self, loss=0.0, corrupt=0.0, seed=None, delay=0.0, jitter=0.0, rate=None, limit=None,
+			reorder=0.0, reorder_delay=REORDER_DELAY, duplicate=0.0, burst=None, loss_bad=1.0, corrupt_len=None):
+		self.loss = float(loss)
+		self.corrupt = float(corrupt)
+		self.seed = seed
+		self.delay = float(delay)
+		self.jitter = float(jitter)
+		self.rate = None if not rate else float(rate)
+		self.limit = None if limit is None else int(limit)
+		self.reorder = float(reorder)
+		self.reorder_delay = float(reorder_delay)
+		self.duplicate = float(duplicate)
+		self.burst = None if burst is None else (float(burst[0]), float(burst[1]))
+		self.loss_bad = float(loss_bad)
+		self.corrupt_len = None if not corrupt_len else float(corrupt_len)
+
+		self.lost = 0
+		self.corrupted = 0
+		self.duplicated = 0
+		self.reordered = 0
+		self.tail_dropped = 0
+
+		self.__rng = random.Random(seed)
+		self.__bad = False		#Gilbert-Elliott state after the last drawn packet
+		self.__corrupt_of = {}	#corruption probability of each datagram length (corrupt_len)
+		self.__next = 0			#index of the next packet into the drawn decisions
+		#per packet: None if lost, else where to corrupt it (-1.0 if not)
+		#and, unless simple, its delay, whether reordered and duplicated
+		self.__fates = []
+		#without delays and duplicates, a packet is lost, corrupted or sent
+		self.__simple = (self.delay == 0 and self.jitter == 0 and self.rate is None and
+			self.reorder == 0 and self.duplicate == 0)
+		self.__busy = 0.0		#when the bottleneck has sent out its queue
+
+		#the delay line: (due time, no., socket, datagram, address) heap
+		self.__line = []
+		self.__posted = 0
+		self.__cond = threading.Condition()
+		self.__thread = None
+
+	def __repr__(self):
+		return ("NetEm(loss=%s, corrupt=%s, seed=%s, delay=%s, jitter=%s, rate=%s, limit=%s, reorder=%s, duplicate=%s, burst=%s, loss_bad=%s, corrupt_len=%s)" %
+			(self.loss, self.corrupt, self.seed, self.delay, self.jitter, self.rate, self.limit, self.reorder, self.duplicate, self.burst, self.loss_bad, self.corrupt_len))
+
+	def __draw(self):
+		"""Draw the random decisions of the next DECISION_BATCH packets;
+		each packet takes the same no. of draws whatever its fate, so one
+		decision never shifts the ones after it.
+		"""
+		rand = self.__rng.random
+		n = DECISION_BATCH
+		if self.burst is None:
+			lost = [u < self.loss for u in [rand() for i in range(n)]]
+		else:
+			(p, r) = self.burst
+			bad = self.__bad
+			lost = []
+			for i in range(n):
+				#change state first, then lose with the loss rate of the state
+				if bad:
+					bad = rand() >= r
+				else:
+					bad = rand() < p
+				lost.append(rand() < (self.loss_bad if bad else self.loss))
+			self.__bad = bad
+		#one draw gives both whether to corrupt and where: below the rate,
+		#u / rate is uniform over [0, 1) as well; with corrupt_len the rate
+		#depends on the length, so the draw is kept for decide()
+		corrupt = self.corrupt
+		if self.corrupt_len is None:
+			at = [u / corrupt if u < corrupt else -1.0 for u in [rand() for i in range(n)]]
+		else:
+			at = [rand() for i in range(n)]
+		if self.__simple:
+			self.__fates = [None if lost[i] else at[i] for i in range(n)]
+		else:
+			jitter = self.jitter
+			extra = [self.delay + (2 * u - 1) * jitter for u in [rand() for i in range(n)]]
+			reorder = [u < self.reorder for u in [rand() for i in range(n)]]
+			duplicate = [u < self.duplicate for u in [rand() for i in range(n)]]
+			for i in range(n):
+				if reorder[i]:
+					extra[i] += self.reorder_delay
+			self.__fates = [None if lost[i] else (at[i], max(extra[i], 0.0), reorder[i], duplicate[i]) for i in range(n)]
+		self.__next = 0
+
+	def decide(self, length, now):
+		"""Decide the fate of the next datagram sent.
+
+		Input arguments: the datagram length, the current time.monotonic()
+		time (or the virtual time of a simulation)
+		Return  -> a sequence of (delay in seconds, byte to corrupt or -1),
+		one for each copy to send, empty if the datagram is lost
+		"""
+		i = self.__next
+		if i == len(self.__fates):
+			self.__draw()
+			i = 0
+		self.__next = i + 1
+		fate = self.__fates[i]
+		if fate is None:
+			self.lost += 1
+			return LOST
+		if self.__simple:
+			if self.corrupt_len is not None:
+				fate = self.__corrupt_at(fate, length)
+			if fate < 0:
+				return INTACT
+			self.corrupted += 1
+			return ((0.0, int(fate * length)),)
+
+		(at, extra, reordered, duplicated) = fate
+		if self.corrupt_len is not None:
+			at = self.__corrupt_at(at, length)
+		wait = 0.0
+		if self.rate is not None:
+			#queue up behind the datagrams still at the bottleneck
+			start = max(now, self.__busy)
+			if self.limit is not None and (start - now) * self.rate + length > self.limit:
+				self.tail_dropped += 1
+				return LOST
+			self.__busy = start + length / self.rate
+			wait = self.__busy - now
+		wait += extra
+		pos = -1
+		if at >= 0:
+			self.corrupted += 1
+			pos = int(at * length)
+		if reordered:
+			self.reordered += 1
+		if duplicated:
+			self.duplicated += 1
+			return ((wait, pos), (wait, -1))
+		return ((wait, pos),)
+
+	def __corrupt_at(self, u, length):
+		"""Return where to corrupt a datagram of the given length, as a
+		fraction of it, or -1.0 if not, from its corruption draw u
+		(corrupt_len)"""
+		rate = self.__corrupt_of.get(length)
+		if rate is None:
+			rate = self.__corrupt_of[length] = 1.0 - (1.0 - self.corrupt) ** (length / self.corrupt_len)
+		return u / rate if u < rate else -1.0
+
+	def post(self, delay, sockd, datagram, addr):
+		"""Send a datagram after delay seconds from the delay line thread
+
+		Input arguments: the delay, the socket, the bytes datagram and the
+		address to send it to
+		"""
+		due = time.monotonic() + delay
+		with self.__cond:
+			heapq.heappush(self.__line, (due, self.__posted, sockd, datagram, addr))
+			self.__posted += 1
+			if self.__thread is None:
+				self.__thread = threading.Thread(target=self.__run, name="netem", daemon=True)
+				self.__thread.start()
+			elif self.__line[0][1] == self.__posted - 1:
+				#the new datagram is due first
+				self.__cond.notify()
+
+	def __run(self):
+		"""Body of the delay line thread"""
+		line = self.__line
+		while True:
+			with self.__cond:
+				while True:
+					if not line:
+						self.__cond.wait()
+						continue
+					wait = line[0][0] - time.monotonic()
+					if wait <= 0:
+						(due, no, sockd, datagram, addr) = heapq.heappop(line)
+						break
+					self.__cond.wait(wait)
+			try:
+				sockd.sendto(datagram, addr)
+			except OSError as emsg:
+				#e.g. the socket was closed while the datagram was on its way
+				logger.debug("Delayed datagram not sent: %s", emsg)
+
+
+def netem_parse(spec, loss=0.0, corrupt=0.0, stream=None):
+	"""Build a NetEm from a text option, e.g. "seed=1,delay=20,jitter=5,
+	rate=8,limit=64,reorder=0.01,dup=0.01,burst=0.01/0.3,lossbad=0.5,errlen=1006"
+
+	Input arguments: comma separated key=value pairs, with delay, jitter and
+	the reorder extra delay ("gap") in milliseconds, rate in Mbit/s, limit
+	in kilobytes and the length the corruption probability is for
+	("errlen") in bytes; the loss and corruption probabilities of the Good state;
+	the name of the stream, e.g. "client", mixed into the seed so that the
+	two directions of a connection given the same seed do not lose the
+	same packets
+	Return  -> the NetEm object, None if the option is not understood
+	"""
+	keys = {"seed": "seed", "delay": "delay", "jitter": "jitter", "rate": "rate", "limit": "limit",
+		"reorder": "reorder", "gap": "reorder_delay", "dup": "duplicate", "burst": "burst", "lossbad": "loss_bad", "errlen": "corrupt_len"}
+	scale = {"delay": 0.001, "jitter": 0.001, "reorder_delay": 0.001, "rate": 1000000 / 8, "limit": 1000}
+	args = {"loss": loss, "corrupt": corrupt}
+	try:
+		for item in filter(None, spec.split(",")):
+			(key, value) = item.split("=", 1)
+			name = keys[key.strip().lower()]
+			if name == "seed":
+				args[name] = int(value)
+			elif name == "burst":
+				args[name] = tuple(float(v) for v in value.split("/", 1))
+			else:
+				args[name] = float(value) * scale.get(name, 1)
+		if stream is not None and "seed" in args:
+			args["seed"] = "%d/%s" % (args["seed"], stream)
+		return NetEm(**args)
+	except (KeyError, ValueError, TypeError, IndexError) as emsg:
+		logger.error("Network emulator option error: %s in %r", emsg, spec)
+		return None
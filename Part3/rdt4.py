@@ -1,8 +1,15 @@
 #!/usr/bin/python3
 """Implementation of RDT4.0
 
+class:     RDTSocket, one RDT connection with its own socket, peer and state
 functions: rdt_network_init, rdt_socket(), rdt_bind(), rdt_peer()
-           rdt_send(), rdt_recv(), rdt_close()
+           rdt_send(), rdt_recv(), rdt_flush(), rdt_close()
+           rdt_listen(), rdt_recvfrom() to serve many peers on one socket
+           rdt_start_io() to run the protocol in an I/O thread
+           rdt_trace_start(), rdt_trace_dump() for a trace of recent events
+           rdt_stats(), rdt_stats_export() for the counters of the connection
+           which work on the module's default connection, default_conn
+logger:    "rdt4" (see logging), silent until the application sets up logging
 
 Student name: Wong Ka Ngai
 Student No. : 3035568881
@@ -12,426 +19,2195 @@ Python version: 3.7.0
 """
 
 import socket
-import random
 import sys
 import select
 import struct
 import math
+import time
+import collections
+import heapq
+import threading
+import queue
+import ctypes
+import os
+import errno
+import logging
+import netem
 
 #some constants
-PAYLOAD = 1000		#size of data payload of each packet
+PAYLOAD = 1000		#default size of data payload of each packet, see network_init()
+UDP_MAX = 65507		#max payload of a UDP datagram over IPv4
+IP_UDP_HEADER = 28	#size of the IPv4 (without options) and UDP headers
 CPORT = 100			#Client port number - Change to your port number
 SPORT = 200			#Server port number - Change to your port number
-TIMEOUT = 0.05		#retransmission timeout duration
+TIMEOUT = 0.05		#initial retransmission timeout duration
 TWAIT = 10*TIMEOUT 	#TimeWait duration
+RTO_MIN = 0.05		#default lower bound of the adaptive retransmission timeout, see network_init()
+RTO_MAX = 2.0		#default upper bound of the adaptive retransmission timeout
+ACK_DELAY = 0.002	#max time an ACK for in-order DATA may be delayed
+CWND_INIT = 2		#initial congestion window, in packets
+SESSION_WAIT = max(TWAIT, 2*RTO_MAX)	#TimeWait of a listener's session, outlasts any peer RTO
+SESSION_IDLE = 30*RTO_MAX	#a listener releases a session whose peer has been silent this long
+IO_QUEUE = 64		#default length of the send and receive queues of the I/O thread
+MMSG_BATCH = 64		#max no. of datagrams sent or received by one sendmmsg()/recvmmsg() call
+TRACE_EVENTS = 4096	#default no. of recent events kept by the event trace
+RTT_SAMPLES = 1000	#no. of recent RTT samples kept for the percentiles of stats()
+CWND_SAMPLES = 10000	#no. of recent congestion window changes kept in cwnd_trace
+STATS_INTERVAL = 10.0	#default time between two exports of stats_export()
+SEGMENT_MIN = 64	#default lower bound of the adaptive segment size
+SEGMENT_EPOCH = 128	#no. of acked DATA packets between two adaptive segment size decisions
+SEGMENT_STEP = 1.5	#factor by which adaptive sizing grows or shrinks the segment size
+SEGMENT_RATIO_MAX = 0.25	#adaptive sizing does not grow the segments past this retransmitted share, see __segment_adapt()
 
-#store peer address info
-__peeraddr = ()		#set by rdt_peer()
-#define the error rates and window size
-__LOSS_RATE = 0.0	#set by rdt_network_init()
-__ERR_RATE = 0.0
-__W = 1
+#the counters of a connection, see RDTSocket.stats(): key, Prometheus
+#metric name, labels and help text
+COUNTERS = [
+	("packets_sent", "rdt_packets_sent_total", "", "Datagrams handed to the unreliable layer"),
+	("bytes_sent", "rdt_bytes_sent_total", "", "Bytes handed to the unreliable layer"),
+	("packets_received", "rdt_packets_received_total", "", "Datagrams received from the peer"),
+	("bytes_received", "rdt_bytes_received_total", "", "Bytes received from the peer"),
+	("data_sent", "rdt_data_packets_sent_total", "", "New DATA packets sent, not counting retransmissions"),
+	("retransmits_timeout", "rdt_retransmits_total", 'kind="timeout"', "DATA packets retransmitted"),
+	("retransmits_fast", "rdt_retransmits_total", 'kind="fast"', "DATA packets retransmitted"),
+	("corrupted", "rdt_corrupted_packets_total", "", "Packets dropped for a bad checksum"),
+	("duplicates", "rdt_duplicate_packets_total", "", "DATA packets received again"),
+	("out_of_order", "rdt_out_of_order_packets_total", "", "DATA packets received ahead of the expected one"),
+	("bytes_acked", "rdt_acked_bytes_total", "", "Payload bytes sent and acknowledged"),
+	("bytes_delivered", "rdt_delivered_bytes_total", "", "Payload bytes received in order"),
+	("segment_changes", "rdt_segment_changes_total", "", "Changes of the segment size by adaptive sizing"),
+]
 
+#version 1 header: type, 8-bit seqNo., checksum, payload length
+#version 2 header: type, version, checksum, payload length, 32-bit seqNo.
 message_format = struct.Struct('BBHH')
-HEADER = 6
-next_num = 0
-expect_num = 0
-base_num = 0
-buffer=[]
-N = 1
-
-#internal functions - being called within the module
-def __udt_send(sockd, peer_addr, byte_msg):
-	"""This function is for simulating packet loss or corruption in an unreliable channel.
-
-	Input arguments: Unix socket object, peer address 2-tuple and the message
-	Return  -> size of data sent, -1 on error
-	Note: it does not catch any exception
-	"""
-	global __LOSS_RATE, __ERR_RATE
-	if peer_addr == ():
-		print("Socket send error: Peer address not set yet")
-		return -1
-	else:
-		#Simulate packet loss
-		drop = random.random()
-		if drop < __LOSS_RATE:
-			#simulate packet loss of unreliable send
-			print("WARNING: udt_send: Packet lost in unreliable layer!!")
-			return len(byte_msg)
-
-		#Simulate packet corruption
-		corrupt = random.random()
-		if corrupt < __ERR_RATE:
-			err_bytearr = bytearray(byte_msg)
-			pos = random.randint(0,len(byte_msg)-1)
-			val = err_bytearr[pos]
-			if val > 1:
-				err_bytearr[pos] -= 2
-			else:
-				err_bytearr[pos] = 254
-			err_msg = bytes(err_bytearr)
-			print("WARNING: udt_send: Packet corrupted in unreliable layer!!")
-			return sockd.sendto(err_msg, peer_addr)
-		else:
-			return sockd.sendto(byte_msg, peer_addr)
+message_format2 = struct.Struct('<BBHHI')
+#a SACK block in the ACK payload: first and last seqNo. of a received range
+sack_format = struct.Struct('BB')
+sack_format2 = struct.Struct('<II')
+SACK_BLOCKS = 4		#max no. of SACK blocks in an ACK
 
-def __udt_recv(sockd, length):
-	"""Retrieve message from underlying layer
+#the messages of the RDT layer, per packet at DEBUG level; it has no output
+#of its own until the application sets up logging, e.g. logging.basicConfig()
+logger = logging.getLogger("rdt4")
+logger.addHandler(logging.NullHandler())
+
+#events of the event trace, see EventTrace; the value recorded with each
+EV_DATA_SENT = 1	#payload length
+EV_TIMEOUT = 2		#retransmission timeout after the backoff, in microseconds
+EV_FAST_RETX = 3	#no. of duplicate ACKs
+EV_ACK_RECV = 4		#no. of packets in the window when it came
+EV_DATA_RECV = 5	#seqNo. expected when it came
+EV_CORRUPT = 6		#packet length (the seqNo. is the packet type)
+EV_ACK_SENT = 7		#SACK blocks length
+EV_LOST = 8			#packet length, dropped by the unreliable layer
+EV_DAMAGED = 9		#packet length, corrupted by the unreliable layer
+EV_CWND = 10		#ssthresh (the seqNo. is cwnd in 1/1000 packets)
+EV_SEGMENT = 11		#new segment size (the seqNo. is the retransmission ratio in 1/1000000)
 
-	Input arguments: Unix socket object and the max amount of data to be received
-	Return  -> the received bytes message object
-	Note: it does not catch any exception
-	"""
-	(rmsg, peer) = sockd.recvfrom(length)
-	return rmsg
 
-def __IntChksum(byte_msg):
-	"""Implement the Internet Checksum algorithm
+class EventTrace:
+	"""A fixed-size ring buffer of the recent protocol events of a
+	connection, see RDTSocket.trace_start().
 
-	Input argument: the bytes message object
-	Return  -> 16-bit checksum value
-	Note: it does not check whether the input object is a bytes object
+	Each event is a binary record of (time, event, seqNo., value) packed
+	into a preallocated bytearray, so recording one allocates nothing; the
+	oldest events are overwritten. dump() turns them into text, e.g. after
+	something went wrong.
 	"""
-	total = 0
-	length = len(byte_msg)	#length of the byte message object
-	i = 0
-	while length > 1:
-		total += ((byte_msg[i+1] << 8) & 0xFF00) + ((byte_msg[i]) & 0xFF)
-		i += 2
-		length -= 2
+	record = struct.Struct('<dBIq')
+	names = {EV_DATA_SENT: "data_sent", EV_TIMEOUT: "timeout", EV_FAST_RETX: "fast_retx",
+		EV_ACK_RECV: "ack_recv", EV_DATA_RECV: "data_recv", EV_CORRUPT: "corrupt",
+		EV_ACK_SENT: "ack_sent", EV_LOST: "lost", EV_DAMAGED: "damaged", EV_CWND: "cwnd",
+		EV_SEGMENT: "segment"}
 
-	if length > 0:
-		total += (byte_msg[i] & 0xFF)
+	def __init__(self, size):
+		self.size = max(int(size), 1)
+		self.buf = bytearray(self.size * self.record.size)
+		self.count = 0		#no. of events recorded so far
 
-	while (total >> 16) > 0:
-		total = (total & 0xFFFF) + (total >> 16)
+	def add(self, event, seq, value=0):
+		"""Record an event with a seqNo. and a value"""
+		self.record.pack_into(self.buf, (self.count % self.size) * self.record.size, time.monotonic(), event, seq, value)
+		self.count += 1
 
-	total = ~total
+	def events(self):
+		"""Return the events kept, oldest first, as (time, event, seqNo., value)"""
+		first = max(self.count - self.size, 0)
+		return [self.record.unpack_from(self.buf, (i % self.size) * self.record.size) for i in range(first, self.count)]
 
-	return total & 0xFFFF
+	def dump(self, fobj):
+		"""Write the events kept to a text file object, one per line with
+		its time relative to the last event
 
+		Return  -> the no. of events written
+		"""
+		events = self.events()
+		if events:
+			last = events[-1][0]
+			fobj.write("rdt4 event trace: last %d of %d events\n" % (len(events), self.count))
+		for (t, event, seq, value) in events:
+			fobj.write("%+.6f %-10s %10d %12d\n" % (t - last, self.names.get(event, event), seq, value))
+		return len(events)
 
-#These are the functions used by appliation
 
-def rdt_network_init(drop_rate, err_rate, W):
-	"""Application calls this function to set properties of underlying network.
+class ReorderRing:
+	"""The out-of-order DATA packets held by a receiver (SR or SACK): a
+	ring of W slots, indexed by the offset of the seqNo. from the next one
+	expected, and an occupancy bitmap with bit i set when the packet at
+	offset i is held.
 
-    Input arguments: packet drop probability, packet corruption probability and Window size
+	Checking for a packet, keeping one and taking the next one in order
+	are O(1), and the held ranges come out of the bitmap in order, for the
+	SACK blocks, without sorting.
 	"""
-	random.seed()
-	global __LOSS_RATE, __ERR_RATE, __W
-	__LOSS_RATE = float(drop_rate)
-	__ERR_RATE = float(err_rate)
-	__W = int(W)
-	print("Drop rate:", __LOSS_RATE, "\tError rate:", __ERR_RATE, "\tWindow size:", __W)
 
-def rdt_socket():
-	"""Application calls this function to create the RDT socket.
+	def __init__(self, size):
+		self.slots = [None] * size
+		self.head = 0		#slot of offset 0, the packet expected next
+		self.bits = 0		#occupancy bitmap
 
-	Null input.
-	Return the Unix socket object on success, None on error
+	def __bool__(self):
+		return self.bits != 0
 
-	Note: Catch any known error and report to the user.
-	"""
-	######## Your implementation #######
-	#reuse Part 2 implementation
-	try:
-		sd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-	except socket.error as emsg:
-		print("Socket creation error: ", emsg)
-		return None
-	return sd
+	def held(self, offset):
+		"""Return True if the packet at offset (< size) is held"""
+		return (self.bits >> offset) & 1 == 1
 
+	def put(self, offset, rmsg):
+		"""Keep the packet at offset (< size)"""
+		slots = self.slots
+		slots[(self.head + offset) % len(slots)] = rmsg
+		self.bits |= 1 << offset
 
-def rdt_bind(sockd, port):
-	"""Application calls this function to specify the port number
-	used by itself and assigns them to the RDT socket.
+	def pop(self):
+		"""Take the packet at offset 0, which must be held, and move the
+		ring on to the next seqNo."""
+		slots = self.slots
+		rmsg = slots[self.head]
+		slots[self.head] = None
+		self.head = (self.head + 1) % len(slots)
+		self.bits >>= 1
+		return rmsg
 
-	Input arguments: RDT socket object and port number
-	Return	-> 0 on success, -1 on error
+	def runs(self, limit):
+		"""Return up to limit (first, last) offsets of the ranges of held
+		packets, nearest first"""
+		runs = []
+		bits = self.bits
+		base = 0
+		while bits and len(runs) < limit:
+			#skip to the lowest set bit, then over the run of ones from it
+			first = (bits & -bits).bit_length() - 1
+			bits >>= first
+			length = (~bits & (bits + 1)).bit_length() - 1
+			runs.append((base + first, base + first + length - 1))
+			bits >>= length
+			base += first + length
+		return runs
 
-	Note: Catch any known error and report to the user.
+
+class _RxSlot(bytearray):
+	"""A slot of the receive buffer pool, which knows its own address for
+	recvmmsg(); it is never resized, so the address stays valid
 	"""
-	######## Your implementation #######
-	#reuse Part 2 implementation
+	__slots__ = ("address", )
+
+	def __init__(self, length):
+		super().__init__(length)
+		self.address = ctypes.addressof((ctypes.c_char * length).from_buffer(self))
+
+
+#sendmmsg() and recvmmsg() of the Linux C library, which send or receive
+#many datagrams in one system call; None where they are not available
+class _IOVec(ctypes.Structure):
+	#c_char_p takes a bytes object to send as it is, or an address to fill
+	_fields_ = [("iov_base", ctypes.c_char_p), ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+	_fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+		("msg_iov", ctypes.POINTER(_IOVec)), ("msg_iovlen", ctypes.c_size_t),
+		("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+		("msg_flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+	_fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+SOCKADDR_IN = 16	#size of struct sockaddr_in
+_libc = None
+if sys.platform.startswith("linux"):
 	try:
-		sockd.bind(("",port))
-	except socket.error as emsg:
-		print("Socket bind error: ", emsg)
-		return -1
-	return 0
+		_libc = ctypes.CDLL(None, use_errno=True)
+		_libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+		_libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+	except (OSError, AttributeError):
+		#e.g. a C library without them
+		_libc = None
+	#the path MTU of a connected socket, see RDTSocket.peer(); the socket
+	#module of older Pythons does not define them
+	_IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+	_IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+	_IP_MTU = getattr(socket, "IP_MTU", 14)
+else:
+	_IP_MTU = None
 
-def rdt_peer(peer_ip, port):
-	"""Application calls this function to specify the IP address
-	and port number used by remote peer process.
 
-	Input arguments: peer's IP address and port number
+class RDTSocket:
+	"""One RDT connection: it owns its UDP socket, the peer address, the
+	network properties and all the sequence state, buffers and timers, so
+	a process can hold as many connections as it likes.
+
+	The methods are the rdt_* functions of this module without the
+	socket argument, e.g. conn.send(byte_msg) for rdt_send(sockd, byte_msg).
 	"""
-	######## Your implementation #######
-	#reuse Part 2 implementation
-	global __peeraddr
-	__peeraddr = (peer_ip, port)
 
-def rdt_send(sockd, byte_msg):
-	"""Application calls this function to transmit a message (up to
-	W * PAYLOAD bytes) to the remote peer through the RDT socket.
+	def __init__(self):
+		#store peer address info
+		self.__peeraddr = ()	#set by peer()
+		self.sockd = None		#set by socket()
+		#define the error rates, window size and ARQ mode
+		self.__LOSS_RATE = 0.0	#set by network_init()
+		self.__ERR_RATE = 0.0
+		self.emulator = netem.NetEm()	#the unreliable channel, see __udt_send()
+		self.__W = 1
+		self.__MODE = "GBN"		#"GBN" for Go-Back-N or "SR" for Selective Repeat
+		self.__VERSION = 1		#packet header version, 1 or 2
+		self.__SACK = False		#whether the receiver keeps out-of-order packets and sends SACK blocks
+		self.__ONE_TIMER = True	#plain GBN: one timer, for the oldest packet, instead of one per packet
+		self.__ACK_EVERY = 1	#GBN mode: ACK once every __ACK_EVERY in-order DATA packets
+		self.__DUP_ACKS = 3		#fast retransmit after this many duplicate ACKs, 0 to disable
+		self.__CC = False		#whether AIMD congestion control limits the packets in flight
+		self.__BATCH = False	#whether to send and receive datagrams in batches (Linux)
+		self.__RTO_MIN = RTO_MIN	#bounds of the adaptive retransmission timeout
+		self.__RTO_MAX = RTO_MAX
+		self.__SESSION_WAIT = SESSION_WAIT	#TimeWait of a listener's session and its idle timeout,
+		self.__SESSION_IDLE = SESSION_IDLE	#both outlast 2 rto_max
+		self.HEADER = 6			#header size of the selected version
+		self.SEQ_MOD = 256		#size of the sequence number space of the selected version
+		self.PAYLOAD = PAYLOAD	#max payload of a DATA packet, set by network_init()
+		self.__PROBE = False	#whether peer() limits the segments sent to what crosses the path unfragmented
+		self.__ADAPT = False	#whether the segment size adapts to the retransmissions
+		self.__SEGMENT_MIN = SEGMENT_MIN	#lower bound of the adaptive segment size
+		self.__SEGMENT_MAX = PAYLOAD	#upper bound of the segment size, PAYLOAD unless lowered by probing
 
-	Input arguments: RDT socket object and the message bytes object
-	Return  -> size of data sent on success, -1 on error
+		self.next_num = 0		#sequence number of the next new DATA packet
+		self.expect_num = 0		#sequence number of the next expected DATA packet
+		self.base_num = 0		#sequence number of the oldest unacked DATA packet
+		self.buffer = collections.deque()	#received DATA packets not yet taken by recv()
+		#unacked DATA packets, window[0] has seqNo. base_num; each one is a dict of
+		#its seqNo. "seq", [header, payload] "bufs", last send time "sent", "tries",
+		#the expiry time of its retransmission timer "deadline" (None if it has
+		#none, see __timer_start()) and the adaptive
+		#sizing epoch it was sent in "epoch"
+		self.window = collections.deque()
+		self.timers = []		#heap of (deadline, seqNo.) of the retransmission timers
+		self.srtt = None		#smoothed round-trip time, None until the first sample
+		self.rttvar = 0.0		#round-trip time variation
+		self.rto = TIMEOUT		#current retransmission timeout
+		self.acked_nums = set()	#seqNo. of the packets in window acked out of order (SR or SACK)
+		self.reorder = ReorderRing(1)	#out-of-order DATA packets received (SR or SACK), sized by network_init()
+		self.ack_pending = 0	#no. of in-order DATA packets received but not yet acked
+		self.ack_deadline = 0.0	#when the delayed ACK for them has to be sent
+		self.dup_count = 0		#no. of duplicate ACKs received since the window last slid
+		self.fast_retransmits = 0	#no. of packets resent by fast retransmit
+		self.cwnd = CWND_INIT	#congestion window, in packets (AIMD congestion control)
+		self.ssthresh = 1		#slow start threshold, set to W by network_init()
+		self.cwnd_start = 0.0	#time when network_init() was called
+		self.cwnd_trace = collections.deque(maxlen=CWND_SAMPLES)	#(seconds since cwnd_start, cwnd, ssthresh) at each recent cwnd change
+		self.trace = None		#EventTrace of the recent events, None if off (see trace_start())
 
-	Note: (1) This function will return only when it knows that the
-	whole message has been successfully delivered to remote process.
-	(2) Catch any known error and report to the user.
-	"""
-	######## Your implementation #######
-	global PAYLOAD, HEADER, __peeraddr, message_format, next_num, expect_num, base_num, buffer, N
-
-	#determines how many packets (N) it is going to be transmitted
-	N = -(-len(byte_msg) // PAYLOAD)  #upside-down floor division= ceiling division
-	total_size = len(byte_msg)
-
-	send_pkt = [1] * N
-	pointer = 0 # pointing to the first unacked packet
-	base_num = next_num
-
-	for i in range(N):
-		#Make sure the data sent is not longer than the maximum PAYLOAD length.
-		if (len(byte_msg) > PAYLOAD):
-			msg = byte_msg[0:PAYLOAD]
-			byte_msg = byte_msg[PAYLOAD:]
+		#adaptive segment sizing (see __segment_adapt())
+		self.segment = PAYLOAD	#payload size of the new DATA packets, PAYLOAD unless adaptive
+		self.segment_epoch = 0	#no. of the current epoch, every DATA packet records the one it is sent in
+		self.segment_acked = 0	#no. of DATA packets of the epoch acked so far
+		self.segment_tries = 0	#no. of times they were sent
+		self.segment_bytes = 0	#their payload bytes
+		self.segment_start = 0.0	#when the epoch started
+		self.segment_up = True	#whether the next change grows the segment size
+		self.segment_score = None	#goodput of the last epoch, None before the first
+		self.segment_ratio = None	#retransmission ratio of the last epoch
+
+		#statistics (see stats())
+		self.counters = dict.fromkeys([key for (key, name, labels, text) in COUNTERS if key != "retransmits_fast"], 0)
+		self.rtt_samples = collections.deque(maxlen=RTT_SAMPLES)	#recent RTT samples
+		self.rtt_min = None		#smallest RTT sample
+		self.rtt_sum = 0.0		#sum and no. of all the RTT samples
+		self.rtt_count = 0
+		self.data_start = None	#when the first DATA packet was sent or received
+		self.data_last = 0.0	#when new data was last acked or delivered
+		self.stats_file = None	#file name of stats_export(), None if off
+		self.stats_interval = STATS_INTERVAL
+		self.stats_next = 0.0	#when to export the next time
+
+		#listener mode, many peers over one socket (see listen())
+		self.listener = None	#the listener a session belongs to, None if standalone
+		self.sessions = None	#listener: the session of each peer, keyed by address
+		self.ready = collections.deque()	#listener: sessions with messages for recvfrom()
+		self.session_timers = []	#listener: heap of (deadline, id, session) of the sessions' timers
+		self.closing = False	#session: close() was called, remove it once quiet
+		self.quiet_until = 0.0	#session: when it may be removed after close()
+		self.heard = 0.0		#session: when the last datagram came from the peer
+		self.idle_at = 0.0		#session: when the listener next checks whether it is idle
+
+		#I/O thread mode, the protocol runs in a thread of its own (see start_io())
+		self.io_thread = None	#the I/O thread, None if not started
+		self.send_queue = None	#messages passed to send(), not yet in the window
+		self.recv_queue = None	#DATA packets delivered in order, not yet taken by recv()
+		self.__io_cond = threading.Condition()	#notified by the I/O thread at every step, held while it processes packets
+		self.__io_wake = None	#socket pair through which the application wakes the I/O thread
+		self.__io_stop = False	#set by close() to stop the I/O thread
+		self.__io_error = False	#set by the I/O thread when it fails
+
+		#batched datagram I/O (see __udt_flush())
+		self.__tx_queue = []	#(datagram, peer address) queued by __udt_send(), on the socket's owner
+		self.__tx_names = {}	#address of the sockaddr structure of each peer sent to
+		self.__tx_batch = None	#(mmsghdr array, iovec array, sockaddr buffers) for sendmmsg()
+		self.__rx_batch = None	#(mmsghdr array, iovec array, slot of each, name buffer, length,
+								#no. of entries used by the last call, peer of each sockaddr) for recvmmsg()
+
+		#receive buffer pool, on the socket's owner (see __rx_slot())
+		self.__rx_pool = []		#free bytearray slots for incoming datagrams
+		self.__rx_size = 0		#size of the slots in the pool
+
+	#internal functions - being called within the class
+	def __udt_send(self, byte_msg):
+		"""This function is for simulating an unreliable channel: the network
+		emulator decides whether the datagram is lost, corrupted, delayed or
+		duplicated, see netem.NetEm.
+
+		Input argument: the message, which is either a bytes-like object or
+		a list of bytes-like objects (e.g. [header, payload]) to be sent
+		together as one datagram to the peer
+		Return  -> size of data sent, -1 on error
+		Note: it does not catch any exception; with batched I/O on, the
+		datagram is only queued until the next __udt_flush()
+		"""
+		sockd = self.sockd
+		peer_addr = self.__peeraddr
+		batch = self.__batch_owner()
+		if peer_addr == ():
+			logger.error("Socket send error: Peer address not set yet")
+			return -1
+		else:
+			if isinstance(byte_msg, (list, tuple)):
+				buffers = byte_msg
+			else:
+				buffers = [byte_msg]
+			length = sum(len(buf) for buf in buffers)
+			counters = self.counters
+			counters["packets_sent"] += 1
+			counters["bytes_sent"] += length
+
+			fate = self.emulator.decide(length, time.monotonic())
+			if fate is netem.INTACT:
+				return self.__udt_out(sockd, buffers, peer_addr, batch)
+			if not fate:
+				#simulate packet loss of unreliable send
+				logger.debug("udt_send: Packet lost in unreliable layer!!")
+				if self.trace is not None:
+					self.trace.add(EV_LOST, 0, length)
+				return length
+			for (delay, pos) in fate:
+				datagram = b''.join(buffers)
+				if pos >= 0:
+					#Simulate packet corruption
+					err_bytearr = bytearray(datagram)
+					val = err_bytearr[pos]
+					if val > 1:
+						err_bytearr[pos] -= 2
+					else:
+						err_bytearr[pos] = 254
+					datagram = bytes(err_bytearr)
+					logger.debug("udt_send: Packet corrupted in unreliable layer!!")
+					if self.trace is not None:
+						self.trace.add(EV_DAMAGED, 0, length)
+				if delay > 0:
+					#the delay line sends it when it is due
+					self.emulator.post(delay, sockd, datagram, peer_addr)
+				else:
+					self.__udt_out(sockd, [datagram], peer_addr, batch)
+			return length
+
+	def __udt_out(self, sockd, buffers, peer_addr, batch):
+		"""Send one datagram to the peer, queue it if sending in batches
+
+		Input arguments: the socket, the list of bytes-like objects making
+		up the datagram, the peer's address and the batch owner (or None)
+		Return  -> size of data sent
+		Note: it does not catch any exception
+		"""
+		if batch is not None:
+			#sent by __udt_flush() together with the other queued datagrams
+			datagram = b''.join(buffers)
+			batch.__tx_queue.append((datagram, peer_addr))
+			return len(datagram)
+		elif len(buffers) == 1:
+			return sockd.sendto(buffers[0], peer_addr)
+		elif hasattr(sockd, "sendmsg"):
+			#scatter-gather send, the kernel assembles the datagram
+			return sockd.sendmsg(buffers, [], 0, peer_addr)
+		else:
+			#no sendmsg() on this platform (e.g. Windows)
+			return sockd.sendto(b''.join(buffers), peer_addr)
+
+	def __udt_recv(self, length):
+		"""Retrieve message from underlying layer
+
+		Input argument: the max amount of data to be received
+		Return  -> (the received message, peer address); the message is a
+		memoryview of a slot of the receive buffer pool, see __rx_slot()
+		Note: it does not catch any exception
+		"""
+		slot = self.__rx_slot(length)
+		(nbytes, peer) = self.sockd.recvfrom_into(slot)
+		return (memoryview(slot)[:nbytes], peer)
+
+	def __rx_slot(self, length):
+		"""Take a free slot from the receive buffer pool of the socket.
+
+		Datagrams are read into reusable bytearray slots and passed on as
+		memoryviews of them, so a packet costs no allocation. A slot is
+		given back by __rx_release() once its packet is dropped or its
+		payload has been copied out by recv(). The pool starts with room
+		for a window of packets and a batch, and grows when they are all
+		held, e.g. by a slow application.
+
+		Input argument: the max amount of data to be received
+		Return  -> the bytearray slot, an _RxSlot
+		"""
+		owner = self if self.listener is None else self.listener
+		pool = owner.__rx_pool
+		if owner.__rx_size != length:
+			owner.__rx_size = length
+			pool[:] = [_RxSlot(length) for i in range(owner.__W + MMSG_BATCH)]
+		try:
+			return pool.pop()
+		except IndexError:
+			return _RxSlot(length)
+
+	def __rx_release(self, rmsg):
+		"""Give the slot of a packet back to the receive buffer pool
+
+		Input argument: the packet, as returned by __udt_recv(); a bytes
+		object from an outside event loop is left alone
+		"""
+		if isinstance(rmsg, memoryview):
+			owner = self if self.listener is None else self.listener
+			slot = rmsg.obj
+			if isinstance(slot, _RxSlot) and len(slot) == owner.__rx_size:
+				owner.__rx_pool.append(slot)
+
+	def __batch_owner(self):
+		"""Return the RDTSocket object owning the socket, which keeps the
+		queue of datagrams to send, if batched I/O is on; None if it is off
+		or not available (not on Linux, or an outside event loop's transport)
+		"""
+		owner = self if self.listener is None else self.listener
+		if owner.__BATCH and _libc is not None and isinstance(owner.sockd, socket.socket):
+			return owner
+		return None
+
+	def __udt_flush(self):
+		"""Send the datagrams queued by __udt_send(), MMSG_BATCH at a time
+		with one sendmmsg() call each.
+
+		It is called before waiting for the socket and before returning to
+		the application, so no datagram is held up for long.
+		Note: it does not catch any exception
+		"""
+		owner = self if self.listener is None else self.listener
+		pending = owner.__tx_queue
+		if not pending:
+			return
+		if owner.__tx_batch is None:
+			#the headers are set up once and reused by every call
+			hdrs = (_MMsgHdr * MMSG_BATCH)()
+			iovs = (_IOVec * MMSG_BATCH)()
+			for i in range(MMSG_BATCH):
+				hdrs[i].msg_hdr.msg_namelen = SOCKADDR_IN
+				hdrs[i].msg_hdr.msg_iov = ctypes.pointer(iovs[i])
+				hdrs[i].msg_hdr.msg_iovlen = 1
+			owner.__tx_batch = (hdrs, iovs, [])
+		(hdrs, iovs, names) = owner.__tx_batch
+		fd = owner.sockd.fileno()
+		while pending:
+			count = min(len(pending), MMSG_BATCH)
+			for i in range(count):
+				(datagram, peer_addr) = pending[i]
+				name = owner.__tx_names.get(peer_addr)
+				if name is None:
+					#resolve it once, the peer may be given by name
+					host = socket.gethostbyname(peer_addr[0])
+					sockaddr = ctypes.create_string_buffer(struct.pack('=H', socket.AF_INET) +
+						struct.pack('!H', peer_addr[1]) + socket.inet_aton(host), SOCKADDR_IN)
+					names.append(sockaddr)
+					name = owner.__tx_names[peer_addr] = ctypes.addressof(sockaddr)
+				iov = iovs[i]
+				iov.iov_base = datagram
+				iov.iov_len = len(datagram)
+				hdrs[i].msg_hdr.msg_name = name
+			sent = _libc.sendmmsg(fd, hdrs, count, 0)
+			if sent < 0:
+				err = ctypes.get_errno()
+				del pending[:]
+				raise OSError(err, os.strerror(err))
+			del pending[:sent]
+
+	def __udt_recv_batch(self, length):
+		"""Retrieve the datagrams waiting in the socket, with one recvmmsg()
+		call for up to MMSG_BATCH of them if batched I/O is on.
+
+		Input argument: the max amount of data to be received per datagram
+		Return  -> list of (the received bytes message object, peer address)
+		Note: it does not catch any exception; call it only when select()
+		has found the socket readable
+		"""
+		owner = self.__batch_owner()
+		if owner is None:
+			return [self.__udt_recv(length)]
+		if self.__rx_batch is None or self.__rx_batch[4] != length:
+			#the headers are set up once and reused by every call, each
+			#datagram goes straight into a slot of the receive buffer pool
+			hdrs = (_MMsgHdr * MMSG_BATCH)()
+			iovs = (_IOVec * MMSG_BATCH)()
+			names = ctypes.create_string_buffer(MMSG_BATCH * SOCKADDR_IN)
+			for i in range(MMSG_BATCH):
+				iovs[i].iov_len = length
+				hdrs[i].msg_hdr.msg_name = ctypes.addressof(names) + i * SOCKADDR_IN
+				hdrs[i].msg_hdr.msg_iov = ctypes.pointer(iovs[i])
+				hdrs[i].msg_hdr.msg_iovlen = 1
+			#every entry needs a slot, as if all of them had just been used
+			self.__rx_batch = (hdrs, iovs, [None] * MMSG_BATCH, names, length, MMSG_BATCH, {})
+		(hdrs, iovs, slots, names, length, used, peers) = self.__rx_batch
+		for i in range(used):
+			#the slot before it was handed over with its packet
+			slot = slots[i] = self.__rx_slot(length)
+			iovs[i].iov_base = slot.address
+			hdrs[i].msg_hdr.msg_namelen = SOCKADDR_IN
+		count = _libc.recvmmsg(self.sockd.fileno(), hdrs, MMSG_BATCH, socket.MSG_DONTWAIT, None)
+		if count < 0:
+			err = ctypes.get_errno()
+			self.__rx_batch = self.__rx_batch[:5] + (0, peers)
+			if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return []
+			raise OSError(err, os.strerror(err))
+		self.__rx_batch = self.__rx_batch[:5] + (count, peers)
+		rmsgs = []
+		raw = names.raw
+		for i in range(count):
+			#the port and IPv4 address of the sockaddr_in structure
+			name = raw[i*SOCKADDR_IN+2:i*SOCKADDR_IN+8]
+			peer = peers.get(name)
+			if peer is None:
+				peer = peers[name] = (socket.inet_ntoa(name[2:]), struct.unpack('!H', name[:2])[0])
+			rmsgs.append((memoryview(slots[i])[:hdrs[i].msg_len], peer))
+		return rmsgs
+
+	@staticmethod
+	def __IntChksum(*byte_msgs):
+		"""Implement the Internet Checksum algorithm
+
+		Input argument: the bytes message object, or the consecutive parts of
+		the message (e.g. header and payload) as separate bytes-like objects;
+		every part except the last one must be of even length
+		Return  -> 16-bit checksum value
+		Note: it does not check whether the input object is a bytes object
+
+		Instead of adding up the 16-bit words one by one, the whole message is
+		read as a single little-endian integer. As 2**16 == 1 (mod 0xFFFF),
+		that integer modulo 0xFFFF is the folded one's complement sum of the
+		words, the odd trailing byte (if any) being counted as a low byte.
+		For the same reason the parts can be summed up separately.
+		The only difference is that folding never gives 0 for a non-zero sum
+		but 0xFFFF, which is fixed up below.
+		"""
+		value = 0
+		for byte_msg in byte_msgs:
+			value += int.from_bytes(byte_msg, 'little')
+		total = value % 0xFFFF
+		if total == 0 and value != 0:
+			total = 0xFFFF
+
+		total = ~total
+
+		return total & 0xFFFF
+
+
+	def __pack_header(self, ptype, seq, chksum, length):
+		"""Build a packet header in the selected header version
+
+		Input arguments: packet type, sequence number, checksum and payload length
+		Return  -> the header bytes object
+		"""
+		if self.__VERSION == 1:
+			return message_format.pack(ptype, seq, chksum, length)
+		else:
+			return message_format2.pack(ptype, 2, chksum, length, seq)
+
+	def __unpack_header(self, rmsg):
+		"""Parse the header of a received packet in the selected header version
+
+		Input argument: the received bytes message object
+		Return  -> (type, seqNo., checksum, payload length); the type is 0 if
+		the packet is not of the selected header version, e.g. a version 1
+		ACK of a peer with another window size, or is shorter than its header
+		"""
+		if self.__VERSION == 1:
+			if len(rmsg) < message_format.size:
+				return (0, 0, 0, 0)
+			return message_format.unpack_from(rmsg)
+		if len(rmsg) < message_format2.size:
+			return (0, 0, 0, 0)
+		(rtype, rversion, rchksum, rlen, rseq) = message_format2.unpack_from(rmsg)
+		if rversion != 2:
+			rtype = 0
+		return (rtype, rseq, rchksum, rlen)
+
+	def __seq_offset(self, seq, base):
+		"""Serial number arithmetic: how far seq is ahead of base, modulo the
+		sequence number space (the result is in 0 .. SEQ_MOD-1)
+
+		Input arguments: the two sequence numbers
+		"""
+		return (seq - base) % self.SEQ_MOD
+
+	def __sack_blocks(self):
+		"""Build the SACK blocks for an ACK packet: the ranges of sequence
+		numbers kept in reorder, i.e. received beyond a gap, nearest first.
+
+		Return  -> the ACK payload, up to SACK_BLOCKS (start, end) pairs with
+		both ends inclusive, b'' if nothing is kept
+		"""
+		fmt = sack_format if self.__VERSION == 1 else sack_format2
+		base = self.expect_num
+		SEQ_MOD = self.SEQ_MOD
+		return b''.join(fmt.pack((base+first)%SEQ_MOD, (base+last)%SEQ_MOD) for (first, last) in self.reorder.runs(SACK_BLOCKS))
+
+	def __sack_mark(self, payload):
+		"""Mark the packets in the window reported by the SACK blocks of an
+		ACK as acked, so that they will not be retransmitted.
+
+		Input argument: the ACK payload
+		Note: the RTT is sampled from the last newly reported packet, if it
+		has not been retransmitted, as this ACK was sent when it arrived.
+		"""
+		fmt = sack_format if self.__VERSION == 1 else sack_format2
+		if len(payload) % fmt.size != 0:
+			return
+		newest = None
+		for (start, end) in fmt.iter_unpack(payload):
+			first = self.__seq_offset(start, self.base_num)
+			last = self.__seq_offset(end, self.base_num)
+			if first > last or last >= len(self.window):
+				continue
+			for i in range(first, last+1):
+				pkt = self.window[i]
+				if pkt["seq"] not in self.acked_nums:
+					self.acked_nums.add(pkt["seq"])
+					newest = pkt
+			logger.debug("rdt_send: SACK reports segments from %d to %d are received", start, end)
+		if newest is not None and newest["tries"] == 1:
+			self.__rtt_update(time.monotonic() - newest["sent"])
+
+	def __send_ack(self, seq):
+		"""Send an ACK packet with the given sequence number to the peer
+
+		Input argument: sequence number
+		Note: it does not catch any exception
+		"""
+		#in GBN mode any ACK we send covers the delayed ones
+		self.ack_pending = 0
+		blocks = self.__sack_blocks() if self.__SACK else b''
+		ackchk = self.__IntChksum(self.__pack_header(11, seq, 0, len(blocks)), blocks)
+		send_ack = self.__pack_header(11, seq, ackchk, len(blocks)) + blocks
+		if self.trace is not None:
+			self.trace.add(EV_ACK_SENT, seq, len(blocks))
+		self.__udt_send(send_ack)
+
+	def __ack_delayed(self):
+		"""Acknowledge one more in-order DATA packet in GBN mode; the
+		cumulative ACK is sent once __ACK_EVERY of them are pending or when
+		ACK_DELAY has passed since the first one, whichever comes first.
+
+		Note: it does not catch any exception
+		"""
+		self.ack_pending += 1
+		if self.ack_pending >= self.__ACK_EVERY:
+			self.__send_ack((self.expect_num-1)%self.SEQ_MOD)
+		elif self.ack_pending == 1:
+			self.ack_deadline = time.monotonic() + ACK_DELAY
+			self.__session_timer(self.ack_deadline)
+
+	def __session_timer(self, deadline):
+		"""Tell the listener, if this is one of its sessions, when the
+		session has to run __rdt_timer(); stale entries are harmless.
+
+		Input argument: the expiry time of a timer of this session
+		"""
+		if self.listener is not None:
+			self.listener.__session_timer_of(self, deadline)
+
+	def __rtt_update(self, sample):
+		"""Update the round-trip time estimators with a new RTT sample and
+		recompute the retransmission timeout (RFC 6298).
+
+		Input argument: the measured round-trip time in seconds
+		Note: by Karn's rule, samples must only come from packets which have
+		not been retransmitted, and a backed-off rto is kept until one
+		arrives, whatever else gets acked in between.
+		"""
+		self.rtt_samples.append(sample)
+		self.rtt_sum += sample
+		self.rtt_count += 1
+		if self.rtt_min is None or sample < self.rtt_min:
+			self.rtt_min = sample
+		if self.srtt is None:
+			self.srtt = sample
+			self.rttvar = sample / 2
+		else:
+			self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+			self.srtt = 0.875 * self.srtt + 0.125 * sample
+		self.rto = min(max(self.srtt + 4 * self.rttvar, self.__RTO_MIN), self.__RTO_MAX)
+
+	def __timer_start(self, pkt, start=None):
+		"""(Re)start the retransmission timer of a packet in the window; it
+		expires one rto after the packet was last sent, or after start.
+		In plain GBN mode only the oldest packet in the window has a timer.
+
+		Input arguments: the window entry of the packet, the time from which
+		the timer runs (None for when the packet was last sent)
+		"""
+		if self.__ONE_TIMER and pkt is not self.window[0]:
+			return
+		pkt["deadline"] = (pkt["sent"] if start is None else start) + self.rto
+		heapq.heappush(self.timers, (pkt["deadline"], pkt["seq"]))
+		self.__session_timer(pkt["deadline"])
+
+	def __timer_next(self):
+		"""Find the unacked packet whose retransmission timer expires first.
+
+		Timers of acked or since retransmitted packets are not removed from
+		the heap when that happens but are discarded here once they come up.
+		Return  -> the window entry of the packet, None if no timer is pending
+		"""
+		while self.timers:
+			(deadline, seq) = self.timers[0]
+			offset = self.__seq_offset(seq, self.base_num)
+			if offset < len(self.window) and seq not in self.acked_nums:
+				pkt = self.window[offset]
+				if pkt["deadline"] == deadline:
+					return pkt
+			heapq.heappop(self.timers)
+		return None
+
+	def __acked(self, pkt):
+		"""Count a DATA packet leaving the sender window acked, and with
+		adaptive sizing on, how many times it was sent"""
+		self.counters["bytes_acked"] += len(pkt["bufs"][1])
+		if self.__ADAPT and pkt["epoch"] == self.segment_epoch:
+			self.segment_acked += 1
+			self.segment_tries += pkt["tries"]
+			self.segment_bytes += len(pkt["bufs"][1])
+			if self.segment_acked >= SEGMENT_EPOCH:
+				self.__segment_adapt()
+
+	def __segment_adapt(self):
+		"""Adaptive segment sizing, at the end of an epoch: SEGMENT_EPOCH DATA
+		packets sent at the current segment size have been acked.
+
+		Longer segments take fewer packets, and so fewer checksums, system
+		calls and round trips, for the same data; but with bit errors the
+		longer a packet the likelier it is corrupted, and a corrupted DATA
+		packet, dropped by the receiver, costs the sender a retransmission
+		and often a timeout. The size keeps moving by SEGMENT_STEP in the same
+		direction while the goodput of the epoch improves, and turns back when
+		it gets clearly worse, so it settles around the best size for the link
+		within [segment_min, __SEGMENT_MAX]. As a step too far can cost many
+		timeouts, it does not grow while the retransmitted share of the epoch
+		is over SEGMENT_RATIO_MAX and has risen since the last one, i.e. the
+		packets are corrupted for their length; a loss which does not depend
+		on the length does not hold it back.
+		"""
+		ratio = 1.0 - self.segment_acked / self.segment_tries
+		now = time.monotonic()
+		score = self.segment_bytes / max(now - self.segment_start, 1e-6)
+		#turn back only on a drop larger than the noise between two epochs
+		if self.segment_score is not None and score < 0.95 * self.segment_score:
+			self.segment_up = not self.segment_up
+		corrupted = self.segment_ratio is not None and ratio > max(self.segment_ratio, SEGMENT_RATIO_MAX)
+		self.segment_score = score
+		self.segment_ratio = ratio
+		if self.segment_up and not corrupted:
+			segment = min(int(self.segment * SEGMENT_STEP), self.__SEGMENT_MAX)
+		elif self.segment_up:
+			segment = self.segment
+		else:
+			segment = max(math.ceil(self.segment / SEGMENT_STEP), self.__SEGMENT_MIN)
+		if segment != self.segment:
+			logger.info("Segment size: %d -> %d\tRetransmitted: %.2f%%", self.segment, segment, ratio * 100)
+			self.segment = segment
+			self.counters["segment_changes"] += 1
+		if self.trace is not None:
+			self.trace.add(EV_SEGMENT, int(ratio * 1000000), segment)
+		self.segment_epoch += 1
+		self.segment_acked = 0
+		self.segment_tries = 0
+		self.segment_bytes = 0
+		self.segment_start = now
+
+	def __fast_retransmit(self):
+		"""Retransmit the oldest unacked packet at once, without waiting for
+		its retransmission timer, as duplicate ACKs tell that it is missing;
+		in plain GBN mode the whole window, in order, as the receiver has
+		dropped the packets after it too.
+
+		Note: it does not catch any exception
+		"""
+		pkt = self.window[0]
+		logger.debug("rdt_send: Received %d duplicate ACKs!! Fast retransmit the packet %d", self.dup_count, pkt["seq"])
+		self.__cwnd_update(0, "fast")
+		if self.trace is not None:
+			self.trace.add(EV_FAST_RETX, pkt["seq"], self.dup_count)
+		#the plain GBN receiver has dropped the packets after it as well
+		for resend in (self.window if self.__ONE_TIMER else (pkt, )):
+			self.__udt_send(resend["bufs"])
+			resend["tries"] += 1
+			resend["sent"] = time.monotonic()
+			self.fast_retransmits += 1
+		self.__timer_start(pkt)
+
+	def __in_flight(self):
+		"""Return the number of packets in the sender window not yet acked"""
+		return len(self.window) - len(self.acked_nums)
+
+	def __window_full(self):
+		"""Check whether send() has to wait before sending a new packet:
+		the window holds W packets, or with congestion control on, cwnd
+		packets are in flight.
+		"""
+		if len(self.window) >= self.__W:
+			return True
+		return self.__CC and self.__in_flight() >= int(self.cwnd)
+
+	def __cwnd_update(self, acked, loss=None):
+		"""Adjust the congestion window (AIMD) and record it in cwnd_trace.
+
+		Input arguments: the no. of packets newly acked, which opens cwnd by
+		one per packet in slow start (cwnd < ssthresh) and by one per window
+		in congestion avoidance; or the loss event, "timeout" which resets
+		cwnd to one packet or "fast" (fast retransmit) which halves it.
+		Note: cwnd never grows beyond W, as send() cannot use more.
+		"""
+		if not self.__CC:
+			return
+		if loss is not None:
+			self.ssthresh = max(self.__in_flight() // 2, 2)
+			self.cwnd = 1 if loss == "timeout" else self.ssthresh
 		else:
-			msg = byte_msg
-			byte_msg = None
+			for i in range(acked):
+				self.cwnd += 1 if self.cwnd < self.ssthresh else 1 / self.cwnd
+			self.cwnd = min(self.cwnd, self.__W)
+		self.cwnd_trace.append((time.monotonic() - self.cwnd_start, self.cwnd, self.ssthresh))
+		if self.trace is not None:
+			self.trace.add(EV_CWND, int(self.cwnd * 1000), self.ssthresh)
+
+	def __rdt_timer(self):
+		"""Send the delayed ACK if its time is up, and retransmit every unacked
+		packet whose own retransmission timer has expired, backing off the
+		retransmission timeout. In plain GBN mode, where the receiver drops
+		anything behind a gap, the timer of the oldest packet sends the whole
+		window again, in order.
+
+		Return  -> 0 on success, -1 on error
+		"""
+		now = time.monotonic()
+		if self.ack_pending and now >= self.ack_deadline:
+			try:
+				self.__send_ack((self.expect_num-1)%self.SEQ_MOD)
+			except socket.error as emsg:
+				logger.error("Socket send error: %s", emsg)
+				return -1
+		pkt = self.__timer_next()
+		while pkt is not None and pkt["deadline"] <= now:
+			heapq.heappop(self.timers)
+			#exponential backoff, until an ACK gives a new RTT sample;
+			#only the oldest packet counts, not every packet of a lost burst
+			if pkt is self.window[0]:
+				self.rto = min(self.rto * 2, self.__RTO_MAX)
+				self.__cwnd_update(0, "timeout")
+			for resend in (self.window if self.__ONE_TIMER else (pkt, )):
+				logger.debug("rdt_send: Timeout!! Retransmit the packet %d again", resend["seq"])
+				self.counters["retransmits_timeout"] += 1
+				if self.trace is not None:
+					self.trace.add(EV_TIMEOUT, resend["seq"], int(self.rto * 1000000))
+				try:
+					self.__udt_send(resend["bufs"])
+				except socket.error as emsg:
+					logger.error("Socket send error: %s", emsg)
+					return -1
+				resend["tries"] += 1
+				resend["sent"] = time.monotonic()
+			self.__timer_start(pkt)
+			pkt = self.__timer_next()
+		return 0
+
+	def __rdt_wait(self, wait):
+		"""Wait for one incoming packet and process it.
 
-		checksum = __IntChksum(message_format.pack(12, next_num, 0, len(msg)) + msg)
+		This is the event loop shared by send(), recv(), flush() and close().
+		An ACK slides the sender window forward, a DATA packet is ACKed and,
+		once all packets before it have arrived, kept in buffer for recv().
+		In Selective Repeat mode or with SACK every unacked packet has its own
+		retransmission timer and is retransmitted alone when that timer
+		expires; in plain Go-Back-N mode only the oldest one has a timer,
+		restarted whenever the window slides, and its expiry sends the whole
+		window again.
 
-		send_pkt[i] = message_format.pack(12, next_num, checksum, len(msg)) + msg
+		In Go-Back-N mode ACKs are cumulative and the receiver drops anything
+		but the expected packet. In Selective Repeat mode each packet is ACKed
+		individually, the receiver keeps out-of-order packets in reorder and
+		the sender only retransmits the packets not yet acked.
+
+		ACKs which do not slide the window, i.e. duplicate cumulative ACKs in
+		Go-Back-N mode or ACKs of later packets in Selective Repeat mode, are
+		counted; after __DUP_ACKS of them the oldest packet is retransmitted
+		at once (fast retransmit) instead of after its timeout.
+
+		The retransmission timeout rto adapts to the RTT measured from the
+		ACKs and is doubled (up to rto_max) on every timeout until an ACK of
+		a packet sent only once gives a new RTT sample. The timer is checked
+		after every packet as well, so a flow of duplicate ACKs cannot hold
+		off a retransmission.
+
+		With congestion control on, newly acked packets open the congestion
+		window cwnd, a timeout closes it to one packet and a fast retransmit
+		halves it; send() keeps no more than cwnd packets in flight.
+
+		A session of a listener does not read the shared socket itself,
+		the listener's __poll() does it for all of its sessions.
+
+		With batched I/O on, all the datagrams waiting in the socket are
+		read with one recvmmsg() call and processed in turn, and what is to
+		be sent is queued and sent with sendmmsg() before waiting or
+		returning.
+
+		Input argument: the max time to wait when no packet is outstanding
+		(None for no limit)
+		Return  -> 1 if any packet was processed, 0 on timeout, -1 on error
+		"""
+		if self.listener is not None:
+			return self.listener.__poll(wait)
+
+		pkt = self.__timer_next()
+		if pkt is not None:
+			#do not sleep past the earliest retransmission timer
+			remain = max(pkt["deadline"] - time.monotonic(), 0)
+			if wait is None or remain < wait:
+				wait = remain
+		if self.ack_pending:
+			#nor past the delayed ACK timer
+			remain = max(self.ack_deadline - time.monotonic(), 0)
+			if wait is None or remain < wait:
+				wait = remain
+
+		try:
+			#e.g. the packets of send() which filled up the window
+			self.__udt_flush()
+		except socket.error as emsg:
+			logger.error("Socket send error: %s", emsg)
+			return -1
+
+		try:
+			Rready, Wready, Eready = select.select([self.sockd], [], [], wait)
+		except select.error as emsg:
+			logger.error("At select, caught an exception: %s", emsg)
+			return -1
+		except KeyboardInterrupt:
+			logger.error("At select, caught the KeyboardInterrupt")
+			return -1
+
+		status = 0
+		if Rready:
+			try:
+				rmsgs = self.__udt_recv_batch(self.PAYLOAD+self.HEADER)
+			except socket.error as emsg:
+				logger.error("Socket recv error: %s", emsg)
+				return -1
+			#the timers only after the whole batch, a later packet of it
+			#may well be the ACK a timer is waiting for
+			for (rmsg, peer) in rmsgs:
+				if self.__rdt_input(rmsg) < 0:
+					return -1
+			status = 1
+		if self.__rdt_timer() < 0:
+			return -1
 
 		try:
-			__udt_send(sockd, __peeraddr, send_pkt[i])
+			#the ACKs and retransmissions of this round
+			self.__udt_flush()
 		except socket.error as emsg:
-			print("Socket send error: ", emsg)
+			logger.error("Socket send error: %s", emsg)
 			return -1
+		if self.stats_file is not None:
+			self.__stats_tick()
+		return status
+
+	def __delivered(self, rmsg):
+		"""Append a DATA packet received in order to the buffer and count it"""
+		self.buffer.append(rmsg)
+		self.counters["bytes_delivered"] += len(rmsg) - self.HEADER
+		self.data_last = time.monotonic()
+
+	def __rdt_input(self, rmsg):
+		"""Process one packet received from the peer, see __rdt_wait().
+
+		Input argument: the received message, a bytes-like object
+		Return  -> 1 if the packet was of use to the connection, 0 if not,
+		e.g. corrupted or out of range, -1 on error
+
+		Note: a DATA packet which is kept goes into reorder or buffer as it
+		is, any other packet gives its receive buffer slot back at once.
+		"""
+		SEQ_MOD = self.SEQ_MOD
+		HEADER = self.HEADER
+		window = self.window
+		acked_nums = self.acked_nums
+		reorder = self.reorder
+		kept = False
+		used = False
+		counters = self.counters
+		counters["packets_received"] += 1
+		counters["bytes_received"] += len(rmsg)
+
+		#a datagram shorter than the header counts as corrupted
+		echk = self.__IntChksum(rmsg) if len(rmsg) >= HEADER else -1
+		(rtype, rseq, rchksum, rlen) = self.__unpack_header(rmsg)
+
+		if self.trace is not None:
+			if echk != 0:
+				self.trace.add(EV_CORRUPT, rtype, len(rmsg))
+			elif rtype == 11:
+				self.trace.add(EV_ACK_RECV, rseq, len(window))
+			elif rtype == 12:
+				self.trace.add(EV_DATA_RECV, rseq, self.expect_num)
+		if echk == 0 and rtype == 12 and self.data_start is None:
+			self.data_start = time.monotonic()
 
+		if echk != 0: #corrupted
+			counters["corrupted"] += 1
+			logger.debug("rdt_recv: Received a corrupted packet: Type = %d, Length = %d", rtype, len(rmsg))
+			logger.debug("rdt_recv: Drop the packet")
 
-		#increment the next sequence number, if the next is 256, back to 0
-		next_num = (next_num+1)%256
+		elif rtype == 11:
+			old_base = self.base_num
+			old_in_flight = self.__in_flight()
+			duplicate = False
+			offset = self.__seq_offset(rseq, self.base_num)
+			if offset >= len(window):
+				if window and self.__MODE == "GBN" and offset == SEQ_MOD-1:
+					#ACK of the packet before base, the receiver misses base
+					logger.debug("rdt_send: Received a duplicate ACK with seqNo.: %d", rseq)
+					duplicate = True
+				else:
+					logger.debug("rdt_send: Received an out of range ACK with seqNo.: %d", rseq)
+				used = duplicate
 
-	RList = [sockd]
+			elif self.__MODE == "SR":
+				#selective ACK, it acknowledges the packet rseq only
+				logger.debug("rdt_send: Received the ACK with seqNo.: %d", rseq)
+				used = True
+				pkt = window[offset]
+				#a later packet got through while base is still missing
+				duplicate = offset > 0 and rseq not in acked_nums
+				if pkt["tries"] == 1 and rseq not in acked_nums:
+					self.__rtt_update(time.monotonic() - pkt["sent"])
+				acked_nums.add(rseq)
+
+			else:
+				#cumulative ACK, it acknowledges every packet up to rseq
+				logger.debug("rdt_send: Received the ACK with seqNo.: %d", rseq)
+				logger.debug("rdt_send: All segments from %d to %d are acknowledged", self.base_num, rseq)
+				used = True
+				pkt = window[offset]
+				#a packet already reported by SACK was held up by a gap at the
+				#receiver, its ACK does not tell the RTT either
+				if pkt["tries"] == 1 and rseq not in acked_nums:
+					self.__rtt_update(time.monotonic() - pkt["sent"])
+				for i in range(offset+1):
+					pkt = window.popleft()
+					acked_nums.discard(pkt["seq"])
+					self.__acked(pkt)
+				self.base_num = (rseq+1)%SEQ_MOD
+
+			#SACK blocks, even a duplicate ACK may report new packets
+			if rlen > 0:
+				self.__sack_mark(rmsg[HEADER:HEADER+rlen])
+
+			#slide the window past the leading acked packets
+			while window and self.base_num in acked_nums:
+				acked_nums.discard(self.base_num)
+				self.__acked(window.popleft())
+				self.base_num = (self.base_num+1)%SEQ_MOD
+
+			if self.__in_flight() < old_in_flight:
+				self.__cwnd_update(old_in_flight - self.__in_flight())
+			if self.base_num != old_base:
+				self.dup_count = 0
+				self.data_last = time.monotonic()
+				if self.__ONE_TIMER and window:
+					#the timer moves on to the new oldest packet and runs
+					#afresh from now (RFC 6298, 5.3)
+					self.__timer_start(window[0], self.data_last)
+			elif duplicate:
+				self.dup_count += 1
+				#only once per hole, further duplicates are left to the timer
+				if self.dup_count == self.__DUP_ACKS and self.base_num not in acked_nums:
+					try:
+						self.__fast_retransmit()
+					except socket.error as emsg:
+						logger.error("Socket send error: %s", emsg)
+						return -1
+
+		elif rtype == 12 and (self.__MODE == "SR" or self.__SACK):
+			#keep out-of-order packets; SR ACKs each packet, otherwise the
+			#ACK stays cumulative and SACK blocks report what is kept
+			offset = self.__seq_offset(rseq, self.expect_num)
+			try:
+				if offset < self.__W:
+					#within the receiver window, keep it; a closed session
+					#has no more use for new data
+					logger.debug("rdt_recv: Got a packet within the window - seqNo.: %d", rseq)
+					used = not self.closing
+					if reorder.held(offset):
+						counters["duplicates"] += 1
+					else:
+						reorder.put(offset, rmsg)
+						kept = True
+						if offset > 0:
+							counters["out_of_order"] += 1
+					#deliver the packets which are now in order
+					in_order = (offset == 0)
+					while reorder.held(0):
+						self.__delivered(reorder.pop())
+						self.expect_num = (self.expect_num+1)%SEQ_MOD
+					if self.__MODE == "SR":
+						self.__send_ack(rseq)
+					elif in_order and not reorder:
+						self.__ack_delayed()
+					else:
+						#out of order or filling a gap, ACK at once
+						self.__send_ack((self.expect_num-1)%SEQ_MOD)
+				elif offset >= SEQ_MOD - self.__W:
+					#already delivered, our ACK must have been lost
+					counters["duplicates"] += 1
+					used = True
+					logger.debug("rdt_recv: Received a retransmission DATA packet -seqNo.: %d (expected: %d)", rseq, self.expect_num)
+					self.__send_ack(rseq if self.__MODE == "SR" else (self.expect_num-1)%SEQ_MOD)
+					logger.debug("rdt_recv: Retransmit the ACK packet")
+				else:
+					logger.debug("rdt_recv: Received an out of range DATA packet -seqNo.: %d", rseq)
+					logger.debug("rdt_recv: Drop the packet")
+			except socket.error as emsg:
+				logger.error("Socket send error: %s", emsg)
+				return -1
+
+		elif rtype == 12:
+			try:
+				if rseq == self.expect_num:
+					logger.debug("rdt_recv: Got an expected packet - seqNo.: %d", rseq)
+					logger.debug("rdt_recv: Received a message of size %d", len(rmsg))
+					self.__delivered(rmsg)
+					kept = True
+					used = not self.closing
+					self.expect_num = (self.expect_num+1)%SEQ_MOD
+					self.__ack_delayed()
+				else:
+					offset = self.__seq_offset(rseq, self.expect_num)
+					if offset < self.__W:
+						counters["out_of_order"] += 1
+						used = not self.closing
+					else:
+						counters["duplicates"] += 1
+						#a retransmission of one of the last W packets
+						used = offset >= SEQ_MOD - self.__W
+					prev_expect = (self.expect_num-1)%SEQ_MOD
+					logger.debug("rdt_recv: Received a retransmission DATA packet -seqNo.: %d (expected: %d)", rseq, self.expect_num)
+					self.__send_ack(prev_expect)
+					logger.debug("rdt_recv: Drop the packet")
+					logger.debug("rdt_recv: Retransmit the ACK packet")
+			except socket.error as emsg:
+				logger.error("Socket send error: %s", emsg)
+				return -1
+		if not kept:
+			self.__rx_release(rmsg)
+		return 1 if used else 0
+
+	def __poll(self, wait):
+		"""Listener: wait for one incoming datagram from any peer and hand it
+		to the session of that peer, creating the session for a new peer;
+		then run the timers of the sessions which are due.
+
+		A closed session stays until the peer has been quiet for SESSION_WAIT,
+		so it can still ACK retransmitted DATA and get its own packets acked;
+		only packets of use to it keep it, and a first DATA packet outside
+		the range it may still ACK, i.e. a new stream from the same address,
+		replaces it with a new session. A session whose peer has sent nothing for SESSION_IDLE, e.g. a client
+		which went away in the middle of an upload, is released as well,
+		unless it still holds messages for recvfrom().
+
+		With batched I/O on, all the datagrams waiting are read at once and
+		the sessions' replies are sent together, as in __rdt_wait().
+
+		Input argument: the max time to wait when no timer is pending
+		(None for no limit)
+		Return  -> 1 if any packet was processed, 0 on timeout, -1 on error
+		"""
+		timers = self.session_timers
+		if timers:
+			#do not sleep past the earliest timer of any session
+			remain = max(timers[0][0] - time.monotonic(), 0)
+			if wait is None or remain < wait:
+				wait = remain
 
-	while True:
-		# use select to wait for any incoming connection requests or
-		# incoming messages or 10 seconds
 		try:
-			Rready, Wready, Eready = select.select(RList, [], [], TIMEOUT)
+			self.__udt_flush()
+		except socket.error as emsg:
+			logger.error("Socket send error: %s", emsg)
+			return -1
+
+		try:
+			Rready, Wready, Eready = select.select([self.sockd], [], [], wait)
 		except select.error as emsg:
-			print("At select, caught an exception:", emsg)
+			logger.error("At select, caught an exception: %s", emsg)
 			return -1
 		except KeyboardInterrupt:
-			print("At select, caught the KeyboardInterrupt")
+			logger.error("At select, caught the KeyboardInterrupt")
 			return -1
 
-		# if has incoming activities
+		rmsgs = []
 		if Rready:
-			# for each socket in the READ ready list
-			for sd in Rready:
-				try:
-					rmsg = __udt_recv(sd, PAYLOAD+HEADER)
-				except socket.error as emsg:
-					print("Socket send error: ", emsg)
+			try:
+				rmsgs = self.__udt_recv_batch(self.PAYLOAD+self.HEADER)
+			except socket.error as emsg:
+				logger.error("Socket recv error: %s", emsg)
+				return -1
+		status = 1 if rmsgs else 0
+		for (rmsg, peer) in rmsgs:
+			session = self.sessions.get(peer)
+			if ((session is None or session.closing) and len(rmsg) >= self.HEADER and
+					self.__IntChksum(rmsg) == 0 and self.__unpack_header(rmsg)[:2] == (12, 0)):
+				if session is None:
+					session = self.__new_session(peer)
+				elif session.__seq_offset(0, session.expect_num) < self.SEQ_MOD - self.__W:
+					#not a retransmission of the last packets it took, the
+					#peer starts over, e.g. a new upload from the same port
+					logger.info("rdt_listen: %s starts a new stream, replace its closed session", peer)
+					self.__session_release(session)
+					session = self.__new_session(peer)
+			if session is None:
+				#not the first DATA packet of a peer, e.g. a late
+				#retransmission to a session already released
+				logger.info("rdt_listen: Drop a packet from unknown peer %s", peer)
+				self.__rx_release(rmsg)
+			else:
+				used = session.__rdt_input(rmsg)
+				if used < 0:
 					return -1
-				echk = __IntChksum(rmsg)
-				rheader = rmsg[:HEADER]
-				(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
-
-				if echk == 0: #not corrupted
-
-
-					if rtype==11:
-						last = (base_num + N -1)%256
-						if last < base_num: #reach the 255 limit, need go back to 0, base number is at 2xx but the last is at 0-9, i.e. last is smaller than base
-							#it is an ack and within range, but not the last ack
-							if base_num <= rseq <=255 or 0 <= rseq <= last-1:
-								print("rdt_send: Received the ACK with seqNo.:",rseq)
-								print("rdt_send: All segments from",base_num," to",rseq," are acknowledged")
-								pointer = max((rseq - base_num +256)%256 + 1, pointer)
-							#it is the last ack within range
-							elif rseq==last:
-								print("rdt_send: Received the ACK with seqNo.:",rseq)
-								print("rdt_send: All segments from",base_num," to",rseq," are acknowledged")
-								print("rdt_send: Sent",N,"messages of total size", total_size)
-								return total_size
-							#it is an ack but out of range
-							else: 
-								print("rdt_send: Received an out of range ACK with seqNo.:",rseq)
-						
-						else: #normal case
-							#it is an ack and within range, but not the last ack
-							if base_num <= rseq <= last-1:
-								print("rdt_send: Received the ACK with seqNo.:",rseq)
-								print("rdt_send: All segments from",base_num," to",rseq," are acknowledged")
-								pointer = max((rseq - base_num +256)%256 + 1, pointer)
-							elif rseq==last:
-								print("rdt_send: Received the ACK with seqNo.:",rseq)
-								print("rdt_send: All segments from",base_num," to",rseq," are acknowledged")
-								print("rdt_send: Sent",N,"messages of total size", total_size)
-								return total_size
-							#it is an ack but out of range
-							else: 
-								print("rdt_send: Received an out of range ACK with seqNo.:",rseq)
-
-					elif rtype==12:
-						print("rdt_send: I am expecting an ACK packet, but received a DATA packet")
-						print("rdt_send: Peer sent me a new DATA packet!!")
-						print("rdt_send: Drop the packet as I cannot accept it at this point")
-						if rseq==expect_num:
-							if rmsg not in buffer:
-								buffer.append(rmsg)
-
-							ackchk = __IntChksum(message_format.pack(11, rseq, 0, 0))
-							send_ack = message_format.pack(11, rseq, ackchk, 0)
-							try:
-								__udt_send(sockd, __peeraddr, send_ack)
-							except socket.error as emsg:
-								print("Socket send error: ", emsg)
-								return -1
-						else:
-							prev_expect = (expect_num-1+256)%256
-							ackchk = __IntChksum(message_format.pack(11, prev_expect, 0, 0))
-							send_ack = message_format.pack(11, rseq, ackchk, 0)
-							try:
-								__udt_send(sockd, __peeraddr, send_ack)
-							except socket.error as emsg:
-								print("Socket send error: ", emsg)
-								return -1
-
-				else: #corrupted
-					print("rdt_recv: Received a corrupted packet: Type =", rtype, ", Length =", len(rmsg))
-					print("rdt_recv: Drop the packet")
+				if session.buffer:
+					self.ready.append(session)
+				if used:
+					#the peer is still there, e.g. not a client which
+					#started over while this session was in the middle
+					session.heard = time.monotonic()
+					if session.closing:
+						session.quiet_until = session.heard + self.__SESSION_WAIT
+						self.__session_timer_of(session, session.quiet_until)
+
+		now = time.monotonic()
+		while timers and timers[0][0] <= now:
+			(deadline, key, session) = heapq.heappop(timers)
+			if self.sessions.get(session.__peeraddr) is not session:
+				#a stale entry of a session already released
+				continue
+			if session.__rdt_timer() < 0:
+				return -1
+			if session.closing and now >= session.quiet_until:
+				#a live peer would have answered one of our retransmissions
+				logger.info("rdt_close: Release the session of %s", session.__peeraddr)
+				self.__session_release(session)
+			elif deadline == session.idle_at:
+				if now >= session.heard + self.__SESSION_IDLE and not session.buffer:
+					logger.warning("rdt_listen: Nothing from %s for %.0f seconds, release the session", session.__peeraddr, self.__SESSION_IDLE)
+					self.__session_release(session)
+				else:
+					#heard from since, or still to be read by the application
+					session.idle_at = session.heard + self.__SESSION_IDLE
+					if session.idle_at <= now:
+						session.idle_at = now + self.__SESSION_IDLE
+					self.__session_timer_of(session, session.idle_at)
+
+		try:
+			self.__udt_flush()
+		except socket.error as emsg:
+			logger.error("Socket send error: %s", emsg)
+			return -1
+		if self.stats_file is not None:
+			self.__stats_tick()
+		return status
+
+	def __session_timer_of(self, session, deadline):
+		"""Listener: add a timer entry for one of its sessions"""
+		heapq.heappush(self.session_timers, (deadline, id(session), session))
+
+	def __session_release(self, session):
+		"""Listener: remove one of its sessions, the packets it holds go back
+		to the receive buffer pool"""
+		if self.stats_file is not None:
+			#its final counters, the next exports leave it out
+			self.__stats_write()
+		del self.sessions[session.__peeraddr]
+		for rmsg in session.reorder.slots:
+			if rmsg is not None:
+				self.__rx_release(rmsg)
+		session.reorder = ReorderRing(1)
+
+	def __new_session(self, peer):
+		"""Listener: create the session of a new peer, which shares the
+		listener's socket and network properties.
+
+		Input argument: the peer's address 2-tuple
+		Return  -> the new RDTSocket object
+		"""
+		session = RDTSocket()
+		session.__LOSS_RATE = self.__LOSS_RATE
+		session.__ERR_RATE = self.__ERR_RATE
+		session.emulator = self.emulator
+		session.__W = self.__W
+		session.__MODE = self.__MODE
+		session.__VERSION = self.__VERSION
+		session.__SACK = self.__SACK
+		session.__ONE_TIMER = self.__ONE_TIMER
+		session.__ACK_EVERY = self.__ACK_EVERY
+		session.__DUP_ACKS = self.__DUP_ACKS
+		session.__CC = self.__CC
+		session.__BATCH = self.__BATCH
+		session.__RTO_MIN = self.__RTO_MIN
+		session.__RTO_MAX = self.__RTO_MAX
+		session.__SESSION_WAIT = self.__SESSION_WAIT
+		session.rto = min(max(TIMEOUT, self.__RTO_MIN), self.__RTO_MAX)
+		session.trace = self.trace
+		session.HEADER = self.HEADER
+		session.SEQ_MOD = self.SEQ_MOD
+		session.PAYLOAD = self.PAYLOAD
+		session.__ADAPT = self.__ADAPT
+		session.__SEGMENT_MIN = self.__SEGMENT_MIN
+		session.__SEGMENT_MAX = self.__SEGMENT_MAX
+		session.segment = self.segment
+		session.reorder = ReorderRing(self.__W)
+		session.cwnd = min(CWND_INIT, self.__W)
+		session.ssthresh = self.__W
+		session.cwnd_start = time.monotonic()
+		session.sockd = self.sockd
+		session.__peeraddr = peer
+		session.listener = self
+		session.heard = time.monotonic()
+		session.idle_at = session.heard + self.__SESSION_IDLE
+		self.__session_timer_of(session, session.idle_at)
+		self.sessions[peer] = session
+		logger.info("rdt_listen: New session with %s", peer)
+		return session
+
+
+	#These are the functions used by appliation
+
+	def network_init(self, drop_rate, err_rate, W, mode="GBN", version=None, sack=False, ack_every=1, dup_acks=3, cc=False, batch=False, emulator=None, payload=PAYLOAD, probe=False, adapt=False, segment_min=SEGMENT_MIN, rto_min=RTO_MIN, rto_max=RTO_MAX):
+		"""Application calls this function to set properties of underlying network.
+
+		Input arguments:
+		drop_rate, err_rate: packet drop and corruption probabilities
+		W: Window size
+		mode: ARQ mode, "GBN" (Go-Back-N, default) or "SR" (Selective Repeat)
+		version: header version, 1 (8-bit seqNo.) or 2 (32-bit), None for 1 if W fits
+		sack: whether to send SACK blocks
+		ack_every: in GBN mode, the no. of in-order DATA packets per (delayed) ACK
+		dup_acks: the no. of duplicate ACKs for fast retransmit, 0 to disable
+		cc: whether AIMD congestion control limits the packets in flight to cwnd
+		batch: whether to use sendmmsg()/recvmmsg() where available (Linux)
+		emulator: a netem.NetEm in place of the two probabilities
+		payload: max payload of a DATA packet, None for the largest UDP datagram
+		probe: whether peer() limits the packets sent to the path MTU
+		adapt: whether to adapt the segment size to the retransmissions
+		segment_min: the smallest segment adaptive sizing goes down to
+		rto_min, rto_max: bounds of the retransmission timeout, in seconds
+
+		Note: both peers must use the same mode, version, window size and
+		payload size. Any sender makes use of the SACK blocks it gets. A
+		listener's sessions share its emulator and payload size.
+		"""
+		if emulator is None:
+			emulator = netem.NetEm(float(drop_rate), float(err_rate))
+		self.emulator = emulator
+		self.__LOSS_RATE = emulator.loss
+		self.__ERR_RATE = emulator.corrupt
+		self.__W = int(W)
+		self.__MODE = str(mode).upper()
+		if self.__MODE not in ("GBN", "SR"):
+			logger.warning("Unknown ARQ mode %s, use GBN instead", mode)
+			self.__MODE = "GBN"
+
+		self.__SACK = bool(sack)
+		self.__ONE_TIMER = self.__MODE == "GBN" and not self.__SACK
+		#SR acknowledges every packet on its own, there is nothing to coalesce
+		self.__ACK_EVERY = max(int(ack_every), 1) if self.__MODE == "GBN" else 1
+		self.__DUP_ACKS = max(int(dup_acks), 0)
+
+		#Go-Back-N needs the window to be smaller than the sequence space,
+		#a receiver keeping out-of-order packets no larger than half of it
+		def max_window(seq_mod):
+			return seq_mod - 1 if self.__MODE == "GBN" and not self.__SACK else seq_mod // 2
+
+		if version is None:
+			version = 1 if self.__W <= max_window(256) else 2
+		self.__VERSION = int(version)
+		if self.__VERSION == 1:
+			self.HEADER = message_format.size
+			self.SEQ_MOD = 256
 		else:
-			for i in range(pointer, N):
-				print("rdt_send: Timeout!! Retransmit the packet", i, "again")
-				try:
-					__udt_send(sockd, __peeraddr, send_pkt[i])
-				except socket.error as emsg:
-					print("Socket send error: ", emsg)
-					return -1
+			self.__VERSION = 2
+			self.HEADER = message_format2.size
+			self.SEQ_MOD = 2**32
+		if self.__W > max_window(self.SEQ_MOD):
+			logger.warning("Window size %d is too large, use %d instead", self.__W, max_window(self.SEQ_MOD))
+			self.__W = max_window(self.SEQ_MOD)
 
+		#the rlen field takes up to 65535, the datagram less
+		self.PAYLOAD = UDP_MAX - self.HEADER if payload is None else int(payload)
+		if not 0 < self.PAYLOAD <= UDP_MAX - self.HEADER:
+			logger.warning("Payload size %d is out of range, use %d instead", self.PAYLOAD, min(max(self.PAYLOAD, 1), UDP_MAX - self.HEADER))
+			self.PAYLOAD = min(max(self.PAYLOAD, 1), UDP_MAX - self.HEADER)
+		self.__PROBE = bool(probe)
+		#adaptive sizing starts from the default size, within its bounds
+		self.__ADAPT = bool(adapt)
+		self.__SEGMENT_MIN = min(max(int(segment_min), 1), self.PAYLOAD)
+		self.__SEGMENT_MAX = self.PAYLOAD
+		self.segment = min(max(PAYLOAD, self.__SEGMENT_MIN), self.PAYLOAD) if self.__ADAPT else self.PAYLOAD
 
-def rdt_recv(sockd, length):
-	"""Application calls this function to wait for a message from the
-	remote peer; the caller will be blocked waiting for the arrival of
-	the message. Upon receiving a message from the underlying UDT layer,
-    the function returns immediately.
+		self.__RTO_MAX = max(float(rto_max), 0.001)
+		self.__RTO_MIN = min(max(float(rto_min), 0.001), self.__RTO_MAX)
+		self.__SESSION_WAIT = max(SESSION_WAIT, 2 * self.__RTO_MAX)
+		self.__SESSION_IDLE = max(SESSION_IDLE, 2 * self.__RTO_MAX)
+		self.rto = min(max(TIMEOUT, self.__RTO_MIN), self.__RTO_MAX)
 
-	Input arguments: RDT socket object and the size of the message to
-	received.
-	Return  -> the received bytes message object on success, b'' on error
+		self.__CC = bool(cc)
+		self.__BATCH = bool(batch)
+		if self.__BATCH and _libc is None:
+			logger.warning("Batched I/O is not available on this platform, use one datagram per call instead")
+		self.reorder = ReorderRing(self.__W)
+		self.cwnd = min(CWND_INIT, self.__W)
+		self.ssthresh = self.__W
+		self.cwnd_start = time.monotonic()
+		self.cwnd_trace.clear()
+		logger.info("Drop rate: %s\tError rate: %s\tWindow size: %d\tMode: %s\tSACK: %s\tACK every: %d\tDup ACKs: %d\tCC: %s\tBatch: %s\tHeader version: %d\tPayload: %d\tAdaptive: %s\tRTO: %s-%s",
+			self.__LOSS_RATE, self.__ERR_RATE, self.__W, self.__MODE, self.__SACK, self.__ACK_EVERY, self.__DUP_ACKS, self.__CC, self.__BATCH, self.__VERSION, self.PAYLOAD, self.__ADAPT, self.__RTO_MIN, self.__RTO_MAX)
+		logger.info("Network emulator: %r", emulator)
 
-	Note: Catch any known error and report to the user.
-	"""
-	######## Your implementation #######
-	global PAYLOAD, HEADER, __peeraddr, message_format, next_num, expect_num, base_num, buffer, N
-	while buffer != []:
-		rmsg = buffer.pop(0)
-		rheader = rmsg[:HEADER]
-		(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
-		if rseq == expect_num:
-			expect_num = (expect_num + 1 +256)%256
-			return (rmsg[HEADER:]) #Return  -> the received bytes message object on success
-
-	while True:
+	def socket(self):
+		"""Application calls this function to create the RDT socket.
+
+		Null input.
+		Return the Unix socket object on success, None on error
+
+		Note: Catch any known error and report to the user.
+		"""
+		######## Your implementation #######
+		#reuse Part 2 implementation
 		try:
-			rmsg = __udt_recv(sockd, length+HEADER)
+			sd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 		except socket.error as emsg:
-			print("Socket recv error: ", emsg)
-			return b''
-		echk = __IntChksum(rmsg)
-		rheader = rmsg[:HEADER]
-		(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
-		
-
-		if echk==0 and rtype ==12: #no error data packet
-			if rseq==expect_num:
-				print("rdt_recv: Got an expected packet - seqNo.:",rseq)
-				print("rdt_recv: Received a message of size %d" % len(rmsg))
-				ackchk = __IntChksum(message_format.pack(11, rseq, 0, 0))
-				send_ack = message_format.pack(11, rseq, ackchk, 0)
-				try:
-					__udt_send(sockd, __peeraddr, send_ack)
-				except socket.error as emsg:
-					print("Socket send error: ", emsg)
-					return b''
-				expect_num = (expect_num + 1 +256)%256
-				return (rmsg[HEADER:])
-
-			elif rseq != expect_num:
-				
-				prev_expect = (expect_num-1+256)%256
-				print("rdt_recv: Received a retransmission DATA packet -seqNo.: %d (expected: %d)" % (prev_expect, expect_num))
-				ackchk = __IntChksum(message_format.pack(11, prev_expect, 0, 0))
-				send_ack = message_format.pack(11, prev_expect, ackchk, 0)
-				try:
-					__udt_send(sockd, __peeraddr, send_ack)
-				except socket.error as emsg:
-					print("Socket send error: ", emsg)
-					return b''
-				print("rdt_recv: Drop the packet")
-				print("rdt_recv: Retransmit the ACK packet")
-				
-		else: #error data packet
-			print("rdt_recv: Received a corrupted packet: Type =", rtype, ", Length =", len(rmsg))
-			print("rdt_recv: Drop the packet")
+			logger.error("Socket creation error: %s", emsg)
+			return None
+		#make room for a whole window of packets in the socket buffers, with
+		#some slack for the kernel's per-datagram overhead; the OS may cap it
+		bufsize = 4 * self.__W * (self.PAYLOAD + self.HEADER)
+		for opt in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+			try:
+				if sd.getsockopt(socket.SOL_SOCKET, opt) < bufsize:
+					sd.setsockopt(socket.SOL_SOCKET, opt, bufsize)
+			except socket.error as emsg:
+				logger.warning("Socket buffer size error: %s", emsg)
+		self.sockd = sd
+		return sd
 
-def rdt_close(sockd):
-	"""Application calls this function to close the RDT socket.
 
-	Input argument: RDT socket object
+	def bind(self, port):
+		"""Application calls this function to specify the port number
+		used by itself and assigns them to the RDT socket.
 
-	Note: (1) Catch any known error and report to the user.
-	(2) Before closing the RDT socket, the reliable layer needs to wait for TWAIT
-	time units before closing the socket.
-	"""
-	######## Your implementation #######
-	RList = [sockd]
-	while True:
+		Input argument: port number
+		Return	-> 0 on success, -1 on error
+
+		Note: Catch any known error and report to the user.
+		"""
+		######## Your implementation #######
+		#reuse Part 2 implementation
 		try:
-			Rready, Wready, Eready = select.select(RList, [], [], TWAIT)
-		except select.error as emsg:
-			print("At select, caught an exception:", emsg)
+			self.sockd.bind(("",port))
+		except socket.error as emsg:
+			logger.error("Socket bind error: %s", emsg)
 			return -1
-		except KeyboardInterrupt:
-			print("At select, caught the KeyboardInterrupt")
+		return 0
+
+	def peer(self, peer_ip, port):
+		"""Application calls this function to specify the IP address
+		and port number used by remote peer process.
+
+		Input arguments: peer's IP address and port number
+
+		Note: with probing on (see network_init()), the packets sent are kept
+		to the largest which crosses the path to the peer unfragmented.
+		"""
+		######## Your implementation #######
+		#reuse Part 2 implementation
+		self.__peeraddr = (peer_ip, port)
+		if self.__PROBE:
+			self.__probe_payload()
+
+	def __probe_payload(self):
+		"""Lower the size of the segments sent to what the path MTU to the
+		peer takes: the one the kernel knows for a connected socket with
+		Don't Fragment set, i.e. the MTU of the outgoing interface unless ICMP "fragmentation
+		needed" messages have told it of a smaller hop further on. Linux only,
+		elsewhere the segment size is left as it is.
+
+		The payload size, which sizes the receive buffers, is not lowered:
+		the peer may have probed another path MTU or not probed at all.
+
+		Return  -> the path MTU, None if it is not known
+		"""
+		if _IP_MTU is None:
+			logger.warning("Path MTU probing is not available on this platform, use payload size %d", self.PAYLOAD)
+			return None
+		try:
+			with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sd:
+				sd.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, _IP_PMTUDISC_DO)
+				#nothing is sent, connect() only looks up the route
+				sd.connect(self.__peeraddr)
+				mtu = sd.getsockopt(socket.IPPROTO_IP, _IP_MTU)
+		except socket.error as emsg:
+			logger.warning("Path MTU probing error: %s, use payload size %d", emsg, self.PAYLOAD)
+			return None
+		self.__SEGMENT_MAX = max(min(self.PAYLOAD, mtu - IP_UDP_HEADER - self.HEADER), 1)
+		self.segment = min(self.segment, self.__SEGMENT_MAX)
+		self.__SEGMENT_MIN = min(self.__SEGMENT_MIN, self.__SEGMENT_MAX)
+		logger.info("Path MTU to %s: %d\tMax segment: %d", self.__peeraddr, mtu, self.__SEGMENT_MAX)
+		return mtu
+
+	def peer_addr(self):
+		"""Return the address 2-tuple of the remote peer, () if not set"""
+		return self.__peeraddr
+
+	def send_ready(self):
+		"""Return True if send() can take one more packet without waiting
+		for room in the sender window; for use by an outside event loop.
+		"""
+		return not self.__window_full()
+
+	def packet_received(self, rmsg):
+		"""An outside event loop, which reads the socket itself, calls this
+		function with each datagram from the peer; the packet is processed
+		as in recv() and the timers which are due are run.
+
+		Input argument: the received bytes message object
+		Return  -> 0 on success, -1 on error
+		"""
+		if self.__rdt_input(rmsg) < 0:
 			return -1
+		return self.__rdt_timer()
 
-		if Rready:
-			# for each socket in the READ ready list
-			for sd in Rready:
+	def next_timer(self):
+		"""Return the time.monotonic() time when run_timers() has to be
+		called next by an outside event loop, None if no timer is pending.
+		"""
+		pkt = self.__timer_next()
+		deadline = None if pkt is None else pkt["deadline"]
+		if self.ack_pending and (deadline is None or self.ack_deadline < deadline):
+			deadline = self.ack_deadline
+		return deadline
+
+	def run_timers(self):
+		"""Retransmit the packets and send the delayed ACK whose timers have
+		expired; for use by an outside event loop, see next_timer().
+
+		Return  -> 0 on success, -1 on error
+		"""
+		return self.__rdt_timer()
+
+	def close_wait(self):
+		"""Return how long the peer has to stay quiet before an outside event
+		loop releases the connection on close: as for a listener's session,
+		SESSION_WAIT or two rto_max of network_init() if longer, which
+		outlasts any backed-off RTO of the peer's retransmissions.
+		"""
+		return self.__SESSION_WAIT
+
+	def start_io(self, queue_len=IO_QUEUE):
+		"""Application calls this function to hand the RDT socket over to an
+		I/O thread of its own, which runs the protocol from then on.
+
+		send() then only puts the message into a send queue and recv() takes
+		one from a receive queue, both of queue_len messages; they block only
+		when the queue is full or empty, so reading and writing files can
+		overlap with the transfer. Call flush() to wait until everything sent
+		has been acknowledged. close() stops the thread.
+
+		Input argument: the max no. of messages in each queue
+		Return  -> 0 on success, -1 on error
+		"""
+		if self.sockd is None or self.listener is not None or self.sessions is not None:
+			logger.error("Start I/O thread error: Not a connected RDT socket")
+			return -1
+		try:
+			self.__io_wake = socket.socketpair()
+			self.__io_wake[1].setblocking(False)
+		except socket.error as emsg:
+			logger.error("Socket creation error: %s", emsg)
+			return -1
+		self.send_queue = queue.Queue(queue_len)
+		self.recv_queue = queue.Queue(queue_len)
+		self.__io_stop = False
+		self.__io_error = False
+		self.io_thread = threading.Thread(target=self.__io_loop, name="rdt4-io", daemon=True)
+		self.io_thread.start()
+		return 0
+
+	def __io_notify(self):
+		"""Wake up the I/O thread from the application"""
+		try:
+			self.__io_wake[1].send(b'\0')
+		except (BlockingIOError, socket.error):
+			#a wake-up is pending already
+			pass
+
+	def __io_loop(self):
+		"""Body of the I/O thread, see start_io(): feed the messages of the
+		send queue into the sender window as it has room, move the packets
+		delivered in order to the receive queue, and process the incoming
+		packets and timers, until close() stops it.
+		"""
+		data = None		#the message being sent, as a memoryview
+		offset = 0		#where its next packet starts
+		wake = self.__io_wake[0]
+		while True:
+			#fill the sender window from the send queue
+			while True:
+				if data is None:
+					try:
+						data = memoryview(self.send_queue.get_nowait())
+					except queue.Empty:
+						break
+					offset = 0
+				if offset < len(data):
+					if not self.send_ready():
+						break
+					msg = data[offset:offset+self.segment]
+					if self.send(msg) < 0:
+						self.__io_fail()
+						return
+					offset += len(msg)
+				if offset >= len(data):
+					data = None
+					self.send_queue.task_done()
+
+			#hand the packets received in order to the application
+			while self.buffer and not self.recv_queue.full():
+				self.recv_queue.put_nowait(self.buffer.popleft())
+
+			with self.__io_cond:
+				self.__io_cond.notify_all()
+			if self.__io_stop and data is None and self.send_queue.empty():
+				return
+
+			#wait for a packet, the next timer or the application
+			deadline = self.next_timer()
+			wait = None if deadline is None else max(deadline - time.monotonic(), 0)
+			try:
+				self.__udt_flush()
+				Rready, Wready, Eready = select.select([self.sockd, wake], [], [], wait)
+			except select.error as emsg:
+				logger.error("At select, caught an exception: %s", emsg)
+				self.__io_fail()
+				return
+			except socket.error as emsg:
+				logger.error("Socket send error: %s", emsg)
+				self.__io_fail()
+				return
+			#under the lock, stats() reads the RTT samples and counters
+			with self.__io_cond:
 				try:
-					rmsg = __udt_recv(sd, PAYLOAD+HEADER)
+					if wake in Rready:
+						wake.recv(4096)
+					if self.sockd in Rready:
+						for (rmsg, peer) in self.__udt_recv_batch(self.PAYLOAD+self.HEADER):
+							if self.__rdt_input(rmsg) < 0:
+								self.__io_fail()
+								return
 				except socket.error as emsg:
-					print("Socket send error: ", emsg)
-					return -1
-				
-				echk = __IntChksum(rmsg)
-				rheader = rmsg[:HEADER]
-				(rtype, rseq, rchksum, rlen) = message_format.unpack(rheader)
-
-				if echk==0 and rtype==12: #no error data
-					ackchk = __IntChksum(message_format.pack(11, rseq, 0, 0))
-					send_ack = message_format.pack(11, rseq, ackchk, 0)
-					try:
-						__udt_send(sockd, __peeraddr, send_ack)
-					except socket.error as emsg:
-						print("Socket send error: ", emsg)
-						return b''
+					logger.error("Socket recv error: %s", emsg)
+					self.__io_fail()
+					return
+				if self.__rdt_timer() < 0:
+					self.__io_fail()
+					return
+			if self.stats_file is not None:
+				self.__stats_tick()
+
+	def __io_fail(self):
+		"""Stop the I/O thread on an error and let the application know"""
+		with self.__io_cond:
+			self.__io_error = True
+			self.__io_cond.notify_all()
+
+	def __io_flush(self):
+		"""flush() in I/O thread mode
+
+		Return  -> 0 on success, -1 on error
+		"""
+		with self.__io_cond:
+			self.__io_cond.wait_for(lambda: self.__io_error or
+				(self.send_queue.unfinished_tasks == 0 and not self.window))
+		return -1 if self.__io_error else 0
+
+	def trace_start(self, size=TRACE_EVENTS):
+		"""Application calls this function to keep a trace of the last size
+		protocol events of the connection (a listener's trace also takes the
+		events of its sessions), see EventTrace and trace_dump().
+
+		Input argument: the no. of events to keep
+		"""
+		self.trace = EventTrace(size)
+
+	def trace_dump(self, fobj=None):
+		"""Write the event trace out as text, e.g. when something failed.
+
+		Input argument: the text file object, sys.stderr by default
+		Return  -> the no. of events written, -1 if the trace is off
+		"""
+		if self.trace is None:
+			return -1
+		return self.trace.dump(sys.stderr if fobj is None else fobj)
+
+	def stats(self):
+		"""Application calls this function for the statistics of the
+		connection since it was created.
+
+		Return  -> a dict with the counters of COUNTERS by key, "retransmits"
+		(timeout and fast together), "rtt_min", "rtt_avg" and "rtt_p99" in
+		seconds (None before the first RTT sample; the percentile is over the
+		last RTT_SAMPLES samples), the current "rto" and "cwnd", and "goodput",
+		the payload bytes acked and delivered per second between the first
+		DATA packet and the last new data, the current "segment" size and the
+		"segment_ratio" of retransmissions in the last adaptive sizing epoch
+		(None if adaptive sizing is off or before its first decision)
+		"""
+		#a snapshot, the I/O thread may be updating them (see start_io())
+		with self.__io_cond:
+			stats = dict(self.counters)
+			samples = list(self.rtt_samples)
+			(rtt_min, rtt_sum, rtt_count) = (self.rtt_min, self.rtt_sum, self.rtt_count)
+		stats["retransmits_fast"] = self.fast_retransmits
+		stats["retransmits"] = stats["retransmits_timeout"] + self.fast_retransmits
+		if rtt_count:
+			samples.sort()
+			stats["rtt_min"] = rtt_min
+			stats["rtt_avg"] = rtt_sum / rtt_count
+			stats["rtt_p99"] = samples[math.ceil(len(samples) * 0.99) - 1]
+		else:
+			stats["rtt_min"] = stats["rtt_avg"] = stats["rtt_p99"] = None
+		stats["rto"] = self.rto
+		stats["cwnd"] = self.cwnd
+		stats["segment"] = self.segment
+		stats["segment_ratio"] = self.segment_ratio
+		lapsed = 0.0 if self.data_start is None else self.data_last - self.data_start
+		if lapsed > 0:
+			stats["goodput"] = (stats["bytes_acked"] + stats["bytes_delivered"]) / lapsed
+		else:
+			stats["goodput"] = 0.0
+		return stats
+
+	def stats_export(self, filename, interval=STATS_INTERVAL):
+		"""Application calls this function to have the statistics written to
+		a file every interval seconds, and once more when the socket is
+		closed, in the Prometheus text format with a peer label on every
+		sample (a listener writes those of all its sessions), e.g. for the
+		textfile collector of node_exporter.
+
+		The file is written while the connection is busy, from recv(),
+		send(), flush() and close() or the I/O thread, and replaced at once
+		so a reader never sees it half written.
+
+		Input arguments: the file name, the time between two exports
+		Return  -> 0 on success, -1 if the file cannot be written
+		"""
+		self.stats_file = filename
+		self.stats_interval = interval
+		return self.__stats_write()
+
+	def __stats_tick(self):
+		"""Export the statistics if the export interval is over"""
+		now = time.monotonic()
+		if now >= self.stats_next:
+			self.__stats_write()
+
+	def __stats_write(self):
+		"""Write the statistics file of stats_export()
+
+		Return  -> 0 on success, -1 on error
+		"""
+		self.stats_next = time.monotonic() + self.stats_interval
+		if self.sessions is not None:
+			conns = list(self.sessions.values())
 		else:
-			print("rdt_close: Nothing happened for 0.500 second")
-			print("rdt_close: Release the socket")
+			conns = [self]
+		conns = [('peer="%s:%d"' % conn.__peeraddr, conn.stats()) for conn in conns if conn.__peeraddr != ()]
+		gauges = [
+			("rtt_min", "rdt_rtt_seconds", 'stat="min"', "Round trip time of the ACKed DATA packets"),
+			("rtt_avg", "rdt_rtt_seconds", 'stat="avg"', "Round trip time of the ACKed DATA packets"),
+			("rtt_p99", "rdt_rtt_seconds", 'stat="p99"', "Round trip time of the ACKed DATA packets"),
+			("rto", "rdt_rto_seconds", "", "Current retransmission timeout"),
+			("cwnd", "rdt_cwnd_packets", "", "Current congestion window"),
+			("goodput", "rdt_goodput_bytes_per_second", "", "Payload bytes acked and delivered per second"),
+			("segment", "rdt_segment_bytes", "", "Payload size of the new DATA packets"),
+			("segment_ratio", "rdt_segment_retransmit_ratio", "", "Retransmitted share of the DATA packets in the last adaptive sizing epoch"),
+		]
+		lines = []
+		done = set()
+		for (metrics, mtype) in ((COUNTERS, "counter"), (gauges, "gauge")):
+			for (key, name, labels, text) in metrics:
+				if name not in done:
+					done.add(name)
+					lines.append("# HELP %s %s" % (name, text))
+					lines.append("# TYPE %s %s" % (name, mtype))
+				for (peer, stats) in conns:
+					if stats[key] is not None:
+						lines.append("%s{%s} %r" % (name, ",".join(filter(None, [peer, labels])), stats[key]))
+		tmpname = self.stats_file + ".tmp"
+		try:
+			with open(tmpname, "w") as fobj:
+				fobj.write("\n".join(lines) + "\n")
+			os.replace(tmpname, self.stats_file)
+		except OSError as emsg:
+			logger.error("Stats export error: %s", emsg)
+			return -1
+		return 0
+
+	def listen(self):
+		"""Application calls this function to turn the bound RDT socket into
+		a listener, which serves any number of peers over the one socket:
+		every datagram goes to the session of the peer it came from, and
+		each new peer gets a new session, an RDTSocket object of its own,
+		with its first DATA packet (seqNo. 0).
+		Call recvfrom() to receive from any of them.
+
+		Return  -> 0 on success, -1 on error
+		"""
+		if self.sockd is None:
+			logger.error("Socket listen error: Socket not created yet")
+			return -1
+		self.sessions = {}
+		return 0
+
+	def recvfrom(self, length):
+		"""Listener: wait for a message from any peer, see recv().
+
+		Input argument: the size of the message to received.
+		Return  -> (the received bytes message object, session of the peer)
+		on success, (b'', None) on error
+
+		Note: reply with session.send() and call session.close() when done
+		with a peer; neither blocks the other sessions for long, as a
+		session's waits serve all the sessions of the listener.
+		"""
+		while True:
+			while self.ready:
+				session = self.ready.popleft()
+				if session.buffer:
+					rmsg = session.recv(length)
+					if session.buffer:
+						self.ready.append(session)
+					return (rmsg, session)
+			if self.__poll(None) < 0:
+				return (b'', None)
+
+	def send(self, byte_msg):
+		"""Application calls this function to transmit a message to the
+		remote peer through the RDT socket.
+
+		Input argument: the message bytes object
+		Return  -> size of data sent on success, -1 on error
+
+		Note: (1) The message is cut into packets which enter the sender
+		window, which holds up to W unacked packets across successive calls
+		(and with congestion control on, no more than cwnd in flight).
+		This function blocks only while the window is full and returns as
+		soon as the last packet of the message has been sent; call
+		flush() to wait until everything has been delivered.
+		(2) Catch any known error and report to the user.
+		(3) With an I/O thread (see start_io()), the message is only put
+		into the send queue.
+		(4) The packets refer to the message until they are acked, so a
+		writable buffer, e.g. a bytearray, is copied once; the caller may
+		reuse it at once. A read-only buffer must stay unchanged.
+		"""
+		######## Your implementation #######
+		#segment the message through a memoryview so that no data is copied
+		data = memoryview(byte_msg)
+		if not data.readonly:
+			data = memoryview(bytes(data))
+
+		if self.io_thread is not None and threading.current_thread() is not self.io_thread:
+			if self.__io_error:
+				return -1
+			#the I/O thread looks at the queue again before waiting, unless it
+			#has emptied it, so only then it needs a wake-up
+			idle = self.send_queue.empty()
+			self.send_queue.put(data)
+			if idle:
+				self.__io_notify()
+			return len(data)
+
+		total_size = len(data)
+		N = 0		#no. of packets sent
+		offset = 0
+
+		while offset < total_size:
+			#wait until there is room in the sender window
+			while self.__window_full():
+				if self.__rdt_wait(None) < 0:
+					return -1
+
+			#Make sure the data sent is not longer than the segment size, which
+			#adaptive sizing may change from one packet to the next
+			msg = data[offset:offset+self.segment]
+			offset += len(msg)
+			N += 1
+
+			checksum = self.__IntChksum(self.__pack_header(12, self.next_num, 0, len(msg)), msg)
+
+			#keep header and payload apart, __udt_send() hands both to sendmsg()
+			send_pkt = [self.__pack_header(12, self.next_num, checksum, len(msg)), msg]
+
+			pkt = {"seq": self.next_num, "bufs": send_pkt, "sent": time.monotonic(), "tries": 1, "deadline": None, "epoch": self.segment_epoch}
+			self.window.append(pkt)
+			self.counters["data_sent"] += 1
+			if self.data_start is None:
+				self.data_start = self.segment_start = pkt["sent"]
+			if self.trace is not None:
+				self.trace.add(EV_DATA_SENT, self.next_num, len(msg))
+			self.__timer_start(pkt)
 			try:
-				sockd.close()
+				self.__udt_send(send_pkt)
 			except socket.error as emsg:
-				print("Socket close error: ", emsg)
-			break
+				logger.error("Socket send error: %s", emsg)
+				return -1
+
+			#increment the next sequence number, wrapping round at SEQ_MOD
+			self.next_num = (self.next_num+1)%self.SEQ_MOD
 
+		if self.io_thread is None:
+			#the I/O thread sends what it has queued before it waits
+			try:
+				self.__udt_flush()
+			except socket.error as emsg:
+				logger.error("Socket send error: %s", emsg)
+				return -1
+
+		logger.debug("rdt_send: Sent %d messages of total size %d", N, total_size)
+		return total_size
+
+
+	def recv(self, length):
+		"""Application calls this function to wait for a message from the
+		remote peer; the caller will be blocked waiting for the arrival of
+		the message. Upon receiving a message from the underlying UDT layer,
+		the function returns immediately.
+
+		Input argument: the size of the message to received.
+		Return  -> the received bytes message object on success, b'' on error
+
+		Note: (1) While waiting, ACKs for our own unacked packets are processed
+		and those packets retransmitted on timeout.
+		(2) Catch any known error and report to the user.
+		"""
+		######## Your implementation #######
+		if self.io_thread is not None:
+			#from the receive queue of the I/O thread
+			while True:
+				if self.__io_error:
+					return b''
+				full = self.recv_queue.full()
+				try:
+					rmsg = self.recv_queue.get(timeout=TWAIT)
+					break
+				except queue.Empty:
+					pass
+			if full:
+				#it may have packets waiting for room in the queue
+				self.__io_notify()
+			return self.__deliver(rmsg, length)
+
+		while not self.buffer:
+			if self.__rdt_wait(None) < 0:
+				return b''
+
+		rmsg = self.buffer.popleft()
+		return self.__deliver(rmsg, length) #Return  -> the received bytes message object on success
+
+	def __deliver(self, rmsg, length):
+		"""Copy the payload of a received DATA packet out for the application
+		and give its receive buffer slot back
+
+		Input arguments: the packet and the max size of the message
+		Return  -> the bytes message object
+		"""
+		msg = bytes(rmsg[self.HEADER:self.HEADER+length])
+		self.__rx_release(rmsg)
+		return msg
+
+	def flush(self):
+		"""Application calls this function to wait until every message passed
+		to send() has been acknowledged by the remote peer.
+
+		Return  -> 0 on success, -1 on error
+		"""
+		if self.io_thread is not None:
+			return self.__io_flush()
+		while self.window:
+			if self.__rdt_wait(None) < 0:
+				return -1
+		return 0
+
+	def close(self):
+		"""Application calls this function to close the RDT socket.
+
+		Note: (1) Catch any known error and report to the user.
+		(2) Before closing the RDT socket, the reliable layer first waits for
+		all outstanding packets to be acknowledged and then needs to wait for
+		TWAIT time units before closing the socket.
+		(3) A listener closes all its sessions first; a session of a listener
+		only leaves the socket open to the other sessions.
+		"""
+		######## Your implementation #######
+		if self.listener is not None:
+			#a session of a listener: the listener removes it once it is
+			#flushed and quiet, it is not waited for here
+			self.closing = True
+			self.quiet_until = time.monotonic() + self.__SESSION_WAIT
+			self.listener.__session_timer_of(self, self.quiet_until)
+			return 0
+		if self.sessions is not None:
+			#a listener: close all its sessions and wait until they are gone
+			for session in list(self.sessions.values()):
+				if not session.closing:
+					session.close()
+			while self.sessions:
+				if self.__poll(None) < 0:
+					return -1
+
+		if self.flush() < 0:
+			return -1
+		if self.io_thread is not None:
+			#take the socket back from the I/O thread
+			self.__io_stop = True
+			self.__io_notify()
+			self.io_thread.join()
+			self.io_thread = None
+			for sd in self.__io_wake:
+				sd.close()
+
+		#keep ACKing retransmitted DATA until the peer stays quiet for TWAIT,
+		#or for a few RTOs if the path turned out to be slow
+		twait = max(TWAIT, 2 * self.rto)
+		quiet_until = time.monotonic() + twait
+		while True:
+			status = self.__rdt_wait(max(quiet_until - time.monotonic(), 0))
+			if status < 0:
+				return -1
+			elif status == 1:
+				quiet_until = time.monotonic() + twait
+			elif time.monotonic() >= quiet_until:
+				logger.info("rdt_close: Nothing happened for %.3f second", twait)
+				logger.info("rdt_close: Release the socket")
+				if self.stats_file is not None and self.sessions is None:
+					self.__stats_write()
+				try:
+					self.sockd.close()
+				except socket.error as emsg:
+					logger.error("Socket close error: %s", emsg)
+				break
+
+
+#the connection behind the rdt_* functions below
+default_conn = RDTSocket()
+
+#These are the functions used by appliation; each one is a thin wrapper
+#over the same method of default_conn, the socket argument is the one
+#returned by rdt_socket() and is only kept for compatibility
+
+def rdt_network_init(drop_rate, err_rate, W, mode="GBN", version=None, sack=False, ack_every=1, dup_acks=3, cc=False, batch=False, emulator=None, payload=PAYLOAD, probe=False, adapt=False, segment_min=SEGMENT_MIN, rto_min=RTO_MIN, rto_max=RTO_MAX):
+	"""Set properties of underlying network, see RDTSocket.network_init()"""
+	default_conn.network_init(drop_rate, err_rate, W, mode, version, sack, ack_every, dup_acks, cc, batch, emulator, payload, probe, adapt, segment_min, rto_min, rto_max)
+
+def rdt_socket():
+	"""Create the RDT socket, see RDTSocket.socket()"""
+	return default_conn.socket()
+
+def rdt_bind(sockd, port):
+	"""Bind the RDT socket to port, see RDTSocket.bind()"""
+	return default_conn.bind(port)
+
+def rdt_peer(peer_ip, port):
+	"""Set the address of the remote peer, see RDTSocket.peer()"""
+	return default_conn.peer(peer_ip, port)
+
+def rdt_listen(sockd):
+	"""Serve many peers over the RDT socket, see RDTSocket.listen()"""
+	return default_conn.listen()
+
+def rdt_recvfrom(sockd, length):
+	"""Wait for a message from any peer, see RDTSocket.recvfrom()"""
+	return default_conn.recvfrom(length)
+
+def rdt_start_io(sockd, queue_len=IO_QUEUE):
+	"""Run the RDT socket in an I/O thread, see RDTSocket.start_io()"""
+	return default_conn.start_io(queue_len)
+
+def rdt_trace_start(sockd, size=TRACE_EVENTS):
+	"""Keep a trace of the recent protocol events, see RDTSocket.trace_start()"""
+	default_conn.trace_start(size)
+
+def rdt_trace_dump(sockd, fobj=None):
+	"""Write the event trace out as text, see RDTSocket.trace_dump()"""
+	return default_conn.trace_dump(fobj)
+
+def rdt_stats(sockd):
+	"""Return the statistics of the connection, see RDTSocket.stats()"""
+	return default_conn.stats()
+
+def rdt_stats_export(sockd, filename, interval=STATS_INTERVAL):
+	"""Export the statistics to a file periodically, see RDTSocket.stats_export()"""
+	return default_conn.stats_export(filename, interval)
+
+def rdt_send(sockd, byte_msg):
+	"""Transmit a message to the remote peer, see RDTSocket.send()"""
+	return default_conn.send(byte_msg)
+
+def rdt_recv(sockd, length):
+	"""Wait for a message from the remote peer, see RDTSocket.recv()"""
+	return default_conn.recv(length)
+
+def rdt_flush(sockd):
+	"""Wait until every message sent is acknowledged, see RDTSocket.flush()"""
+	return default_conn.flush()
+
+def rdt_close(sockd):
+	"""Close the RDT socket, see RDTSocket.close()"""
+	return default_conn.close()
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+"""asyncio implementation of RDT4.0
+
+functions: rdt_open()
+class:     AsyncRDTSocket, with async send(), recv(), flush() and close()
+
+The protocol is the one of rdt4.RDTSocket, with the same wire format and
+options. Here an asyncio datagram endpoint reads the socket and feeds the
+packets to it, and its retransmission and delayed ACK timers are driven by
+loop.call_later(), so nothing blocks: any number of RDT connections can
+share one event loop with other I/O.
+"""
+
+import asyncio
+import time
+import rdt4
+
+
+class AsyncRDTSocket(asyncio.DatagramProtocol):
+	"""One RDT connection on an asyncio event loop; create it with rdt_open().
+
+	The rdt4.RDTSocket object doing the protocol work is kept in conn,
+	e.g. for its counters.
+	"""
+
+	def __init__(self, conn):
+		self.conn = conn
+		self.__transport = None
+		self.__timer = None		#call_later() handle of the next timer
+		self.__when = None		#when that timer expires, time.monotonic() time
+		self.__changed = asyncio.Event()	#set on every packet and timer
+		self.__error = False
+
+	#asyncio.DatagramProtocol callbacks
+	def connection_made(self, transport):
+		self.__transport = transport
+		#rdt4 sends through the transport, which queues when the socket is busy
+		self.conn.sockd = transport
+
+	def datagram_received(self, data, addr):
+		if self.conn.packet_received(data) < 0:
+			self.__error = True
+		self.__wakeup()
+
+	def error_received(self, exc):
+		#e.g. ICMP port unreachable while the peer is not up yet
+		rdt4.logger.error("Socket error: %s", exc)
+
+	#internal functions - being called within the class
+	def __wakeup(self):
+		"""Wake up the coroutines waiting in __wait() and reschedule the timer"""
+		self.__changed.set()
+		self.__schedule()
+
+	def __schedule(self):
+		"""Make sure that __on_timer() runs when the next timer of the
+		connection expires; a timer set for later is replaced, one set for
+		earlier is kept and reschedules itself when it runs.
+		"""
+		deadline = self.conn.next_timer()
+		if deadline is None or (self.__timer is not None and self.__when <= deadline):
+			return
+		if self.__timer is not None:
+			self.__timer.cancel()
+		self.__when = deadline
+		self.__timer = asyncio.get_event_loop().call_later(max(deadline - time.monotonic(), 0), self.__on_timer)
+
+	def __on_timer(self):
+		self.__timer = None
+		if self.conn.run_timers() < 0:
+			self.__error = True
+		self.__wakeup()
+
+	async def __wait(self):
+		"""Wait until a packet has been processed or a timer has run
+
+		Return  -> 0 on success, -1 if the connection had an error
+		"""
+		self.__changed.clear()
+		await self.__changed.wait()
+		return -1 if self.__error else 0
+
+	#These are the functions used by appliation
+
+	async def send(self, byte_msg):
+		"""Transmit a message to the remote peer, see rdt4.RDTSocket.send();
+		only this coroutine waits while the window is full.
+
+		Input argument: the message bytes object
+		Return  -> size of data sent on success, -1 on error
+		"""
+		data = memoryview(byte_msg)
+		if not data.readonly:
+			#the window keeps its packets until acked, copy a writable buffer once
+			data = memoryview(bytes(data))
+		offset = 0
+		while offset < len(data):
+			while not self.conn.send_ready():
+				if await self.__wait() < 0:
+					return -1
+			#one packet of the current segment size at a time
+			msg = data[offset:offset+self.conn.segment]
+			if self.conn.send(msg) < 0:
+				return -1
+			offset += len(msg)
+			self.__schedule()
+		return len(data)
+
+	async def recv(self, length):
+		"""Wait for a message from the remote peer, see rdt4.RDTSocket.recv()
+
+		Input argument: the size of the message to received.
+		Return  -> the received bytes message object on success, b'' on error
+		"""
+		while not self.conn.buffer:
+			if await self.__wait() < 0:
+				return b''
+		return self.conn.recv(length)
+
+	async def flush(self):
+		"""Wait until every message sent has been acknowledged
+
+		Return  -> 0 on success, -1 on error
+		"""
+		while self.conn.window:
+			if await self.__wait() < 0:
+				return -1
+		return 0
+
+	async def close(self):
+		"""Close the connection, see rdt4.RDTSocket.close(): wait for all
+		outstanding packets to be acknowledged and for the peer to be quiet,
+		then close the transport.
+
+		Return  -> 0 on success, -1 on error
+
+		Note: as only this coroutine waits, the peer is given as long as a
+		listener's session, see rdt4.RDTSocket.close_wait(), which outlasts
+		any backed-off RTO of its retransmissions; TWAIT can be too short for
+		a loaded peer.
+		"""
+		if await self.flush() < 0:
+			return -1
+		quiet = self.conn.close_wait()
+		while True:
+			try:
+				if await asyncio.wait_for(self.__wait(), quiet) < 0:
+					return -1
+			except asyncio.TimeoutError:
+				break
+		if self.__timer is not None:
+			self.__timer.cancel()
+		self.__transport.close()
+		return 0
+
+
+async def rdt_open(port, peer_ip, peer_port, drop_rate, err_rate, W, **options):
+	"""Create an RDT connection on the running event loop.
+
+	Input arguments: the local port number, peer's IP address and port
+	number, packet drop probability, packet corruption probability, Window
+	size and any other options of rdt4.rdt_network_init() by name
+	Return  -> the AsyncRDTSocket object on success, None on error
+
+	Note: a network emulator with delays sends the delayed datagrams from
+	its own thread, which asyncio transports do not allow; give it one
+	without delay, jitter, rate or reordering.
+	"""
+	conn = rdt4.RDTSocket()
+	conn.network_init(drop_rate, err_rate, W, **options)
+	if conn.socket() is None:
+		return None
+	if conn.bind(port) < 0:
+		return None
+	conn.peer(peer_ip, peer_port)
+
+	rsock = AsyncRDTSocket(conn)
+	loop = asyncio.get_event_loop()
+	await loop.create_datagram_endpoint(lambda: rsock, sock=conn.sockd)
+	return rsock
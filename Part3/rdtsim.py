@@ -0,0 +1,422 @@
+#!/usr/bin/python3
+"""In-process discrete-event simulator of the RDT protocols
+
+class:     Simulator, the virtual clock, the event queue and the links
+           SimSocket, an in-memory UDP socket of a Simulator
+functions: sim_transfer() to run a file transfer between two peers
+
+The peers of a simulation run unchanged rdt3/rdt4 code, each one in a
+thread of its own, but only one of them at a time: a peer runs until it
+waits in select(), then the simulator moves the virtual clock on to the
+next event (a datagram arriving, a select() timeout) and resumes the peer
+it wakes up. The RDT module's select and time names are replaced while
+the simulation runs, so select.select() and time.monotonic() work on the
+virtual clock, and the peers use SimSocket objects in place of sockets.
+
+A datagram takes no time unless the link's network emulator (a netem.NetEm
+per direction) delays it, and processing takes no virtual time at all, so
+the results depend only on the protocol and the seeds: the same run gives
+the same counts every time, however fast the machine is, and an hour of
+transfer under loss takes seconds.
+
+Not simulated: the I/O thread of rdt4 (start_io()), batched I/O, and a
+network emulator inside the RDT layer with delays; give the RDT layer no
+loss and let the links emulate the network.
+
+Usage: python3 rdtsim.py <rdt3|rdt4> <file size in KB> <drop rate> <error rate> <Window size> [GBN|SR] [SACK] [DELACK=<k>] [DUPACK=<n>] [AIMD]
+       [PAYLOAD=<bytes>|MAX] [ADAPT[=<min bytes>]]
+       [RTOMIN=<ms>] [RTOMAX=<ms>] [NETEM=<key>=<value>,...]
+"""
+
+import os
+import sys
+import time
+import types
+import heapq
+import random
+import logging
+import threading
+import collections
+import netem
+
+#some constants
+EPHEMERAL = 50000	#first port number given to a socket which is not bound
+SIM_LIMIT = 24*3600.0	#default virtual time limit of sim_transfer()
+
+logger = logging.getLogger("rdtsim")
+logger.addHandler(logging.NullHandler())
+
+
+class SimSocket:
+	"""An in-memory UDP socket of a Simulator, with the socket methods
+	the RDT layers use; create it with Simulator.socket().
+	"""
+
+	def __init__(self, sim):
+		self.sim = sim
+		self.port = None		#set by bind() or the first sendto()
+		self.queue = collections.deque()	#(datagram, source address) received
+		self.waiter = None		#the process waiting in select() for it
+
+	def bind(self, addr):
+		self.sim.bind(self, addr[1])
+
+	def sendto(self, data, addr):
+		return self.sim.transmit(self, bytes(data), addr)
+
+	def recvfrom(self, length):
+		#a blocking socket, wait for a datagram in virtual time
+		while not self.queue:
+			self.sim.select.select([self], [], [])
+		(data, source) = self.queue.popleft()
+		return (data[:length], source)
+
+	def recvfrom_into(self, buf):
+		while not self.queue:
+			self.sim.select.select([self], [], [])
+		(data, source) = self.queue.popleft()
+		nbytes = min(len(data), len(buf))
+		buf[:nbytes] = data[:nbytes]
+		return (nbytes, source)
+
+	def close(self):
+		self.sim.unbind(self)
+
+
+class _Process:
+	"""A peer of the simulation, run in a thread of its own"""
+
+	def __init__(self, name, func, args):
+		self.name = name
+		self.func = func
+		self.args = args
+		self.resume = threading.Semaphore(0)	#released to let it run
+		self.token = 0			#no. of its select() call, for stale timeouts
+		self.rlist = None		#the sockets it waits for, None if not waiting
+		self.result = None		#the return value of func
+		self.error = None		#the exception func raised
+		self.done = False
+
+
+class Simulator:
+	"""The virtual clock, the event queue and the links of a simulation.
+
+	Input argument: a function of (source port, destination port) which
+	returns the netem.NetEm of that direction, None for a perfect link;
+	e.g. lambda src, dst: netem.NetEm(0.1, 0.0, seed=src)
+
+	Datagrams and bytes sent over the links are counted in sent and
+	sent_bytes.
+	"""
+
+	def __init__(self, link=None):
+		self.now = 0.0
+		self.sent = 0
+		self.sent_bytes = 0
+		self.__link = link
+		self.__links = {}		#(source port, destination port) -> NetEm
+		self.__events = []		#(time, no., function, arguments) heap
+		self.__posted = 0
+		self.__sockets = {}		#bound port -> SimSocket
+		self.__next_port = EPHEMERAL
+		self.__procs = []
+		self.__current = None	#the process running, None for the simulator
+		self.__baton = threading.Semaphore(0)	#released when a process stops running
+		#the stand-ins of the select and time modules, see run()
+		self.select = types.SimpleNamespace(select=self.__select, error=OSError)
+		self.time = types.SimpleNamespace(monotonic=self.monotonic, time=self.monotonic,
+			perf_counter=self.monotonic, sleep=self.__sleep)
+
+	def monotonic(self):
+		"""Return the virtual time in seconds"""
+		return self.now
+
+	def socket(self):
+		"""Return a new SimSocket"""
+		return SimSocket(self)
+
+	def bind(self, sock, port):
+		if port == 0:
+			port = self.__next_port
+			self.__next_port += 1
+		if port in self.__sockets:
+			raise OSError("Port %d in use" % port)
+		sock.port = port
+		self.__sockets[port] = sock
+
+	def unbind(self, sock):
+		if self.__sockets.get(sock.port) is sock:
+			del self.__sockets[sock.port]
+
+	def schedule(self, when, func, *args):
+		"""Call func(*args) at virtual time when"""
+		heapq.heappush(self.__events, (when, self.__posted, func, args))
+		self.__posted += 1
+
+	def transmit(self, sock, data, addr):
+		"""Send a datagram over the link from sock to the port of addr
+
+		Return  -> size of data sent
+		"""
+		if sock.port is None:
+			self.bind(sock, 0)
+		key = (sock.port, addr[1])
+		link = self.__links.get(key, False)
+		if link is False:
+			link = self.__links[key] = None if self.__link is None else self.__link(*key)
+		self.sent += 1
+		self.sent_bytes += len(data)
+		source = ("127.0.0.1", sock.port)
+		if link is None:
+			self.schedule(self.now, self.__deliver, addr[1], data, source)
+			return len(data)
+		for (delay, pos) in link.decide(len(data), self.now):
+			datagram = data
+			if pos >= 0:
+				err_bytearr = bytearray(data)
+				err_bytearr[pos] = err_bytearr[pos] - 2 if err_bytearr[pos] > 1 else 254
+				datagram = bytes(err_bytearr)
+			self.schedule(self.now + delay, self.__deliver, addr[1], datagram, source)
+		return len(data)
+
+	def __deliver(self, port, datagram, source):
+		sock = self.__sockets.get(port)
+		if sock is None:
+			#nobody listens there (any more)
+			return
+		sock.queue.append((datagram, source))
+		if sock.waiter is not None:
+			self.__switch(sock.waiter)
+
+	def __timeout(self, proc, token):
+		if proc.token == token and proc.rlist is not None:
+			self.__switch(proc)
+
+	def __switch(self, proc):
+		"""Let a waiting process run until it waits again or ends"""
+		for sock in proc.rlist:
+			sock.waiter = None
+		proc.rlist = None
+		self.__current = proc
+		proc.resume.release()
+		self.__baton.acquire()
+		self.__current = None
+
+	def __select(self, rlist, wlist, xlist, timeout=None):
+		"""select.select() of the processes, on SimSocket objects"""
+		proc = self.__current
+		if proc is None:
+			raise RuntimeError("select() called outside a process of the simulation")
+		ready = [sock for sock in rlist if sock.queue]
+		if ready or timeout == 0:
+			return (ready, list(wlist), [])
+		proc.token += 1
+		proc.rlist = rlist
+		for sock in rlist:
+			sock.waiter = proc
+		if timeout is not None:
+			self.schedule(self.now + timeout, self.__timeout, proc, proc.token)
+		#give the baton back to the simulator and wait to be woken up
+		self.__baton.release()
+		proc.resume.acquire()
+		return ([sock for sock in rlist if sock.queue], list(wlist), [])
+
+	def __sleep(self, seconds):
+		self.__select([], [], [], seconds)
+
+	def spawn(self, name, func, *args):
+		"""Add a peer to the simulation: func(*args) runs from the start of
+		run(), at virtual time 0, in a thread of its own.
+
+		Return  -> the process object, whose result and error are those of
+		func once run() returns
+		"""
+		proc = _Process(name, func, args)
+		thread = threading.Thread(target=self.__run_process, args=(proc,), name=name, daemon=True)
+		thread.start()
+		self.__procs.append(proc)
+		proc.rlist = []
+		self.schedule(self.now, self.__switch, proc)
+		return proc
+
+	def __run_process(self, proc):
+		proc.resume.acquire()
+		try:
+			proc.result = proc.func(*proc.args)
+		except BaseException as emsg:
+			proc.error = emsg
+		proc.done = True
+		self.__baton.release()
+
+	def run(self, modules, until=None):
+		"""Run the simulation until no event is left or the virtual time
+		until is reached, with the select and time names of the modules
+		(e.g. [rdt4]) replaced by the simulator's.
+
+		Return  -> the virtual time at the end
+		Note: a process still waiting at the end is left blocked
+		"""
+		saved = [(module, module.select, module.time) for module in modules]
+		try:
+			for module in modules:
+				module.select = self.select
+				module.time = self.time
+			while self.__events:
+				(when, no, func, args) = self.__events[0]
+				if until is not None and when > until:
+					break
+				heapq.heappop(self.__events)
+				self.now = max(self.now, when)
+				func(*args)
+				if all(proc.done for proc in self.__procs):
+					break
+		finally:
+			for (module, select, clock) in saved:
+				module.select = select
+				module.time = clock
+		for proc in self.__procs:
+			if not proc.done:
+				logger.warning("Process %s did not finish", proc.name)
+		return self.now
+
+
+def sim_transfer(rdt, size, drop_rate, err_rate, W, options=None, spec=None, seed=0, until=SIM_LIMIT):
+	"""Simulate the file transfer of test-client3.py and test-server3.py
+	(or test-client2.py and test-server2.py for rdt3) over simulated links.
+
+	Input arguments: the RDT module (rdt3 or rdt4), the file size in bytes,
+	packet drop and corruption probabilities, Window size (ignored by
+	rdt3), the other options of rdt4's network_init() by name, the text
+	option of netem.netem_parse() for the links, and the seed of the file
+	content and of the links unless the text option gives one, and the
+	virtual time limit of the simulation
+	Return  -> dict of the virtual "elapsed" time of the transfer (None if
+	it failed), whether the received file is "identical", the "datagrams"
+	sent, the virtual time at the "end" and the sender's "stats" (rdt4 only)
+	"""
+	options = options or {}
+	spec = spec or ""
+	if "seed=" not in spec:
+		spec = "seed=%d,%s" % (seed, spec)
+	sim = Simulator(lambda src, dst: netem.netem_parse(spec, drop_rate, err_rate, "%d>%d" % (src, dst)))
+	data = random.Random(seed).getrandbits(8 * size).to_bytes(size, "little")
+	is_rdt4 = hasattr(rdt.RDTSocket, "flush")
+
+	def peer(port, peer_port):
+		conn = rdt.RDTSocket()
+		if is_rdt4:
+			conn.network_init(0, 0, W, **options)
+		else:
+			conn.network_init(0, 0)
+		conn.sockd = sim.socket()
+		conn.bind(port)
+		conn.peer("localhost", peer_port)
+		return conn
+
+	def client():
+		conn = peer(rdt.CPORT, rdt.SPORT)
+		msg_len = conn.PAYLOAD * int(W) if is_rdt4 else rdt.PAYLOAD
+		if conn.send(str(size).encode("ascii")) < 0:
+			return None
+		start = sim.now
+		for i in range(0, size, msg_len):
+			if conn.send(data[i:i+msg_len]) < 0:
+				return None
+		if is_rdt4 and conn.flush() < 0:
+			return None
+		lapsed = sim.now - start
+		conn.close()
+		return (lapsed, conn)
+
+	def server():
+		conn = peer(rdt.SPORT, rdt.CPORT)
+		msg_len = conn.PAYLOAD * int(W) if is_rdt4 else rdt.PAYLOAD
+		rmsg = conn.recv(msg_len)
+		if rmsg == b'':
+			return None
+		filelength = int(rmsg)
+		received = []
+		total = 0
+		while total < filelength:
+			rmsg = conn.recv(msg_len)
+			if rmsg == b'':
+				return None
+			received.append(rmsg)
+			total += len(rmsg)
+		conn.close()
+		return b''.join(received)
+
+	cproc = sim.spawn("client", client)
+	sproc = sim.spawn("server", server)
+	sim.run([rdt], until)
+	for proc in (cproc, sproc):
+		if proc.error is not None:
+			raise proc.error
+	result = {"elapsed": None, "identical": sproc.result == data, "datagrams": sim.sent, "end": sim.now, "stats": None}
+	if cproc.result is not None:
+		(result["elapsed"], conn) = cproc.result
+		if is_rdt4:
+			result["stats"] = conn.stats()
+	return result
+
+
+def main():
+	if len(sys.argv) < 6:
+		print("Usage:  "+sys.argv[0]+"  <rdt3|rdt4>  <file size in KB>  <drop rate>  <error rate>  <Window size>  [GBN|SR]  [SACK]  [DELACK=<k>]  [DUPACK=<n>]  [AIMD]  [PAYLOAD=<bytes>]  [ADAPT[=<min bytes>]]  [RTOMIN=<ms>]  [RTOMAX=<ms>]  [NETEM=<key>=<value>,...]")
+		sys.exit(0)
+	if sys.argv[1] == "rdt3":
+		#rdt3 lives in Part2
+		sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Part2"))
+		import rdt3 as rdt
+	else:
+		import rdt4 as rdt
+	size = int(float(sys.argv[2]) * 1000)
+
+	options = {}
+	spec = None
+	for arg in sys.argv[6:]:
+		opt = arg.upper()
+		if opt in ("GBN", "SR"):
+			options["mode"] = opt
+		elif opt == "SACK":
+			options["sack"] = True
+		elif opt.startswith("DELACK"):
+			options["ack_every"] = int(opt[7:]) if opt[6:7] == "=" else 2
+		elif opt.startswith("DUPACK="):
+			options["dup_acks"] = int(opt[7:])
+		elif opt == "AIMD":
+			options["cc"] = True
+		elif opt.startswith("PAYLOAD="):
+			options["payload"] = None if opt[8:] == "MAX" else int(opt[8:])
+		elif opt.startswith("ADAPT"):
+			options["adapt"] = True
+			if opt[5:6] == "=":
+				options["segment_min"] = int(opt[6:])
+		elif opt.startswith("RTOMIN="):
+			options["rto_min"] = float(opt[7:]) / 1000
+		elif opt.startswith("RTOMAX="):
+			options["rto_max"] = float(opt[7:]) / 1000
+		elif opt.startswith("NETEM="):
+			spec = arg[6:]
+	logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+	wall = time.monotonic()
+	cpu = time.process_time()
+	result = sim_transfer(rdt, size, float(sys.argv[3]), float(sys.argv[4]), int(sys.argv[5]), options, spec)
+	wall = time.monotonic() - wall
+	cpu = time.process_time() - cpu
+	if result["elapsed"] is None:
+		print("The transfer failed")
+		sys.exit(1)
+	print("Simulated time: %.3f s\tThroughtput: %.2f KB/s\tFile identical: %s" % (result["elapsed"], size/result["elapsed"]/1000.0 if result["elapsed"] else 0.0, result["identical"]))
+	print("Datagrams sent: %d" % result["datagrams"])
+	stats = result["stats"]
+	if stats is not None:
+		print("Retransmissions: %d (%d on timeout, %d fast)\tCorrupted packets dropped: %d" % (stats["retransmits"], stats["retransmits_timeout"], stats["retransmits_fast"], stats["corrupted"]))
+		if stats["segment_ratio"] is not None:
+			print("Segment size: %d bytes after %d changes\tRetransmitted in the last epoch: %.2f%%" % (stats["segment"], stats["segment_changes"], stats["segment_ratio"]*100))
+	print("Wall clock time: %.3f s\tCPU time: %.3f s" % (wall, cpu))
+
+
+if __name__ == "__main__":
+	main()
@@ -8,17 +8,25 @@ This is for testing of the RDT4.0 layer.
 import sys
 import os
 import time
+import logging
 import rdt4 as rdt
+import netem
+
+def abort(sockfd):
+	"""Leave on an error of the RDT layer, writing out its recent events
+	first if they are traced (TRACE option)
+	"""
+	rdt.rdt_trace_dump(sockfd)
+	sys.exit(0)
 
 def main():
 
 	#Check the number of input arguments
-	if len(sys.argv) != 6:
-		print("Usage:  "+sys.argv[0]+"  <server IP>  <filename>  <drop rate>  <error rate>  <Window size>")
+	if len(sys.argv) < 6:
+		print("Usage:  "+sys.argv[0]+"  <server IP>  <filename>  <drop rate>  <error rate>  <Window size>  [GBN|SR]  [SACK]  [DELACK=<k>]  [DUPACK=<n>]  [AIMD]  [THREAD]  [BATCH]  [LOG=<level>]  [TRACE[=<n>]]  [STATS=<file>]  [NETEM=<key>=<value>,...]  [PAYLOAD=<bytes>]  [PROBE]  [ADAPT[=<min bytes>]]  [RTOMIN=<ms>]  [RTOMAX=<ms>]  [CPORT=<port>]  [CWND=<file>]")
 		sys.exit(0)
 	#Get the filename
 	filename = sys.argv[2]
-	MSG_LEN = rdt.PAYLOAD * int(sys.argv[5])	#define the max message length
 
 	#open file
 	try:
@@ -33,37 +41,99 @@ def main():
 	print("File bytes are ",filelength)
 
 	#set up the RDT simulation
-	rdt.rdt_network_init(sys.argv[3], sys.argv[4], sys.argv[5])
+	options = [opt.upper() for opt in sys.argv[6:]]
+	mode = "SR" if "SR" in options else "GBN"
+	ack_every = 1
+	dup_acks = 3
+	level = "WARNING"	#of the messages of the RDT layer, errors only by default
+	trace = 0
+	stats_file = None
+	spec = None
+	payload = rdt.PAYLOAD
+	segment_min = None
+	rto_min = rdt.RTO_MIN
+	rto_max = rdt.RTO_MAX
+	cport = rdt.CPORT
+	cwnd_file = None
+	for (opt, arg) in zip(options, sys.argv[6:]):
+		if opt.startswith("DELACK"):
+			ack_every = int(opt[7:]) if opt[6:7] == "=" else 2
+		elif opt.startswith("DUPACK="):
+			dup_acks = int(opt[7:])
+		elif opt.startswith("LOG="):
+			level = opt[4:]
+		elif opt.startswith("TRACE"):
+			#keep the recent protocol events, written out on an error
+			trace = int(opt[6:]) if opt[5:6] == "=" else rdt.TRACE_EVENTS
+		elif opt.startswith("STATS="):
+			#export the counters in the Prometheus text format, as given
+			stats_file = arg[6:]
+		elif opt.startswith("NETEM="):
+			#e.g. NETEM=seed=1,delay=20,burst=0.01/0.3, see netem.netem_parse()
+			spec = arg[6:]
+		elif opt.startswith("PAYLOAD="):
+			#bytes per packet, e.g. 8972 on a 9000-MTU LAN; MAX for the largest
+			payload = None if opt[8:] == "MAX" else int(opt[8:])
+		elif opt.startswith("ADAPT"):
+			#adapt the segment size to the link, down to the given size
+			segment_min = int(opt[6:]) if opt[5:6] == "=" else rdt.SEGMENT_MIN
+		elif opt.startswith("RTOMIN="):
+			#bounds of the retransmission timeout, in milliseconds
+			rto_min = float(opt[7:]) / 1000
+		elif opt.startswith("RTOMAX="):
+			rto_max = float(opt[7:]) / 1000
+		elif opt.startswith("CPORT="):
+			#0 for any free port, e.g. to run many clients of a MULTI server
+			cport = int(opt[6:])
+		elif opt.startswith("CWND="):
+			#write the congestion window trace of AIMD to a CSV file, as given
+			cwnd_file = arg[5:]
+	logging.basicConfig(level=getattr(logging, level, logging.WARNING), format="%(message)s")
+	emulator = None
+	if spec is not None:
+		emulator = netem.netem_parse(spec, float(sys.argv[3]), float(sys.argv[4]), "client")
+		if emulator is None:
+			sys.exit(0)
+	rdt.rdt_network_init(sys.argv[3], sys.argv[4], sys.argv[5], mode, sack=("SACK" in options), ack_every=ack_every, dup_acks=dup_acks, cc=("AIMD" in options), batch=("BATCH" in options), emulator=emulator, payload=payload, probe=("PROBE" in options), adapt=(segment_min is not None), segment_min=segment_min or rdt.SEGMENT_MIN, rto_min=rto_min, rto_max=rto_max)
 
 	#create RDT socket
 	sockfd = rdt.rdt_socket()
 	if sockfd == None:
 		sys.exit(0)
+	if trace:
+		rdt.rdt_trace_start(sockfd, trace)
+	if stats_file is not None and rdt.rdt_stats_export(sockfd, stats_file) == -1:
+		sys.exit(0)
 
     #specify my own IP address & port number
     #if I do not specify, others can not send things to me.
-	if rdt.rdt_bind(sockfd, rdt.CPORT) == -1:
+	if rdt.rdt_bind(sockfd, cport) == -1:
 		sys.exit(0)
 
 	#specify the IP address & port number of remote peer
 	if rdt.rdt_peer(sys.argv[1], rdt.SPORT) == -1:
 		sys.exit(0)
+	MSG_LEN = rdt.default_conn.PAYLOAD * int(sys.argv[5])	#define the max message length
+
+	#run the protocol in an I/O thread, overlapping it with the file I/O
+	if "THREAD" in options and rdt.rdt_start_io(sockfd) == -1:
+		sys.exit(0)
 
 	#implement a simple handshaking protocol at the application layer
 	#first send the size of the file to server
 	osize = rdt.rdt_send(sockfd, str(filelength).encode("ascii"))
 	if osize < 0:
 		print("Cannot send message1")
-		sys.exit(0)
+		abort(sockfd)
 	#then send the filename to server
 	osize = rdt.rdt_send(sockfd, filename.encode("ascii"))
 	if osize < 0:
 		print("Cannot send message2")
-		sys.exit(0)
+		abort(sockfd)
 	#now wait for server response
 	rmsg = rdt.rdt_recv(sockfd, MSG_LEN)
 	if rmsg == b'':
-		sys.exit(0)
+		abort(sockfd)
 	elif rmsg == b'ERROR':
 		print("Server experienced file creation error.\nProgram terminated.")
 		sys.exit(0)
@@ -84,12 +154,32 @@ def main():
 			sent += osize
 		else:
 			print("Experienced sending error! Has sent",sent,"bytes of message so far.")
-			sys.exit(0)
+			abort(sockfd)
+	#rdt_send() returns before the last window is acknowledged
+	if rdt.rdt_flush(sockfd) < 0:
+		print("Experienced sending error while waiting for the last ACKs")
+		abort(sockfd)
 
 	endtime = time.monotonic()	#record end time
 	print("Completed the file transfer.")
 	lapsed = endtime - starttime
 	print("Total elapse time: %.3f s\tThroughtput: %.2f KB/s" % (lapsed, filelength/lapsed/1000.0))
+	stats = rdt.rdt_stats(sockfd)
+	print("Retransmissions: %d (%d on timeout, %d fast)\tCorrupted packets dropped: %d" % (stats["retransmits"], stats["retransmits_timeout"], stats["retransmits_fast"], stats["corrupted"]))
+	if stats["rtt_min"] is not None:
+		print("RTT min/avg/p99: %.3f/%.3f/%.3f ms\tGoodput: %.2f KB/s" % (stats["rtt_min"]*1000, stats["rtt_avg"]*1000, stats["rtt_p99"]*1000, stats["goodput"]/1000.0))
+	if stats["segment_ratio"] is not None:
+		print("Segment size: %d bytes after %d changes\tRetransmitted in the last epoch: %.2f%%" % (stats["segment"], stats["segment_changes"], stats["segment_ratio"]*100))
+	if cwnd_file is not None and rdt.default_conn.cwnd_trace:
+		#keep the congestion window trace for plotting
+		try:
+			with open(cwnd_file, "w") as tobj:
+				tobj.write("time,cwnd,ssthresh\n")
+				for (t, cwnd, ssthresh) in rdt.default_conn.cwnd_trace:
+					tobj.write("%.6f,%.3f,%d\n" % (t, cwnd, ssthresh))
+			print("Congestion window trace of",len(rdt.default_conn.cwnd_trace),"changes written to",cwnd_file)
+		except OSError as emsg:
+			print("Write trace error: ", emsg)
 
 	#Closing
 	fobj.close()
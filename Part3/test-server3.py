@@ -7,17 +7,67 @@ This is for testing of the RDT4.0 layer.
 
 import sys
 import os
+import logging
 import rdt4 as rdt
+import netem
+
+def abort(sockfd):
+	"""Leave on an error of the RDT layer, writing out its recent events
+	first if they are traced (TRACE option)
+	"""
+	rdt.rdt_trace_dump(sockfd)
+	sys.exit(0)
+
+def serve_uploads(sockfd, MSG_LEN, count):
+	"""Take file uploads from many clients at once over the listening RDT
+	socket, with the same handshaking as a single client, until count of
+	them have completed (0 for no limit)
+	"""
+	uploads = {}	#state of the upload of each client, keyed by its session
+	done = 0
+	while count == 0 or done < count:
+		(rmsg, session) = rdt.rdt_recvfrom(sockfd, MSG_LEN)
+		if session is None:
+			print("Encountered receive error! Completed",done,"uploads so far.")
+			abort(sockfd)
+		upload = uploads.get(session)
+		if upload is None:
+			#1st message: the size of the file
+			upload = {"filelength": int(rmsg), "fobj": None, "received": 0}
+			uploads[session] = upload
+			print("Received client request from",session.peer_addr(),": file size =",upload["filelength"])
+		elif upload["fobj"] is None:
+			#2nd message: the name of the file
+			filename = "./Store/"+rmsg.decode("ascii")
+			try:
+				upload["fobj"] = open(filename, 'wb')
+			except OSError as emsg:
+				print("Open file error: ", emsg)
+				session.send(b'ERROR')
+				session.close()
+				del uploads[session]
+				continue
+			print("Open file",filename,"for writing successfully")
+			if session.send(b'OKAY') < 0:
+				print("Cannot send response message")
+				abort(sockfd)
+		else:
+			upload["received"] += upload["fobj"].write(rmsg)
+
+		if upload["fobj"] is not None and upload["received"] >= upload["filelength"]:
+			upload["fobj"].close()
+			session.close()
+			del uploads[session]
+			done += 1
+			print("Completed the file transfer from",session.peer_addr())
 
 def main():
 
 	#Check the number of input arguments
-	if len(sys.argv) != 5:
-		print("Usage:  "+sys.argv[0]+"  <client IP>  <drop rate>  <error rate>  <Window size>")
+	if len(sys.argv) < 5:
+		print("Usage:  "+sys.argv[0]+"  <client IP>  <drop rate>  <error rate>  <Window size>  [GBN|SR]  [SACK]  [DELACK=<k>]  [DUPACK=<n>]  [AIMD]  [THREAD]  [BATCH]  [LOG=<level>]  [TRACE[=<n>]]  [STATS=<file>]  [NETEM=<key>=<value>,...]  [PAYLOAD=<bytes>]  [PROBE]  [ADAPT[=<min bytes>]]  [RTOMIN=<ms>]  [RTOMAX=<ms>]  [MULTI[=<n>]]")
 		sys.exit(0)
 
-	MSG_LEN = rdt.PAYLOAD * int(sys.argv[4])	#define the max message length
-
 	#check whether the folder exists
 	try:
 		os.stat("./Store")
@@ -27,34 +77,100 @@ def main():
 		sys.exit(0)
 
 	#set up the RDT simulation
-	rdt.rdt_network_init(sys.argv[2], sys.argv[3], sys.argv[4])
+	options = [opt.upper() for opt in sys.argv[5:]]
+	mode = "SR" if "SR" in options else "GBN"
+	ack_every = 1
+	dup_acks = 3
+	level = "WARNING"	#of the messages of the RDT layer, errors only by default
+	trace = 0
+	stats_file = None
+	spec = None
+	payload = rdt.PAYLOAD
+	segment_min = None
+	rto_min = rdt.RTO_MIN
+	rto_max = rdt.RTO_MAX
+	multi = None
+	for (opt, arg) in zip(options, sys.argv[5:]):
+		if opt.startswith("DELACK"):
+			ack_every = int(opt[7:]) if opt[6:7] == "=" else 2
+		elif opt.startswith("DUPACK="):
+			dup_acks = int(opt[7:])
+		elif opt.startswith("LOG="):
+			level = opt[4:]
+		elif opt.startswith("TRACE"):
+			#keep the recent protocol events, written out on an error
+			trace = int(opt[6:]) if opt[5:6] == "=" else rdt.TRACE_EVENTS
+		elif opt.startswith("STATS="):
+			#export the counters in the Prometheus text format, as given
+			stats_file = arg[6:]
+		elif opt.startswith("NETEM="):
+			#e.g. NETEM=seed=1,delay=20,burst=0.01/0.3, see netem.netem_parse()
+			spec = arg[6:]
+		elif opt.startswith("PAYLOAD="):
+			#bytes per packet, e.g. 8972 on a 9000-MTU LAN; MAX for the largest
+			payload = None if opt[8:] == "MAX" else int(opt[8:])
+		elif opt.startswith("ADAPT"):
+			#adapt the segment size to the link, down to the given size
+			segment_min = int(opt[6:]) if opt[5:6] == "=" else rdt.SEGMENT_MIN
+		elif opt.startswith("RTOMIN="):
+			#bounds of the retransmission timeout, in milliseconds
+			rto_min = float(opt[7:]) / 1000
+		elif opt.startswith("RTOMAX="):
+			rto_max = float(opt[7:]) / 1000
+		elif opt.startswith("MULTI"):
+			multi = int(opt[6:]) if opt[5:6] == "=" else 0
+	logging.basicConfig(level=getattr(logging, level, logging.WARNING), format="%(message)s")
+	emulator = None
+	if spec is not None:
+		emulator = netem.netem_parse(spec, float(sys.argv[2]), float(sys.argv[3]), "server")
+		if emulator is None:
+			sys.exit(0)
+	rdt.rdt_network_init(sys.argv[2], sys.argv[3], sys.argv[4], mode, sack=("SACK" in options), ack_every=ack_every, dup_acks=dup_acks, cc=("AIMD" in options), batch=("BATCH" in options), emulator=emulator, payload=payload, probe=("PROBE" in options), adapt=(segment_min is not None), segment_min=segment_min or rdt.SEGMENT_MIN, rto_min=rto_min, rto_max=rto_max)
+	MSG_LEN = rdt.default_conn.PAYLOAD * int(sys.argv[4])	#define the max message length
 
 	#create RDT socket
 	sockfd = rdt.rdt_socket()
 	if sockfd == None:
 		sys.exit(0)
+	if trace:
+		rdt.rdt_trace_start(sockfd, trace)
+	if stats_file is not None and rdt.rdt_stats_export(sockfd, stats_file) == -1:
+		sys.exit(0)
 
     #specify my own IP address & port number
     #if I do not specify, others can not send things to me.
 	if rdt.rdt_bind(sockfd, rdt.SPORT) == -1:
 		sys.exit(0)
 
+	#serve any number of clients at once, each one from its own address
+	if multi is not None:
+		if rdt.rdt_listen(sockfd) == -1:
+			sys.exit(0)
+		serve_uploads(sockfd, MSG_LEN, multi)
+		rdt.rdt_close(sockfd)
+		print("Server program terminated")
+		sys.exit(0)
+
 	#specify the IP address & port number of remote peer
 	if rdt.rdt_peer(sys.argv[1], rdt.CPORT) == -1:
 		sys.exit(0)
 
+	#run the protocol in an I/O thread, overlapping it with the file I/O
+	if "THREAD" in options and rdt.rdt_start_io(sockfd) == -1:
+		sys.exit(0)
+
 	#implement a simple handshaking protocol at the application layer
 	#First wait for client 1st message
 	rmsg = rdt.rdt_recv(sockfd, MSG_LEN)
 	if rmsg == b'':
-		sys.exit(0)
+		abort(sockfd)
 	else:
 		filelength = int(rmsg)
 		print("Received client request: file size =",filelength)
 	#then wait for client 2nd message
 	rmsg = rdt.rdt_recv(sockfd, MSG_LEN)
 	if rmsg == b'':
-		sys.exit(0)
+		abort(sockfd)
 	else:
 		filename = "./Store/"+rmsg.decode("ascii")
 		#open file
@@ -67,7 +183,7 @@ def main():
 			osize = rdt.rdt_send(sockfd, b'OKAY')
 			if osize < 0:
 				print("Cannot send response message")
-				sys.exit(0)
+				abort(sockfd)
 		else:
 			print("Cannot open the target file",filename,"for writing")
 			osize = rdt.rdt_send(sockfd, b'ERROR')
@@ -80,7 +196,7 @@ def main():
 		rmsg = rdt.rdt_recv(sockfd, MSG_LEN)
 		if rmsg == b'':
 			print("Encountered receive error! Has received",received,"so far.")
-			sys.exit(0)
+			abort(sockfd)
 		else:
 			wsize = fobj.write(rmsg)
 			received += wsize
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+"""CPU cost of the rdt4 file transfer with and without delayed ACKs
+
+It runs test-server3.py and test-client3.py on loopback for each ACK
+setting, checks that the stored file is identical to the one sent, and
+reports the user + system CPU time of both processes per MB of file
+together with the elapsed time of the whole transfer.
+
+Usage: python3 bench-delack.py [<file size in MB>] [<Window size>] [<ACK every k>...]
+"""
+
+import os
+import sys
+import time
+import resource
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PART3 = os.path.join(HERE, "..", "Part3")
+
+def cpu_children():
+	"""Return the user + system CPU time used by the waited-for children"""
+	usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return usage.ru_utime + usage.ru_stime
+
+def transfer(workdir, filename, W, ack_every):
+	"""Run one loopback transfer, return (CPU seconds, elapsed seconds)"""
+	option = "DELACK=%d" % ack_every
+	server = [sys.executable, os.path.join(PART3, "test-server3.py"), "localhost", "0", "0", str(W), option]
+	client = [sys.executable, os.path.join(PART3, "test-client3.py"), "localhost", filename, "0", "0", str(W), option]
+
+	before = cpu_children()
+	starttime = time.monotonic()
+	#rdt4 logs errors only, do not let a terminal slow down the rest
+	srv = subprocess.Popen(server, cwd=workdir, stdout=subprocess.DEVNULL)
+	time.sleep(0.5)
+	cli = subprocess.Popen(client, cwd=workdir, stdout=subprocess.DEVNULL)
+	cli.wait()
+	srv.wait()
+	lapsed = time.monotonic() - starttime - 0.5
+	return (cpu_children() - before, lapsed)
+
+def main():
+	size = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+	W = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+	settings = [int(k) for k in sys.argv[3:]] or [1, 2, 4, 8]
+
+	with tempfile.TemporaryDirectory() as workdir:
+		os.mkdir(os.path.join(workdir, "Store"))
+		filename = "bench.bin"
+		data = os.urandom(int(size * 1000000))
+		with open(os.path.join(workdir, filename), "wb") as fobj:
+			fobj.write(data)
+
+		print("File size = %.1f MB, W = %d, loopback, no loss" % (size, W))
+		print("%-12s %14s %12s" % ("ACK every", "CPU ms/MB", "elapsed s"))
+		base = None
+		for k in settings:
+			(cpu, lapsed) = transfer(workdir, filename, W, k)
+			with open(os.path.join(workdir, "Store", filename), "rb") as fobj:
+				if fobj.read() != data:
+					print("MISMATCH: stored file differs with ACK every", k)
+					sys.exit(1)
+			per_mb = cpu / size * 1000
+			if base is None:
+				base = per_mb
+			print("%-12d %14.1f %12.3f   (%.2fx)" % (k, per_mb, lapsed, base / per_mb))
+
+
+if __name__ == "__main__":
+	main()
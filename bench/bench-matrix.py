@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+"""Throughput benchmark matrix of the rdt1, rdt3 and rdt4 file transfers
+
+For each combination of protocol, drop rate, error rate, Window size and
+file size it runs the test server and client of that Part on loopback,
+checks that the stored file is identical to the one sent, and records the
+elapsed time and throughput printed by the client, the retransmissions it
+reports, and the user + system CPU time of both processes.
+
+rdt1 assumes a reliable channel, so it only runs without drops and errors,
+and neither rdt1 nor rdt3 has a window, so they run once for all W.
+Every run is written to the CSV and/or JSON file given, and a summary
+table with the mean of the repeats of each combination is printed.
+
+Usage: python3 bench-matrix.py [PROTO=rdt1,rdt3,rdt4] [DROP=<rates>] [ERR=<rates>]
+       [W=<sizes>] [SIZE=<MB>,...] [OPTS="<rdt4 options>"] [REPEAT=<n>]
+       [CSV=<file>] [JSON=<file>]
+e.g.   python3 bench-matrix.py DROP=0,0.05 ERR=0,0.05 W=10,50 SIZE=1 OPTS="SR SACK" CSV=base.csv
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import resource
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+#the directory and the no. of the test programs of each protocol
+PARTS = {"rdt1": ("Part 1", 1), "rdt3": ("Part2", 2), "rdt4": ("Part3", 3)}
+RUN_LIMIT = 600		#seconds before a stuck transfer is killed
+FIELDS = ["protocol", "drop", "err", "W", "size_mb", "options", "run", "ok", "elapsed", "throughput_kbs", "retransmits", "cpu"]
+
+def cpu_children():
+	"""Return the user + system CPU time used by the waited-for children"""
+	usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return usage.ru_utime + usage.ru_stime
+
+def commands(proto, filename, drop, err, W, options):
+	"""Return the (server, client) command lines of one transfer"""
+	(part, n) = PARTS[proto]
+	part = os.path.join(HERE, "..", part)
+	server = [sys.executable, os.path.join(part, "test-server%d.py" % n), "localhost"]
+	client = [sys.executable, os.path.join(part, "test-client%d.py" % n), "localhost", filename]
+	if proto != "rdt1":
+		server += [str(drop), str(err)]
+		client += [str(drop), str(err)]
+	if proto == "rdt4":
+		server += [str(W)] + options
+		client += [str(W)] + options
+	return (server, client)
+
+def transfer(workdir, proto, filename, drop, err, W, options):
+	"""Run one loopback transfer
+
+	Return  -> dict of the results, with ok False if it failed
+	"""
+	(server, client) = commands(proto, filename, drop, err, W, options)
+	result = {"ok": False, "elapsed": None, "throughput_kbs": None, "retransmits": None, "cpu": None}
+	before = cpu_children()
+	srv = subprocess.Popen(server, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	time.sleep(0.5)
+	cli = subprocess.Popen(client, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+	try:
+		(output, dummy) = cli.communicate(timeout=RUN_LIMIT)
+		srv.wait(timeout=RUN_LIMIT)
+	except subprocess.TimeoutExpired:
+		cli.kill()
+		srv.kill()
+		cli.wait()
+		srv.wait()
+		return result
+	result["cpu"] = cpu_children() - before
+
+	match = re.search(r"Total elapse time: ([\d.]+) s\s+Throughtput: ([\d.]+) KB/s", output)
+	if match:
+		result["elapsed"] = float(match.group(1))
+		result["throughput_kbs"] = float(match.group(2))
+	match = re.search(r"Retransmissions: (\d+)", output)
+	if match:
+		result["retransmits"] = int(match.group(1))
+	elif proto == "rdt1":
+		result["retransmits"] = 0
+	try:
+		with open(os.path.join(workdir, filename), "rb") as sent, open(os.path.join(workdir, "Store", filename), "rb") as stored:
+			result["ok"] = result["elapsed"] is not None and sent.read() == stored.read()
+		os.remove(os.path.join(workdir, "Store", filename))
+	except OSError:
+		pass
+	return result
+
+def parse_list(text, conv):
+	return [conv(v) for v in text.split(",") if v != ""]
+
+def mean(values):
+	values = [v for v in values if v is not None]
+	return sum(values) / len(values) if values else None
+
+def main():
+	protocols = ["rdt1", "rdt3", "rdt4"]
+	drops = [0.0]
+	errs = [0.0]
+	windows = [10]
+	sizes = [1.0]
+	options = []
+	repeat = 1
+	csv_name = None
+	json_name = None
+	for arg in sys.argv[1:]:
+		(key, sep, value) = arg.partition("=")
+		key = key.upper()
+		if key == "PROTO":
+			protocols = parse_list(value.lower(), str)
+		elif key == "DROP":
+			drops = parse_list(value, float)
+		elif key == "ERR":
+			errs = parse_list(value, float)
+		elif key == "W":
+			windows = parse_list(value, int)
+		elif key == "SIZE":
+			sizes = parse_list(value, float)
+		elif key == "OPTS":
+			options = value.split()
+		elif key == "REPEAT":
+			repeat = int(value)
+		elif key == "CSV":
+			csv_name = os.path.abspath(value)
+		elif key == "JSON":
+			json_name = os.path.abspath(value)
+		else:
+			print(__doc__)
+			sys.exit(0)
+	for proto in protocols:
+		if proto not in PARTS:
+			print("Unknown protocol", proto)
+			sys.exit(0)
+
+	#the combinations to run, without the ones a protocol ignores
+	matrix = []
+	for proto in protocols:
+		for size in sizes:
+			for drop in drops:
+				for err in errs:
+					if proto == "rdt1" and (drop or err):
+						continue
+					for W in windows if proto == "rdt4" else [None]:
+						matrix.append((proto, drop, err, W, size))
+
+	records = []
+	print("%-6s %6s %6s %5s %7s %10s %12s %10s %8s %6s" % ("proto", "drop", "err", "W", "MB", "elapsed s", "KB/s", "retrans", "CPU s", "ok"))
+	with tempfile.TemporaryDirectory() as workdir:
+		os.mkdir(os.path.join(workdir, "Store"))
+		for (proto, drop, err, W, size) in matrix:
+			filename = "bench-%g.bin" % size
+			if not os.path.exists(os.path.join(workdir, filename)):
+				with open(os.path.join(workdir, filename), "wb") as fobj:
+					fobj.write(os.urandom(int(size * 1000000)))
+			runs = []
+			for i in range(repeat):
+				result = transfer(workdir, proto, filename, drop, err, W, options)
+				record = {"protocol": proto, "drop": drop, "err": err, "W": W, "size_mb": size,
+					"options": " ".join(options) if proto == "rdt4" else "", "run": i + 1}
+				record.update(result)
+				runs.append(record)
+			records += runs
+			ok = sum(r["ok"] for r in runs)
+			print("%-6s %6g %6g %5s %7g %10s %12s %10s %8s %3d/%-2d" % (proto, drop, err, "-" if W is None else W, size,
+				"%.3f" % mean([r["elapsed"] for r in runs]) if ok else "-",
+				"%.2f" % mean([r["throughput_kbs"] for r in runs]) if ok else "-",
+				"%.1f" % mean([r["retransmits"] for r in runs]) if ok else "-",
+				"%.2f" % mean([r["cpu"] for r in runs]) if ok else "-", ok, repeat))
+			sys.stdout.flush()
+
+	if csv_name is not None:
+		with open(csv_name, "w", newline="") as fobj:
+			writer = csv.DictWriter(fobj, fieldnames=FIELDS)
+			writer.writeheader()
+			writer.writerows(records)
+		print("Results of", len(records), "runs written to", csv_name)
+	if json_name is not None:
+		with open(json_name, "w") as fobj:
+			json.dump(records, fobj, indent=1)
+		print("Results of", len(records), "runs written to", json_name)
+
+
+if __name__ == "__main__":
+	main()